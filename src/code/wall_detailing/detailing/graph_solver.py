@@ -0,0 +1,158 @@
+import itertools
+import time
+
+from typing import List, Dict, Tuple, Callable
+import numpy as np
+
+from detailing.solver import Solver, SolverResult
+from detailing.solver_model import SolverModel
+from masonry.corner_rep import Corns, Corn
+from masonry.bond.abstract_bond import Bond
+
+
+class Factor:
+    """
+    Holes of one or more layers as a table over the choices of some variables,
+    table[i, j, ...] are the holes if variables[0] is set to i, variables[1] to j, ...
+    """
+    __slots__ = ["variables", "table"]
+
+    def __init__(self, variables: Tuple[int], table: np.array):
+        self.variables = variables
+        self.table = table
+
+
+class GraphSolver(Solver):
+    """
+    This solver models the detailing problem as a graph: walls are edges with a plan offset to choose,
+    corners are nodes with a corner plan offset to choose.
+    Corners on top of each other with the same walls just continue the plan of the corner below (like in
+    LayeredSolver.solve_layer), so every such stack of corners is one node.
+    Every layer adds the holes its corners leave in it (a factor over its wall and the stacks of its corners).
+    The minimum of the sum of all factors is found by dynamic programming, eliminating one variable after another:
+    chains and trees are solved from their leaves to their root, a cycle is cut open by its first elimination,
+    which only enumerates the choices of the two neighbours of the eliminated variable.
+    """
+    debug = False
+
+    def __init__(self, corners: Corns, bond: Bond):
+        super(GraphSolver, self).__init__(corners, bond)
+
+    def get_all_corners_of_wall(self, wall_id: int, bottom_only: bool = False) -> List[Corn]:
+        """
+        :param wall_id: id of a wall (WallLayerGroup)
+        :param bottom_only: only return the lowest corner of each stack of corners
+        :return: all corners that have a layer in given wall
+        """
+        ret = []
+        for corner in self.corners.corners:
+            if any(layer.parent.id == wall_id for layer in corner.layers):
+                if not bottom_only or self.corners.get_bottom_corner(corner) is None:
+                    ret.append(corner)
+        return ret
+
+    def get_factors(self, model: SolverModel, root: List[int],
+                    depth: List[int]) -> Tuple[Dict[int, int], List[Factor]]:
+        """
+        variable w is the plan offset of wall w, variable len(model.walls) + c the plan offset of the stack of corner c
+        :param model: the model we are solving
+        :param root: see SolverModel.stacks
+        :param depth: see SolverModel.stacks
+        :return: the number of choices of each variable and one factor for each layer that has corners
+        """
+        domains: Dict[int, int] = {}
+        factors: List[Factor] = []
+        for l, corners in enumerate(model.corners_of_layer):
+            if len(corners) == 0:
+                continue
+            wall = int(model.layer_wall[l])
+            stacks = sorted(set(len(model.walls) + root[c] for c in corners))
+            variables = tuple([wall] + stacks)
+            domains[wall] = self.bond.repeat_layer
+            for s in stacks:
+                domains[s] = self.bond.get_corner_plan_repeat_step()
+
+            table = np.zeros([domains[v] for v in variables], dtype=float)
+            for choice in itertools.product(*[range(domains[v]) for v in variables]):
+                offsets = [choice[variables.index(len(model.walls) + root[c])] + depth[c] for c in corners]
+                table[choice] = model.holes_of_layer(l, corners, choice[0], offsets)
+            factors.append(Factor(variables, table))
+        return domains, factors
+
+    def eliminate(self, domains: Dict[int, int], factors: List[Factor]) -> Dict[int, int]:
+        """
+        finds the choices with the least holes, by eliminating the variable with the fewest neighbours first
+        (on ties the smallest choice wins)
+        :param domains: number of choices of each variable
+        :param factors: see get_factors
+        :return: the best choice for each variable
+        """
+        neighbours: Dict[int, set] = {v: set() for v in domains}
+        for f in factors:
+            for v in f.variables:
+                neighbours[v].update(f.variables)
+                neighbours[v].discard(v)
+
+        def expand(f: Factor, variables: Tuple[int]) -> np.array:
+            # f.table with one axis for each of variables, broadcastable to all of them
+            order = sorted(range(len(f.variables)), key=lambda i: variables.index(f.variables[i]))
+            return np.transpose(f.table, order).reshape([domains[v] if v in f.variables else 1 for v in variables])
+
+        eliminated: List[Tuple[int, Tuple[int], np.array]] = []
+        remaining = dict(neighbours)
+        while len(remaining) > 0:
+            v = min(remaining, key=lambda x: (len(remaining[x]), x))
+            others = tuple(sorted(remaining.pop(v)))
+            for n in others:
+                remaining[n].discard(v)
+                remaining[n].update(o for o in others if o != n)
+
+            variables = (v,) + others
+            joint = np.zeros([domains[x] for x in variables], dtype=float)
+            rest = []
+            for f in factors:
+                if v in f.variables:
+                    joint = joint + expand(f, variables)
+                else:
+                    rest.append(f)
+            eliminated.append((v, others, np.argmin(joint, axis=0)))
+            factors = rest + [Factor(others, np.min(joint, axis=0))]
+
+        # go back through the eliminated variables to find the choices that lead to the minimum
+        ret: Dict[int, int] = {}
+        for v, others, best in reversed(eliminated):
+            ret[v] = int(best[tuple(ret[o] for o in others)])
+        return ret
+
+    def solve(self, time_budget: float = None, max_trials: int = None,
+              progress: Callable[[int, float, float], None] = None) -> SolverResult:
+        """
+        solves the detailing problem described in the thesis
+        this is fast and always finds the best solution, so time_budget and max_trials are not needed
+        :param progress: called once at the end with the number of evaluated layer choices, the holes and the time
+        :return: the holes of the solution
+        """
+        start = time.time()
+        self.freeze(self.corners)
+        model = SolverModel(self.corners, self.bond)
+        root, depth = model.stacks()
+        domains, factors = self.get_factors(model, root, depth)
+        choice = self.eliminate(domains, factors)
+        if GraphSolver.debug:
+            print("solved", len(domains), "variables with", len(factors), "factors")
+
+        for w in range(len(model.walls)):
+            if w in choice:
+                model.set_wall_plan_offset(w, choice[w])
+        for c in range(len(model.corners)):
+            model.set_corner_plan_offset(c, choice[len(model.walls) + root[c]] + depth[c])
+        for c in range(len(model.corners)):
+            model.reduce_corner_layer_length(c)
+        model.write_back()
+
+        holes = model.all_holes()
+        print("found a solution with", holes, "holes", ":)" if holes == 0 else ":(")
+        trials = sum(f.table.size for f in factors)
+        if progress is not None:
+            progress(trials, holes, time.time() - start)
+        return SolverResult(holes, True, trials, time.time() - start)
@@ -1,10 +1,15 @@
-import itertools
+import math
+import multiprocessing
+import os
+import threading
+import time
 
-from copy import deepcopy
-from typing import List
-from detailing.solver import Solver
-from detailing.wall_layer import WallLayer
-from masonry.corner_rep import Corns, Corn
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Tuple, Optional, Callable, Dict
+from detailing.solution_cache import SolutionCache
+from detailing.solver import Solver, SolverResult
+from detailing.solver_model import SolverModel
+from masonry.corner_rep import Corns
 from masonry.bond.abstract_bond import Bond
 
 
@@ -14,124 +19,130 @@ class LayeredSolver(Solver):
     It's like brute forcing the solution, with a few optimizations.
     """
     debug = False
+    tasks_per_worker = 4
 
-    def __init__(self, corners: Corns, bond: Bond):
+    def __init__(self, corners: Corns, bond: Bond, executor: Executor = None, cache: SolutionCache = None):
+        """
+        :param corners: all corners
+        :param bond: the bond to use
+        :param executor: if given, starter configurations are tried out in parallel on this executor
+        :param cache: if given, solutions are looked up there first and new optimal solutions are stored there
+        """
         super(LayeredSolver, self).__init__(corners, bond)
+        self.executor = executor
+        self.cache = cache
 
-    def fit_layer_to_corner(self, layer: WallLayer, corner: Corn):
+    def fit_layer_to_corner(self, model: SolverModel, layer: int, corner: int):
         """
         fits the layer to the corner
+        :param model: the model we are solving
         :param layer: the layer to fit
         :param corner: the corner to fit to
         """
         # if the wall the layer lies in has already been touched, we only need to adjust the corners of the layer
         # else we need to find out the best plan_offset for the parent to fit to the corner
-        if layer.parent.touched:
+        wall = model.layer_wall[layer]
+        if model.state.wall_touched[wall]:
             if LayeredSolver.debug:
-                print("set layer of wall", layer.parent.id, "to", corner, corner.plan_offset)
-            corner.reduce_layer_length(layer, self.bond)
+                print("set layer of wall", model.wall_ids[wall], "to", model.corners[corner],
+                      model.state.corner_plan_offset[corner])
+            model.reduce_layer_length(corner, layer)
         else:
             if LayeredSolver.debug:
-                print("fit layer of wall", layer.parent.id, "to", corner)
-            wall_offset = 0
+                print("fit layer of wall", model.wall_ids[wall], "to", model.corners[corner])
             result = 0
             val = 3
 
-            while wall_offset < self.bond.repeat_layer:
-                layer.parent.plan_offset = wall_offset
-                score = self.holes_between_corner_and_layer(corner, layer)
+            offsets = range(self.bond.repeat_layer)
+            for wall_offset, score in zip(offsets, model.holes_with_wall_plan_offsets(corner, layer, offsets)):
                 if score < val:
                     val = score
                     result = wall_offset
-                wall_offset += 1
-            layer.parent.set_plan_offset(result)
-            corner.reduce_layer_length(layer, self.bond)
+            model.set_wall_plan_offset(wall, result)
+            model.reduce_layer_length(corner, layer)
 
-    def fit_corner_to_layer(self, corner: Corn, layer: WallLayer):
+    def fit_corner_to_layer(self, model: SolverModel, corner: int, layer: int):
         """
         fits the corner to the layer
+        :param model: the model we are solving
         :param corner: the corner to fit
         :param layer: the layer to fit to
         """
-        if corner.touched:
+        if model.state.corner_touched[corner]:
             if LayeredSolver.debug:
-                print("not fitting", corner, "to layer of wall", layer.parent.id)
+                print("not fitting", model.corners[corner], "to layer of wall", model.wall_ids[model.layer_wall[layer]])
         else:
             if LayeredSolver.debug:
-                print("fit", corner, "to layer of wall", layer.parent.id)
-            corner_offset = 0
+                print("fit", model.corners[corner], "to layer of wall", model.wall_ids[model.layer_wall[layer]])
             result = 0
             val = 3
 
-            while corner_offset < self.bond.get_corner_plan_repeat_step():
-                corner.plan_offset = corner_offset
-                score = self.holes_between_corner_and_layer(corner, layer)
+            offsets = range(self.bond.get_corner_plan_repeat_step())
+            for corner_offset, score in zip(offsets, model.holes_with_corner_plan_offsets(corner, layer, offsets)):
                 if score <= val:
                     val = score
                     result = corner_offset
-                corner_offset += 1
-            corner.set_plan_offset(result)
-            corner.reduce_corner_layer_length(self.bond)
+            model.set_corner_plan_offset(corner, result)
+            model.reduce_corner_layer_length(corner)
 
-    def fit(self, corner: Corn, corners: Corns, done: List[Corn]):
+    def fit(self, model: SolverModel, corner: int, done: List[int]) -> List[int]:
         """
         fits the corner to all layers of the wall it lies in
+        :param model: the model we are solving
         :param corner: the corner to fit
-        :param corners: all corners
         :param done: all corners that have already been fitted
+        :return: the corners we need to look at next
         """
         todo = []
-        for layer in corner.layers:
-            if layer.parent.touched:
+        for layer in model.corner_layers[corner]:
+            if model.state.wall_touched[model.layer_wall[layer]]:
                 if LayeredSolver.debug:
-                    print("found touched layer", layer.parent.id)
-                self.fit_corner_to_layer(corner, layer)
+                    print("found touched layer", model.wall_ids[model.layer_wall[layer]])
+                self.fit_corner_to_layer(model, corner, layer)
 
-        for layer in corner.layers:
-            self.fit_layer_to_corner(layer, corner)
+        for layer in model.corner_layers[corner]:
+            self.fit_layer_to_corner(model, layer, corner)
 
-            for left in layer.left_connections:
-                c = corners.get_corner([layer, left])
+            for c in model.layer_corners[layer]:
                 if c not in done:
-                    self.fit_corner_to_layer(c, layer)
-                    todo.append(c)
-            for right in layer.right_connections:
-                c = corners.get_corner([layer, right])
-                if c not in done:
-                    self.fit_corner_to_layer(c, layer)
+                    self.fit_corner_to_layer(model, c, layer)
                     todo.append(c)
         return todo
 
-    def solve_layer(self, complete_layer: List[Corn], corners: Corns, start_index: int = 0) -> bool:
+    def solve_layer(self, model: SolverModel, complete_layer: List[int], start_index: int = 0) -> bool:
         """
         solves a layer
+        :param model: the model we are solving
         :param complete_layer: the layer to solve
-        :param corners: all corners
         :param start_index: the index of the corner to start with
         :return: True if the layer has been solved, False if not
         """
+        # same as a layer one bond period below
+        if model.replicate(complete_layer):
+            return False
+
         start = None
         ret = False
 
         for corner in complete_layer:
             # check if there are any layers below this corner
-            bottom = corners.get_bottom_corner(corner)
-            if bottom is not None:
+            bottom = model.corner_bottom[corner]
+            if bottom >= 0:
                 # compare the parent ids of the layers of the corner with the parent ids of the layers of the bottom
                 # if they are the same, we can set the plan_offset of the corner to the plan_offset of the bottom + 1
                 # else we need to find the correct plan_offset for the corner
-                par = [layer.parent.id for layer in bottom.layers]
+                par = [model.layer_wall[layer] for layer in model.corner_layers[bottom]]
                 all_found = True
-                for layer in corner.layers:
-                    if layer.parent.id not in par:
+                for layer in model.corner_layers[corner]:
+                    if model.layer_wall[layer] not in par:
                         all_found = False
                         ret = True
                 if all_found:
-                    corner.set_plan_offset(bottom.plan_offset + 1)
+                    model.set_corner_plan_offset(corner, model.state.corner_plan_offset[bottom] + 1)
                     start = corner
                 else:
                     if LayeredSolver.debug:
-                        print("nope", corner, par)
+                        print("nope", model.corners[corner], par)
 
         if start is None:
             if LayeredSolver.debug:
@@ -147,93 +158,433 @@ class LayeredSolver(Solver):
                 todo.remove(to)
                 if to not in done:
                     done.append(to)
-                    todos = self.fit(to, corners, done)
+                    todos = self.fit(model, to, done)
                     todo.extend(todos)
         return ret
 
-    def freeze(self, corners: Corns):
+    def get_complete_layers(self, model: SolverModel) -> List[List[int]]:
         """
-        "freezes" the x offsets of all layers of all walls to current values
-        "freezes" the main layers for each corner to current main layer
-        this needs to be done to prevent errors after reducing the length of the wall_layers
-        :param corners: all corners
+        :param model: the model we are solving
+        :return: all corners grouped by the layer (height in the building) they are in, sorted by z
+        """
+        ids = {id(c): i for i, c in enumerate(model.corners)}
+        return [[ids[id(self.corners.corners[c])] for c in course] for course in self.corners.get_courses()]
+
+    def apply_config(self, model: SolverModel, layers: List[List[int]], config: Tuple[int]):
+        """
+        solves all layers starting with the given starter corner indices
+        :param model: the model we are solving
+        :param layers: all corners grouped by layer (see get_complete_layers)
+        :param config: index of the starter corner for each layer that needs one
+        """
+        index = 0
+        for layer in layers:
+            new_corner = self.solve_layer(model, layer, start_index=config[index])
+            if new_corner and index < len(config) - 1:
+                index += 1
+
+    def search(self, model: SolverModel, layers: List[List[int]], starter_layers: List[bool],
+               config: Tuple[int], score: float, executor: Executor = None,
+               budget: 'SearchBudget' = None, stop_at_zero: bool = True) -> Tuple[Tuple[int], float]:
+        """
+        branch and bound search over the starter configurations (see search_configurations)
+        :param model: the model we are solving, in the state right before solving the first layer
+        :param layers: all corners grouped by layer (see get_complete_layers)
+        :param starter_layers: whether each layer needs a starter corner
+        :param config: the best configuration known so far
+        :param score: the holes of config
+        :param executor: if given, the configurations are split into tasks that run on this executor
+        :param budget: when to give up and return the best configuration found so far
+        :param stop_at_zero: whether to stop at the first configuration without holes
+        :return: the best configuration and its holes
+        (the last one found with the lowest holes or the first one found with no holes at all if stop_at_zero)
+        """
+        if executor is None:
+            result = self.search_configurations(model, layers, starter_layers, score,
+                                                SearchBound(score, stop_at_zero=stop_at_zero), budget)
+        else:
+            result = self.parallel_search(model, layers, starter_layers, score, executor, budget, stop_at_zero)
+        return (tuple(config), score) if result is None else result
+
+    def search_configurations(self, model: SolverModel, layers: List[List[int]], starter_layers: List[bool],
+                              score: float, bound: 'SearchBound', budget: 'SearchBudget' = None,
+                              prefix: Tuple[int] = tuple(), task: int = 0) -> Optional[Tuple[Tuple[int], float]]:
+        """
+        the layers are solved one after another, trying the starter corners of each layer from the highest index to
+        the lowest one (same order as going through itertools.product(*starters) in reverse).
+        Once a layer is solved the holes of its corners do not change anymore, so a branch can be dropped as soon as
+        the holes of its solved layers are more than the best complete configuration found so far
+        :param model: the model we are solving, in the state right before solving the first layer
+        :param layers: all corners grouped by layer (see get_complete_layers)
+        :param starter_layers: whether each layer needs a starter corner
+        :param score: configurations with more holes than this are not interesting
+        :param bound: best score found so far by all tasks of this search
+        :param budget: when to give up and return the best configuration found so far
+        :param prefix: only search the configurations starting with these starter indices
+        :param task: index of this task, tasks with a lower index come first in the search order
+        :return: the best configuration found and its holes, None if there is no configuration with <= score holes
+        """
+        best = [None, score]
+        corners = [c for layer in layers for c in layer]
+        if budget is None:
+            budget = SearchBudget()
+
+        def branch(index: int, partial: float, current: Tuple[int]) -> bool:
+            if bound.stopped(task):
+                return True
+            if budget.exhausted():
+                budget.cut()
+                return True
+
+            # solve all layers that don't need a starter corner right away
+            while index < len(layers) and not starter_layers[index]:
+                self.solve_layer(model, layers[index])
+                partial += model.holes_of_corners(layers[index])
+                index += 1
+
+            if index == len(layers):
+                tmp = model.holes_of_corners(corners)
+                if LayeredSolver.debug:
+                    print(current, tmp)
+                if tmp <= best[1]:
+                    best[0], best[1] = current, tmp
+                    bound.found(task, tmp)
+                budget.trial(best[1])
+                return best[1] == 0 and bound.stop_at_zero
+
+            if len(current) < len(prefix):
+                starts = [prefix[len(current)]]
+            else:
+                starts = reversed(range(len(layers[index])))
+
+            state = model.snapshot()
+            for start in starts:
+                model.restore(state)
+                self.solve_layer(model, layers[index], start_index=start)
+                holes = partial + model.holes_of_corners(layers[index])
+                # a little tolerance, so configurations with the same holes (-> summed up in another order) survive
+                if holes > min(best[1], bound.best()) + 1e-9:
+                    continue
+                if branch(index + 1, holes, current + (start,)):
+                    return True
+            return False
+
+        branch(0, 0.0, tuple())
+        return None if best[0] is None else (best[0], best[1])
+
+    def parallel_search(self, model: SolverModel, layers: List[List[int]], starter_layers: List[bool], score: float,
+                        executor: Executor, budget: 'SearchBudget' = None,
+                        stop_at_zero: bool = True) -> Optional[Tuple[Tuple[int], float]]:
+        """
+        splits the configurations by their first starter indices into tasks and searches them on the executor
+        the result is the same as the one of search_configurations over all configurations
+        :param model: the model we are solving, in the state right before solving the first layer
+        :param layers: all corners grouped by layer (see get_complete_layers)
+        :param starter_layers: whether each layer needs a starter corner
+        :param score: configurations with more holes than this are not interesting
+        :param executor: e.g. a ThreadPoolExecutor or a ProcessPoolExecutor
+        :param budget: when to give up and return the best configuration found so far
+        (shared by all tasks, so it needs a manager as well if the tasks run in other processes)
+        :param stop_at_zero: whether to stop at the first configuration without holes
+        :return: the best configuration found and its holes, None if there is no configuration with <= score holes
+        """
+        # a few tasks per worker, so the workers stay busy when some tasks are pruned early
+        prefixes = [tuple()]
+        for layer, starter in zip(layers, starter_layers):
+            if len(prefixes) >= LayeredSolver.tasks_per_worker * (os.cpu_count() or 1):
+                break
+            if starter:
+                prefixes = [p + (start,) for p in prefixes for start in reversed(range(len(layer)))]
+
+        # processes need a manager to share the bound, threads don't
+        manager = multiprocessing.Manager() if isinstance(executor, ProcessPoolExecutor) else None
+        try:
+            bound = SearchBound(score, manager, stop_at_zero)
+            futures = [executor.submit(search_task, self.bond, model, layers, starter_layers, score, bound, budget,
+                                       prefix, task) for task, prefix in enumerate(prefixes)]
+            results = []
+            for f in futures:
+                results.append(f.result())
+                if budget is not None:
+                    budget.report(bound.best())
+        finally:
+            if manager is not None:
+                manager.shutdown()
+
+        # same as searching through all tasks one after another
+        ret = None
+        for result in results:
+            if result is None:
+                continue
+            if result[1] == 0 and stop_at_zero:
+                return result
+            if ret is None or result[1] <= ret[1]:
+                ret = result
+        return ret
+
+    def get_components(self, model: SolverModel) -> List[List[List[int]]]:
+        """
+        :param model: the model we are solving
+        :return: the layers (see get_complete_layers) of each independent part of the model (see SolverModel.components)
         """
-        for corn in corners.corners:
-            corn.set_main_layer()
-            for layer in corn.layers:
-                layer.parent.set_x_offsets()
+        component = {}
+        for i, corners in enumerate(model.components()):
+            for c in corners:
+                component[c] = i
 
-    def solve(self):
+        ret = [[] for _ in set(component.values())]
+        for layer in self.get_complete_layers(model):
+            ret[component[layer[0]]].append(layer)
+        return ret
+
+    def solve_component(self, model: SolverModel, layers: List[List[int]]) -> Tuple[List[bool], Tuple[int], float]:
+        """
+        first run on the layers of one component, every layer that needs a starter corner starts with its first one
+        :param model: the model we are solving
+        :param layers: the layers of the component
+        :return: whether each layer needs a starter corner, the configuration used and its holes
+        """
+        starter_layers = [self.solve_layer(model, layer) for layer in layers]
+        config = tuple(0 for s in starter_layers if s)
+        return starter_layers, config, model.holes_of_corners([c for layer in layers for c in layer])
+
+    def search_components(self, model: SolverModel, components: List[List[List[int]]],
+                          runs: Dict[int, Tuple[List[bool], Tuple[int], float]], todo: List[int],
+                          budget: 'SearchBudget',
+                          stop_at_zero: bool = True) -> Dict[int, Tuple[Tuple[int], float]]:
+        """
+        searches the starter configurations of some components, one task per component on the executor
+        (if there is one and more than one component to search), otherwise one component after another
+        :param model: the model we are solving
+        :param components: the layers of each component (see get_components)
+        :param runs: for each component to search whether its layers need a starter corner, the configuration to start
+        with and its holes (see solve_component)
+        :param todo: the indices of the components to search
+        :param budget: when to give up and return the best configurations found so far
+        :param stop_at_zero: whether to stop at the first configuration without holes
+        :return: the best configuration and its holes of each searched component
+        """
+        ret = {}
+        if self.executor is not None and len(todo) > 1:
+            model.restore()
+            futures = [self.executor.submit(component_task, self.bond, model, components[i], *runs[i], budget,
+                                            stop_at_zero) for i in todo]
+            for i, future in zip(todo, futures):
+                ret[i] = future.result()
+                budget.report(ret[i][1])
+        else:
+            for i in todo:
+                model.restore()
+                ret[i] = self.search(model, components[i], *runs[i], self.executor, budget, stop_at_zero)
+        return ret
+
+    def solve(self, time_budget: float = None, max_trials: int = None,
+              progress: Callable[[int, float, float], None] = None) -> SolverResult:
         """
         solves the detailing problem described in the thesis
+        every component is solved on its own, so we only try out the starter combinations of one component at a time
+        :param time_budget: seconds after which we stop trying out starter combinations
+        :param max_trials: number of starter combinations after which we stop trying out more
+        :param progress: called with the trials done, the best holes of the current search and the elapsed seconds
+        (after every trial, or after every task if the tasks run in other processes)
+        :return: the holes of the solution and whether it is proven to be the best one
+        (a cached solution is only stored if it is the best one, so it is returned with 0 trials)
         """
-        starters = []
+        # the main layers and x offsets are the same for every try, so freeze them once
+        self.freeze(self.corners)
+        model = SolverModel(self.corners, self.bond)
 
-        # first run -> collect all possible starter indices
-        corners = deepcopy(self.corners)
-        self.freeze(corners)
-        done = []
-        layers = []
+        # the same model has been solved before
+        start = time.time()
+        if self.cache is not None and self.cache.load(model):
+            model.write_back()
+            holes = model.all_holes()
+            print("found a cached solution with", holes, "holes", ":)" if holes == 0 else ":(")
+            if progress is not None:
+                progress(0, holes, time.time() - start)
+            return SolverResult(holes, True, 0, time.time() - start)
 
-        for corn in corners.get_corners_sorted_by_z():
-            if corn not in done:
-                corners_of_layer = self.get_complete_layer(corn, corners)
-                done.extend(corners_of_layer)
-                layers.append(corners_of_layer)
+        components = self.get_components(model)
+        model.find_replicas([layer for layers in components for layer in layers])
 
-        for layer in layers:
-            new_corner = self.solve_layer(layer, corners)
-            if new_corner:
-                starters.append([i for i in range(len(layer))])
+        # first run -> collect all possible starter indices
+        runs = [self.solve_component(model, layers) for layers in components]
+        configs = [(config, score) for _, config, score in runs]
 
         # if score > 0 we continue trying out all possible starter combinations, to find the best one
-        min_config = [s[0] for s in starters]
-        score = self.all_holes(corners)
-
-        if score > 0:
+        todo = [i for i, (_, _, score) in enumerate(runs) if score > 0]
+        for i in todo:
+            starters = [list(range(len(l))) for l, s in zip(components[i], runs[i][0]) if s]
             print("----------------")
-            print("trying", starters, len(list(itertools.product(*starters))), "combinations")
-            for config in reversed(list(itertools.product(*starters))):
-                corners = deepcopy(self.corners)
-                self.freeze(corners)
-
-                index = 0
-                done = []
-                layers = []
-                for corn in corners.get_corners_sorted_by_z():
-                    if corn not in done:
-                        corners_of_layer = self.get_complete_layer(corn, corners)
-                        done.extend(corners_of_layer)
-                        layers.append(corners_of_layer)
-
-                for layer in layers:
-                    new_corner = self.solve_layer(layer, corners, start_index=config[index])
-                    if new_corner and index < len(config) - 1:
-                        index += 1
-                tmp = self.all_holes(corners)
-                print(config, tmp)
-                if tmp <= score:
-                    min_config = config
-                    score = tmp
-                if score == 0:
-                    break
+            print("trying", starters, math.prod(len(s) for s in starters), "combinations")
+
+        # processes need a manager to share the budget, threads don't
+        manager = None
+        if isinstance(self.executor, ProcessPoolExecutor) and len(todo) > 0:
+            manager = multiprocessing.Manager()
+        try:
+            budget = SearchBudget(time_budget, max_trials, progress, manager)
+            searched = self.search_components(model, components, dict(enumerate(runs)), todo, budget)
+            for i, result in searched.items():
+                configs[i] = result
+            optimal = not budget.was_cut()
+
+            # searching everything at once only stops at a solution without holes if there are no holes at all,
+            # so if any component has holes the others use their last solution without holes.
+            # this only decides which of the configurations without holes is chosen, the holes stay the same
+            if any(score > 0 for _, score in configs):
+                zero = [i for i in todo if configs[i][1] == 0]
+                reruns = {i: (runs[i][0], configs[i][0], 0) for i in zero}
+                searched = self.search_components(model, components, reruns, zero, budget, stop_at_zero=False)
+                for i, result in searched.items():
+                    configs[i] = result
+            trials, elapsed = budget.trials(), budget.elapsed()
+        finally:
+            if manager is not None:
+                manager.shutdown()
 
         # apply solution to og corners
-        done = []
-        layers = []
-        index = 0
+        model.restore()
+        for layers, (config, _) in zip(components, configs):
+            self.apply_config(model, layers, config)
+        model.write_back()
 
-        corners = self.corners
-        self.freeze(corners)
-        for corn in corners.get_corners_sorted_by_z():
-            if corn not in done:
-                corners_of_layer = self.get_complete_layer(corn, corners)
-                done.extend(corners_of_layer)
-                layers.append(corners_of_layer)
+        holes = model.all_holes()
+        print("found a solution with", holes, "holes", ":)" if holes == 0 else ":(")
+        if self.cache is not None and (optimal or holes == 0):
+            self.cache.store(model)
+        return SolverResult(holes, optimal or holes == 0, trials, elapsed)
 
-        for layer in layers:
-            new_corner = self.solve_layer(layer, corners, start_index=min_config[index])
-            if new_corner and index < len(min_config) - 1:
-                index += 1
 
-        print("found a solution with", self.all_holes(corners), "holes", ":)" if self.all_holes(corners) == 0 else ":(")
+class SearchBound:
+    """
+    The best score found so far by all tasks of one search and the first task that found a configuration without holes.
+    Tasks after that one can stop, tasks before it still need to finish (they come first in the search order)
+    """
+
+    def __init__(self, score: float, manager: 'multiprocessing.managers.SyncManager' = None,
+                 stop_at_zero: bool = True):
+        """
+        :param score: initial best score
+        :param manager: needed if the tasks run in other processes
+        :param stop_at_zero: whether the search stops at the first configuration without holes
+        """
+        self.stop_at_zero = stop_at_zero
+        if manager is None:
+            self.__values = {"best": score, "zero_task": None}
+            self.__lock = threading.Lock()
+        else:
+            self.__values = manager.dict(best=score, zero_task=None)
+            self.__lock = manager.Lock()
+
+    def best(self) -> float:
+        return self.__values["best"]
+
+    def stopped(self, task: int) -> bool:
+        """
+        :return: True if a task before given task found a configuration without holes
+        """
+        zero_task = self.__values["zero_task"]
+        return zero_task is not None and zero_task < task
+
+    def found(self, task: int, score: float):
+        """
+        :param task: the task that found a configuration
+        :param score: holes of the configuration
+        """
+        with self.__lock:
+            if score < self.__values["best"]:
+                self.__values["best"] = score
+            zero_task = self.__values["zero_task"]
+            if score == 0 and self.stop_at_zero and (zero_task is None or task < zero_task):
+                self.__values["zero_task"] = task
+
+
+class SearchBudget:
+    """
+    How long and how many complete starter configurations (trials) all searches of one solve may take.
+    Once it is exhausted the searches return the best configuration they found so far
+    """
+
+    def __init__(self, time_budget: float = None, max_trials: int = None,
+                 progress: Callable[[int, float, float], None] = None,
+                 manager: 'multiprocessing.managers.SyncManager' = None):
+        """
+        :param time_budget: seconds from now, None for no limit
+        :param max_trials: None for no limit
+        :param progress: called with the trials done, the best holes so far and the elapsed seconds
+        (only in the process that created the budget)
+        :param manager: needed if the searches run in other processes
+        """
+        self.start = time.time()
+        self.deadline = None if time_budget is None else self.start + time_budget
+        self.max_trials = max_trials
+        self.progress = progress
+        if manager is None:
+            self.__values = {"trials": 0, "cut": False}
+            self.__lock = threading.Lock()
+        else:
+            self.__values = manager.dict(trials=0, cut=False)
+            self.__lock = manager.Lock()
+
+    def __getstate__(self):
+        # the callback stays in the process that created the budget
+        state = self.__dict__.copy()
+        state["progress"] = None
+        return state
+
+    def exhausted(self) -> bool:
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return self.max_trials is not None and self.__values["trials"] >= self.max_trials
+
+    def trial(self, best: float):
+        """
+        counts a complete configuration
+        :param best: best holes found so far
+        """
+        with self.__lock:
+            self.__values["trials"] += 1
+        self.report(best)
+
+    def report(self, best: float):
+        """
+        :param best: best holes found so far
+        """
+        if self.progress is not None:
+            self.progress(self.trials(), best, self.elapsed())
+
+    def cut(self):
+        """
+        a search has been stopped before going through all configurations it had to
+        """
+        self.__values["cut"] = True
+
+    def was_cut(self) -> bool:
+        return self.__values["cut"]
+
+    def trials(self) -> int:
+        return self.__values["trials"]
+
+    def elapsed(self) -> float:
+        return time.time() - self.start
+
+
+def search_task(bond: Bond, model: SolverModel, layers: List[List[int]], starter_layers: List[bool], score: float,
+                bound: SearchBound, budget: Optional[SearchBudget], prefix: Tuple[int],
+                task: int) -> Optional[Tuple[Tuple[int], float]]:
+    """
+    one task of LayeredSolver.parallel_search, see LayeredSolver.search_configurations
+    """
+    solver = LayeredSolver(Corns(), bond)
+    return solver.search_configurations(model.fork(), layers, starter_layers, score, bound, budget, prefix, task)
+
+
+def component_task(bond: Bond, model: SolverModel, layers: List[List[int]], starter_layers: List[bool],
+                   config: Tuple[int], score: float, budget: SearchBudget,
+                   stop_at_zero: bool = True) -> Tuple[Tuple[int], float]:
+    """
+    searches the starter configurations of one component of LayeredSolver.solve, see LayeredSolver.search
+    """
+    solver = LayeredSolver(Corns(), bond)
+    return solver.search(model.fork(), layers, starter_layers, config, score, budget=budget, stop_at_zero=stop_at_zero)
@@ -0,0 +1,168 @@
+import math
+import random
+import time
+
+from typing import List, Dict, Tuple, Callable
+
+from detailing.layered_solver import LayeredSolver
+from detailing.solver import Solver, SolverResult
+from detailing.solver_model import SolverModel
+from masonry.corner_rep import Corns
+from masonry.bond.abstract_bond import Bond
+
+
+class LocalSearchSolver(Solver):
+    """
+    Heuristic solver for buildings that are too big to try out all starter corners.
+    It starts with the greedy solution of LayeredSolver (every layer starts with its first corner) and improves it
+    with simulated annealing. The variables are the plan offsets of the walls and of the stacks of corners
+    (see SolverModel.stacks), a move either
+     - sets a wall to another plan offset
+     - sets a stack of corners to another plan offset
+     - solves one layer (height in the building) again, starting with another corner (like LayeredSolver does)
+    Only the holes of the layers touched by a move are calculated again, so a move costs the same in every building.
+    """
+    debug = False
+
+    def __init__(self, corners: Corns, bond: Bond, seed: int = 0, moves_per_variable: int = 200,
+                 temperature: float = None):
+        """
+        :param corners: all corners
+        :param bond: the bond to use
+        :param seed: seed of the random number generator, the same seed always leads to the same solution
+        :param moves_per_variable: how many moves we try (times the number of variables)
+        :param temperature: start temperature of the annealing, half a brick length by default
+        """
+        super(LocalSearchSolver, self).__init__(corners, bond)
+        self.seed = seed
+        self.moves_per_variable = moves_per_variable
+        self.temperature = bond.l / 2.0 if temperature is None else temperature
+
+    def solve(self, time_budget: float = None, max_trials: int = None,
+              progress: Callable[[int, float, float], None] = None) -> SolverResult:
+        """
+        solves the detailing problem described in the thesis
+        :param time_budget: seconds after which we stop trying out moves
+        :param max_trials: number of moves after which we stop
+        :param progress: called with the moves done, the best holes so far and the elapsed seconds
+        (every 100 moves and at the end)
+        :return: the holes of the solution, which is only proven to be the best one if it has no holes
+        """
+        start_time = time.time()
+        rng = random.Random(self.seed)
+        greedy = LayeredSolver(self.corners, self.bond)
+
+        self.freeze(self.corners)
+        model = SolverModel(self.corners, self.bond)
+        layers = greedy.get_complete_layers(model)
+        root, depth = model.stacks()
+        walls = len(model.walls)
+
+        # variable w is the plan offset of wall w, variable walls + c the plan offset of the stack of corner c
+        domains: Dict[int, int] = {}
+        layers_of_variable: Dict[int, List[int]] = {}
+        variables_of_layer: List[List[int]] = []
+        for l, corners in enumerate(model.corners_of_layer):
+            variables = []
+            if len(corners) > 0:
+                variables = [int(model.layer_wall[l])] + sorted(set(walls + root[c] for c in corners))
+                for v in variables:
+                    domains[v] = self.bond.repeat_layer if v < walls else self.bond.get_corner_plan_repeat_step()
+                    layers_of_variable.setdefault(v, []).append(l)
+            variables_of_layer.append(variables)
+
+        # holes of each layer with the choices of its variables
+        cache: Dict[Tuple, float] = {}
+
+        def layer_holes(l: int, value: Dict[int, int]) -> float:
+            key = (l,) + tuple(value[v] for v in variables_of_layer[l])
+            if key not in cache:
+                corners = model.corners_of_layer[l]
+                offsets = [value[walls + root[c]] + depth[c] for c in corners]
+                cache[key] = model.holes_of_layer(l, corners, value[int(model.layer_wall[l])], offsets)
+            return cache[key]
+
+        # greedy start
+        for layer in layers:
+            greedy.solve_layer(model, layer)
+        value = {v: int(model.state.wall_plan_offset[v]) if v < walls else
+                 int(model.state.corner_plan_offset[v - walls]) - depth[v - walls] for v in domains}
+        holes = [layer_holes(l, value) if len(variables_of_layer[l]) > 0 else 0 for l in range(len(model.layers))]
+        energy = sum(holes)
+        best, best_energy = dict(value), energy
+
+        def reseed(layer: List[int], start: int) -> Dict[int, int]:
+            # solve the layer again like the LayeredSolver, with all walls fixed
+            model.restore()
+            for w in set(int(model.layer_wall[l]) for c in layer for l in model.corner_layers[c]):
+                model.set_wall_plan_offset(w, value[w])
+            for c in layer:
+                bottom = model.corner_bottom[c]
+                if bottom >= 0:
+                    model.state.corner_plan_offset[bottom] = value[walls + root[bottom]] + depth[bottom]
+            greedy.solve_layer(model, layer, start_index=start)
+            return {walls + c: int(model.state.corner_plan_offset[c]) for c in layer if root[c] == c}
+
+        variables = sorted(domains)
+        reseedable = [layer for layer in layers if len(layer) > 1]
+        steps = self.moves_per_variable * len(variables)
+        if max_trials is not None:
+            steps = min(steps, max_trials)
+        trials = 0
+        while trials < steps and best_energy > 0:
+            if time_budget is not None and time.time() - start_time >= time_budget:
+                break
+            if progress is not None and trials % 100 == 0:
+                progress(trials, best_energy, time.time() - start_time)
+            trials += 1
+
+            # geometric cooling down to a thousandth of the start temperature
+            temperature = self.temperature * 0.001 ** (trials / steps)
+
+            move = rng.random()
+            if move < 0.1 and len(reseedable) > 0:
+                layer = rng.choice(reseedable)
+                changes = reseed(layer, rng.randrange(len(layer)))
+            else:
+                v = rng.choice(variables)
+                if domains[v] < 2:
+                    continue
+                changes = {v: (value[v] + rng.randrange(1, domains[v])) % domains[v]}
+            changes = {v: x for v, x in changes.items() if value[v] != x}
+            if len(changes) == 0:
+                continue
+
+            touched = sorted(set(l for v in changes for l in layers_of_variable[v]))
+            old = {v: value[v] for v in changes}
+            value.update(changes)
+            new_holes = [layer_holes(l, value) for l in touched]
+            delta = sum(new_holes) - sum(holes[l] for l in touched)
+
+            if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                for l, h in zip(touched, new_holes):
+                    holes[l] = h
+                energy += delta
+                if energy < best_energy - 1e-9:
+                    best, best_energy = dict(value), energy
+            else:
+                value.update(old)
+
+        # apply the best solution to og corners
+        model.restore()
+        for w in range(walls):
+            if w in best:
+                model.set_wall_plan_offset(w, best[w])
+        for c in range(len(model.corners)):
+            if walls + root[c] in best:
+                model.set_corner_plan_offset(c, best[walls + root[c]] + depth[c])
+        for c in range(len(model.corners)):
+            model.reduce_corner_layer_length(c)
+        model.write_back()
+
+        holes = model.all_holes()
+        if LocalSearchSolver.debug:
+            print("tried", trials, "moves on", len(variables), "variables")
+        print("found a solution with", holes, "holes", ":)" if holes == 0 else ":(")
+        if progress is not None:
+            progress(trials, holes, time.time() - start_time)
+        return SolverResult(holes, holes == 0, trials, time.time() - start_time)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+import quaternion
+
+from detailing.solver_model import SolverModel
+
+
+class SolutionCache:
+    """
+    Stores solutions of the solver on disk, so detailing an unchanged model again does not need to solve it again.
+    A solution is found by a fingerprint of everything the solver looks at: module, bond, walls, layers (lengths and
+    positions), their connections and the corners with their offsets (see fingerprint).
+    Wall positions are taken relative to the wall with the lowest position, so a model that was moved as a whole is
+    found as well. Wall rotations are absolute, a rotated model is solved again.
+    The file has one json object per line (key, plan offsets of walls and corners, positions and lengths of the layers),
+    later lines win over earlier ones with the same key.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: the file to read solutions from and write new ones to
+        """
+        self.path = path
+        self.solutions: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if len(line) == 0:
+                        continue
+                    entry = json.loads(line)
+                    self.solutions[entry["key"]] = entry
+
+    @staticmethod
+    def canonical_order(model: SolverModel) -> Optional[Tuple[List[int], List[int], List[int], dict]]:
+        """
+        Walls, layers and corners of a model are numbered in the order we find them, which changes between runs.
+        Here they are sorted by their geometry instead, so the same model always looks the same.
+        :param model: the model (not solved yet)
+        :return: model indices of walls, layers and corners in canonical order and the description of the model,
+        None if two walls, layers or corners can't be told apart
+        """
+        # positions relative to the wall with the lowest position, so moving the whole model keeps the key
+        translations = [w.get_translation() for w in model.walls]
+        reference = min(translations, key=lambda t: tuple(np.round(t, 6).tolist())) if len(translations) > 0 else 0
+        walls = [(tuple(np.round(translations[i] - reference, 6).tolist()),
+                  tuple(np.round(quaternion.as_float_array(w.get_rotation()), 6).tolist()),
+                  round(w.wall.width, 6), bool(model.wall_reversed[i]),
+                  round(model.wall_lowest_x[i], 6), round(model.wall_highest_x[i], 6))
+                 for i, w in enumerate(model.walls)]
+        wall_order = sorted(range(len(walls)), key=lambda i: walls[i])
+        wall_rank = {w: k for k, w in enumerate(wall_order)}
+
+        layers = [(wall_rank[int(model.layer_wall[l])], int(model.layer_index[l]),
+                   round(float(model.initial.layer_x[l]), 6), round(float(model.initial.layer_length[l]), 6))
+                  for l in range(len(model.layers))]
+        layer_order = sorted(range(len(layers)), key=lambda l: layers[l])
+        layer_of = {id(layer): l for l, layer in enumerate(model.layers)}
+
+        corners = [tuple(sorted(layers[l] for l in model.corner_layers[c])) for c in range(len(model.corners))]
+        corner_order = sorted(range(len(corners)), key=lambda c: corners[c])
+
+        if len(set(walls)) != len(walls) or len(set(layers)) != len(layers) or len(set(corners)) != len(corners):
+            return None
+
+        description = {
+            "walls": [walls[w] for w in wall_order],
+            "layers": [(layers[l], sorted(corners[c] for c in model.layer_corners[l])) for l in layer_order],
+            "corners": [(corners[c],
+                         None if model.corner_bottom[c] < 0 else corners[model.corner_bottom[c]],
+                         layers[layer_of[id(model.corners[c].get_main_layer())]],
+                         sorted((layers[l], round(float(model.corner_layer[(c, l)].start_x), 6),
+                                 [round(float(x), 6) for x in model.corner_layer[(c, l)].corner_lengths],
+                                 bool(model.corner_layer[(c, l)].left)) for l in model.corner_layers[c]))
+                        for c in corner_order]
+        }
+        return wall_order, layer_order, corner_order, description
+
+    @staticmethod
+    def fingerprint(model: SolverModel, description: dict) -> str:
+        """
+        :param model: the model (not solved yet)
+        :param description: see canonical_order
+        :return: sha256 of the module, the bond and the description of the model
+        """
+        module = model.bond.module
+        grid = None if module.grid is None else np.round(np.asarray(module.grid, dtype=float), 6).tolist()
+        data = {
+            "module": [module.length, module.width, module.height, grid],
+            "bond": [type(model.bond).__name__, model.bond.repeat_layer, model.bond.get_corner_plan_repeat_step()],
+            "model": description
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def load(self, model: SolverModel) -> bool:
+        """
+        sets the state of the model to a cached solution
+        :param model: the model (not solved yet)
+        :return: True if there was a solution for the model, False if it needs to be solved
+        """
+        order = self.canonical_order(model)
+        if order is None:
+            return False
+        wall_order, layer_order, corner_order, description = order
+        entry = self.solutions.get(self.fingerprint(model, description))
+        if entry is None:
+            return False
+
+        model.restore()
+        for w, (offset, touched) in zip(wall_order, entry["walls"]):
+            model.state.wall_plan_offset[w] = offset
+            model.state.wall_touched[w] = touched
+        for c, (offset, touched) in zip(corner_order, entry["corners"]):
+            model.state.corner_plan_offset[c] = offset
+            model.state.corner_touched[c] = touched
+        for l, (x, length) in zip(layer_order, entry["layers"]):
+            model.state.layer_x[l] = x
+            model.state.layer_length[l] = length
+        model.state.dirty[:] = True
+        return True
+
+    def store(self, model: SolverModel):
+        """
+        writes the current state of the model as the solution for it
+        :param model: the model (solved)
+        """
+        order = self.canonical_order(model)
+        if order is None:
+            return
+        wall_order, layer_order, corner_order, description = order
+        state = model.state
+        entry = {
+            "key": self.fingerprint(model, description),
+            "walls": [[int(state.wall_plan_offset[w]), bool(state.wall_touched[w])] for w in wall_order],
+            "corners": [[int(state.corner_plan_offset[c]), bool(state.corner_touched[c])] for c in corner_order],
+            "layers": [[float(state.layer_x[l]), float(state.layer_length[l])] for l in layer_order]
+        }
+        self.solutions[entry["key"]] = entry
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
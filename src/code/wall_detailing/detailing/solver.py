@@ -1,11 +1,18 @@
 from abc import ABC, abstractmethod
-from copy import deepcopy
-from typing import List
+from typing import List, NamedTuple, Callable
+from detailing.solver_model import SolverModel
 from detailing.wall_layer import WallLayer
 from masonry.corner_rep import Corns, Corn
 from masonry.bond.abstract_bond import Bond
 
 
+class SolverResult(NamedTuple):
+    holes: float  # holes of the solution
+    optimal: bool  # whether there is no solution with less holes (False if the solver gave up early)
+    trials: int  # number of configurations tried out
+    elapsed: float  # seconds
+
+
 class Solver(ABC):
     def __init__(self, corners: Corns, bond: Bond):
         self.bond = bond
@@ -18,34 +25,28 @@ class Solver(ABC):
         :param corners: a list of corners
         :return: all corners that are connected to given corner by layers on the same height in the building
         """
-        ret = []
-        todo = [corn]
         if corners is None:
             corners = self.corners
+        return [corners.corners[c] for c in corners.get_course(corners.index[id(corn)])]
 
-        while len(todo) > 0:
-            for curr in todo.copy():
-                todo.remove(curr)
-                if curr not in ret:
-                    ret.append(curr)
-                    for layer1 in curr.layers:
-                        for layer2 in layer1.left_connections:
-                            todo.append(corners.get_corner([layer1, layer2]))
-                        for layer2 in layer1.right_connections:
-                            todo.append(corners.get_corner([layer1, layer2]))
-        return ret
+    def freeze(self, corners: Corns):
+        """
+        "freezes" the x offsets of all layers of all walls to current values
+        "freezes" the main layers for each corner to current main layer
+        this needs to be done to prevent errors after reducing the length of the wall_layers
+        :param corners: all corners
+        """
+        for corn in corners.corners:
+            corn.set_main_layer()
+            for layer in corn.layers:
+                layer.parent.set_x_offsets()
 
     def all_holes(self, corners: Corns):
         """
         :param corners: a list of corners
         :return: the number of holes between all corners and their layers
         """
-        val = 0
-        corners = deepcopy(corners)
-        for corner in corners.corners:
-            for layer in corner.layers:
-                val += self.holes_between_corner_and_layer(corner, layer)
-        return val
+        return SolverModel(corners, self.bond).all_holes()
 
     def holes_between_corner_and_layer(self, corner: Corn, layer: WallLayer):
         """
@@ -53,25 +54,19 @@ class Solver(ABC):
         :param layer: a layer
         :return: the number of holes between the corner and the layer
         """
-        corner = deepcopy(corner)
-
-        left = False
-        for l in corner.layers:
-            if l.parent.id == layer.parent.id:
-                corner.reduce_layer_length(l, self.bond)
-                leftover_left, leftover_right, num_bricks = self.bond.leftover_of_layer(l.length,
-                                                                                        l.get_layer_plan_index(),
-                                                                                        l.relative_x_offset(),
-                                                                                        l.parent.reversed)
-                if num_bricks == 0 or leftover_right + leftover_left == l.length:
-                    leftover_left = 0
-                    leftover_right = 0
-
-            if l.parent.id in [l2.parent.id for l2 in layer.left_connections]:
-                left = True
-
-        return leftover_left if left else leftover_right
+        corners = Corns()
+        corners.add_corner(corner)
+        model = SolverModel(corners, self.bond)
+        return model.holes_between_corner_and_layer(0, model.layers.index(layer))
 
     @abstractmethod
-    def solve(self):
+    def solve(self, time_budget: float = None, max_trials: int = None,
+              progress: Callable[[int, float, float], None] = None) -> SolverResult:
+        """
+        solves the detailing problem, the solution is written into the corners, layers and walls
+        :param time_budget: seconds after which the solver returns the best solution found so far
+        :param max_trials: number of tried out configurations after which the solver returns the best solution so far
+        :param progress: called with the trials done, the best holes so far and the elapsed seconds
+        :return: the holes of the solution and whether it is proven to be the best one
+        """
         pass
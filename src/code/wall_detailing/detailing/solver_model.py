@@ -0,0 +1,592 @@
+import copy
+import math
+from typing import List, Dict, Tuple
+
+import numpy as np
+import quaternion
+
+from detailing.wall_layer import WallLayer
+from detailing.wall_layer_group import WallLayerGroup
+from masonry.corner_rep import Corns, Corn
+from masonry.bond.abstract_bond import Bond
+
+
+class CornerLayer:
+    """
+    Everything about one layer of one corner that does not change while solving
+    """
+    __slots__ = ["start_x", "corner_lengths", "left"]
+
+    def __init__(self, start_x: float, corner_lengths: Tuple[float], left: bool):
+        self.start_x = start_x  # local x coordinate of the outer corner point in the layers wall
+        self.corner_lengths = corner_lengths  # how far the corner reaches into the layer for each corner plan offset
+        self.left = left  # whether the other walls of the corner are connected to the left of the layer
+
+
+class SolverState:
+    """
+    Everything the solver changes while trying out a configuration
+    """
+    __slots__ = ["layer_x", "layer_length", "wall_plan_offset", "wall_touched", "corner_plan_offset",
+                 "corner_touched", "holes", "dirty"]
+
+    def __init__(self, layer_x: np.array, layer_length: np.array, wall_plan_offset: np.array, wall_touched: np.array,
+                 corner_plan_offset: np.array, corner_touched: np.array, holes: np.array, dirty: np.array):
+        self.layer_x = layer_x  # x coordinate of the layers center (relative to its wall)
+        self.layer_length = layer_length
+        self.wall_plan_offset = wall_plan_offset
+        self.wall_touched = wall_touched
+        self.corner_plan_offset = corner_plan_offset
+        self.corner_touched = corner_touched
+        self.holes = holes  # holes of each (corner, layer) pair (see SolverModel.pairs) ...
+        self.dirty = dirty  # ... which are only valid if not dirty
+
+    def copy(self) -> 'SolverState':
+        return SolverState(self.layer_x.copy(), self.layer_length.copy(), self.wall_plan_offset.copy(),
+                           self.wall_touched.copy(), self.corner_plan_offset.copy(), self.corner_touched.copy(),
+                           self.holes.copy(), self.dirty.copy())
+
+
+class CourseReplica:
+    """
+    A layer (height in the building) that looks exactly like a solved layer one bond period below it
+    (same corners on top of each other, same layer lengths and positions) and therefore has the same solution.
+    Everything is given as pairs of arrays: the index in this layer and the index in the layer below
+    """
+    __slots__ = ["corners", "corner_sources", "layers", "layer_sources", "pairs", "pair_sources"]
+
+    def __init__(self, corners: np.array, corner_sources: np.array, layers: np.array, layer_sources: np.array,
+                 pairs: np.array, pair_sources: np.array):
+        self.corners = corners
+        self.corner_sources = corner_sources
+        self.layers = layers
+        self.layer_sources = layer_sources
+        self.pairs = pairs
+        self.pair_sources = pair_sources
+
+
+class SolverModel:
+    """
+    Geometry free representation of the corners, layers and walls the solver works on.
+    Everything that does not change while solving (topology, frozen offsets, corner lengths, ...) is calculated once,
+    everything that does change lives in a small SolverState that can be copied and restored cheaply.
+    Only the final solution is written back into the Corn / WallLayer / WallLayerGroup objects (see write_back)
+    Layers, walls and corners are referenced by their index in self.layers, self.walls and self.corners
+    """
+
+    def __init__(self, corners: Corns, bond: Bond):
+        self.bond = bond
+        self.corners: List[Corn] = list(corners.corners)
+        self.layers: List[WallLayer] = []
+        self.walls: List[WallLayerGroup] = []
+
+        corner_ids = {id(c): i for i, c in enumerate(self.corners)}
+        layer_ids: Dict[int, int] = {}
+        wall_ids: Dict[int, int] = {}
+
+        # layers of each corner in the order we iterate over them
+        self.corner_layers: List[Tuple[int]] = []
+        for corner in self.corners:
+            ids = []
+            for layer in corner.layers:
+                if id(layer) not in layer_ids:
+                    layer_ids[id(layer)] = len(self.layers)
+                    self.layers.append(layer)
+                    if id(layer.parent) not in wall_ids:
+                        wall_ids[id(layer.parent)] = len(self.walls)
+                        self.walls.append(layer.parent)
+                ids.append(layer_ids[id(layer)])
+            self.corner_layers.append(tuple(ids))
+
+        # layers
+        self.layer_wall = np.array([wall_ids[id(l.parent)] for l in self.layers], dtype=int)
+        self.layer_index = np.array([l.get_layer_index() for l in self.layers], dtype=int)
+        self.layer_corners: List[List[int]] = []  # corners of the left and right connections of each layer
+        for layer in self.layers:
+            neighbours = []
+            for other in layer.left_connections + layer.right_connections:
+                c = corners.get_corner([layer, other])
+                if c is not None and id(c) in corner_ids:
+                    neighbours.append(corner_ids[id(c)])
+            self.layer_corners.append(neighbours)
+
+        self.corners_of_layer: List[List[int]] = [[] for _ in self.layers]  # all corners that have the layer
+        for c, layers in enumerate(self.corner_layers):
+            for l in layers:
+                self.corners_of_layer[l].append(c)
+
+        # walls
+        self.wall_ids = [w.id for w in self.walls]
+        self.wall_reversed = [w.reversed for w in self.walls]
+        self.wall_lowest_x = [w.get_lowest_local_x() for w in self.walls]
+        self.wall_highest_x = [w.get_highest_local_x() for w in self.walls]
+
+        # corners
+        self.corner_bottom = []
+        for corner in self.corners:
+            bottom = corners.get_bottom_corner(corner)
+            self.corner_bottom.append(corner_ids[id(bottom)] if bottom is not None and id(bottom) in corner_ids
+                                      else -1)
+
+        # everything we need to reduce a layer by a corner
+        corner_plan_repeat = bond.get_corner_plan_repeat_step()
+        self.corner_layer: Dict[Tuple[int, int], CornerLayer] = {}
+        for c, corner in enumerate(self.corners):
+            main_layer = corner.get_main_layer()
+            angle = corner.get_rotation()
+            mid = corner._get_corner_direction()
+            for l in self.corner_layers[c]:
+                layer = self.layers[l]
+                wall = layer.parent
+
+                # same calculations as Corn.reduce_layer_length and WallLayer.move_edge
+                relative_rotation = (wall.get_rotation() * main_layer.parent.get_rotation().inverse())
+                relative_rotation = quaternion.from_euler_angles(0, 0, relative_rotation.angle()) * angle
+                corner_lengths = tuple(bond.get_corner_length(i, relative_rotation) for i in range(corner_plan_repeat))
+
+                width = wall.wall.width / 2.0
+                outer_corner_point = corner.point - np.array([width, width, 1]) * mid
+                local_start_point = outer_corner_point - wall.get_translation()
+                local_start_point = quaternion.rotate_vectors(wall.get_rotation().inverse(), local_start_point)
+                local_start_point = np.round(local_start_point, decimals=6)
+
+                left_walls = [o.parent.id for o in layer.left_connections]
+                left = any(self.layers[o].parent.id in left_walls for o in self.corner_layers[c])
+                self.corner_layer[(c, l)] = CornerLayer(local_start_point[0], corner_lengths, left)
+
+        # holes are kept for each (corner, layer) pair and only calculated again if something they depend on changed:
+        # the plan offset of the corner, the plan offset of the layers wall or
+        # position and length of the corners layers in that wall
+        self.pairs: List[Tuple[int, int]] = [(c, l) for c, layers in enumerate(self.corner_layers) for l in layers]
+        self.pair_index: Dict[Tuple[int, int], int] = {p: i for i, p in enumerate(self.pairs)}
+        corner_pairs = [[] for _ in self.corners]
+        wall_pairs = [[] for _ in self.walls]
+        layer_pairs = [[] for _ in self.layers]
+        for i, (c, l) in enumerate(self.pairs):
+            corner_pairs[c].append(i)
+            wall_pairs[self.layer_wall[l]].append(i)
+            for other in self.corner_layers[c]:
+                if self.layer_wall[other] == self.layer_wall[l]:
+                    layer_pairs[other].append(i)
+        self.corner_pairs = [np.array(p, dtype=int) for p in corner_pairs]
+        self.wall_pairs = [np.array(p, dtype=int) for p in wall_pairs]
+        self.layer_pairs = [np.array(p, dtype=int) for p in layer_pairs]
+
+        self.initial = SolverState(layer_x=np.array([l.translation[0] for l in self.layers], dtype=float),
+                                   layer_length=np.array([l.length for l in self.layers], dtype=float),
+                                   wall_plan_offset=np.array([w.plan_offset for w in self.walls], dtype=int),
+                                   wall_touched=np.array([w.touched for w in self.walls], dtype=bool),
+                                   corner_plan_offset=np.array([c.plan_offset for c in self.corners], dtype=int),
+                                   corner_touched=np.array([c.touched for c in self.corners], dtype=bool),
+                                   holes=np.zeros(len(self.pairs), dtype=float),
+                                   dirty=np.ones(len(self.pairs), dtype=bool))
+        self.state = self.initial.copy()
+
+        # layers (heights in the building) that can be copied from the one a bond period below, see find_replicas
+        self.period = math.lcm(bond.repeat_layer, max(corner_plan_repeat, 1))
+        self.replicas: Dict[Tuple[int], CourseReplica] = {}
+
+    def snapshot(self) -> SolverState:
+        """
+        :return: a copy of the current state
+        """
+        return self.state.copy()
+
+    def restore(self, state: SolverState = None):
+        """
+        :param state: state to go back to, the state the model has been created with if None
+        """
+        self.state = (self.initial if state is None else state).copy()
+
+    def fork(self) -> 'SolverModel':
+        """
+        :return: a model sharing everything that does not change with this one, in the initial state
+        """
+        ret = copy.copy(self)
+        ret.restore()
+        return ret
+
+    def __getstate__(self):
+        # the actual corners, layers and walls stay where the model has been created (see write_back)
+        state = self.__dict__.copy()
+        state["corners"], state["layers"], state["walls"] = None, None, None
+        return state
+
+    def components(self) -> List[List[int]]:
+        """
+        Corners that share a wall (-> plan offset of the wall, which also covers the layer connections)
+        or lie on top of each other (-> plan offset of the corner below) depend on each other.
+        Everything else can be solved independently
+        :return: the corners of each independent part, sorted by index
+        """
+        parent = list(range(len(self.corners)))
+
+        def find(c: int) -> int:
+            while parent[c] != c:
+                parent[c] = parent[parent[c]]
+                c = parent[c]
+            return c
+
+        def union(a: int, b: int):
+            a, b = find(a), find(b)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+        first_of_wall: Dict[int, int] = {}
+        for c, layers in enumerate(self.corner_layers):
+            for l in layers:
+                union(c, first_of_wall.setdefault(self.layer_wall[l], c))
+            if self.corner_bottom[c] >= 0:
+                union(c, self.corner_bottom[c])
+
+        ret: Dict[int, List[int]] = {}
+        for c in range(len(self.corners)):
+            ret.setdefault(find(c), []).append(c)
+        return list(ret.values())
+
+    def stacks(self) -> Tuple[List[int], List[int]]:
+        """
+        Corners on top of each other with the same walls just continue the plan of the corner below
+        (see LayeredSolver.solve_layer), so the plan offset of a whole stack of corners depends on its lowest corner
+        :return: for each corner the lowest corner of its stack and how many corners it lies above that one
+        """
+        root = [-1] * len(self.corners)
+        depth = [0] * len(self.corners)
+
+        def find(c: int):
+            if root[c] >= 0:
+                return
+            bottom = self.corner_bottom[c]
+            root[c], depth[c] = c, 0
+            if bottom >= 0:
+                walls = [self.layer_wall[l] for l in self.corner_layers[bottom]]
+                if all(self.layer_wall[l] in walls for l in self.corner_layers[c]):
+                    find(bottom)
+                    root[c], depth[c] = root[bottom], depth[bottom] + 1
+
+        for c in range(len(self.corners)):
+            find(c)
+        return root, depth
+
+    def find_replicas(self, courses: List[List[int]]):
+        """
+        Finds all layers (heights in the building) whose corners all lie on top of the corners of another layer
+        one period (see self.period) below, with the same walls, layer lengths and positions.
+        Such a layer is solved exactly like the one below, so we can just copy its solution (see replicate)
+        instead of fitting and scoring it again.
+        Everything else (openings, different wall heights, ...) is solved as usual
+        :param courses: all corners grouped by layer (see LayeredSolver.get_complete_layers)
+        """
+        root, depth = self.stacks()
+        stacked = {(root[c], depth[c]): c for c in range(len(self.corners))}
+        course_of = {c: i for i, course in enumerate(courses) for c in course}
+        repeat = self.bond.repeat_layer
+
+        for course in courses:
+            sources = [stacked.get((root[c], depth[c] - self.period)) if depth[c] >= self.period else None
+                       for c in course]
+            if any(s is None for s in sources) or len(set(course_of[s] for s in sources)) != 1 or \
+                    len(courses[course_of[sources[0]]]) != len(course):
+                continue
+
+            corner_source = dict(zip(course, sources))
+            layer_source: Dict[int, int] = {}
+            pairs, pair_sources = [], []
+            same = True
+            for c, src in zip(course, sources):
+                # layers of both corners by wall
+                source_layers = {int(self.layer_wall[ls]): ls for ls in self.corner_layers[src]}
+                if len(self.corner_layers[c]) != len(self.corner_layers[src]) or \
+                        len(source_layers) != len(self.corner_layers[src]):
+                    same = False
+                    break
+                for l in self.corner_layers[c]:
+                    ls = source_layers.get(int(self.layer_wall[l]))
+                    if ls is None:
+                        same = False
+                        break
+                    info, info_source = self.corner_layer[(c, l)], self.corner_layer[(src, ls)]
+                    if layer_source.setdefault(l, ls) != ls or \
+                            self.initial.layer_x[l] != self.initial.layer_x[ls] or \
+                            self.initial.layer_length[l] != self.initial.layer_length[ls] or \
+                            (self.layer_index[l] - self.layer_index[ls]) % repeat != 0 or \
+                            sorted(corner_source.get(o, -1) for o in self.corners_of_layer[l]) != \
+                            sorted(self.corners_of_layer[ls]) or \
+                            (info.start_x, info.corner_lengths, info.left) != \
+                            (info_source.start_x, info_source.corner_lengths, info_source.left):
+                        same = False
+                        break
+                    pairs.append(self.pair_index[(c, l)])
+                    pair_sources.append(self.pair_index[(src, ls)])
+                if not same:
+                    break
+            if not same:
+                continue
+
+            self.replicas[tuple(course)] = CourseReplica(np.array(course), np.array(sources),
+                                                         np.array(list(layer_source.keys()), dtype=int),
+                                                         np.array(list(layer_source.values()), dtype=int),
+                                                         np.array(pairs, dtype=int), np.array(pair_sources, dtype=int))
+
+    def replicate(self, course: List[int]) -> bool:
+        """
+        solves the layer by copying the solution of the layer one period below
+        (layers are solved from bottom to top, so that one has already been solved)
+        :param course: corners of the layer
+        :return: True if the layer has been solved, False if it needs to be solved as usual
+        """
+        replica = self.replicas.get(tuple(course))
+        if replica is None or np.any(self.state.corner_touched[replica.corners]):
+            return False
+
+        # corners on top of each other continue the plan of the corner below (+1 for each layer)
+        self.state.corner_plan_offset[replica.corners] = self.state.corner_plan_offset[replica.corner_sources] + \
+            self.period
+        self.state.corner_touched[replica.corners] = True
+        self.state.layer_x[replica.layers] = self.state.layer_x[replica.layer_sources]
+        self.state.layer_length[replica.layers] = self.state.layer_length[replica.layer_sources]
+        self.state.holes[replica.pairs] = self.state.holes[replica.pair_sources]
+        self.state.dirty[replica.pairs] = self.state.dirty[replica.pair_sources]
+        return True
+
+    def get_layer_plan_index(self, layer: int) -> int:
+        """
+        see WallLayer.get_layer_plan_index
+        """
+        return int(self.layer_index[layer] + self.state.wall_plan_offset[self.layer_wall[layer]])
+
+    def relative_x_offset(self, layer: int, x: float, length: float) -> float:
+        """
+        see WallLayer.relative_x_offset
+        :param layer: the layer
+        :param x: x coordinate of the layers center
+        :param length: length of the layer
+        """
+        wall = self.layer_wall[layer]
+        left = x - length / 2.0
+        right = x + length / 2.0
+        if self.wall_reversed[wall]:
+            return round(self.wall_highest_x[wall] - max(left, right), 6)
+        return round(min(left, right) - self.wall_lowest_x[wall], 6)
+
+    def reduced_layer(self, corner: int, layer: int) -> Tuple[float, float]:
+        """
+        see Corn.reduce_layer_length and WallLayer.move_edge
+        :return: x coordinate of the center and length the layer has after the corner has been applied to it
+        """
+        x = self.state.layer_x[layer]
+        length = self.state.layer_length[layer]
+        info = self.corner_layer[(corner, layer)]
+
+        lengths = info.corner_lengths
+        corner_length = lengths[self.state.corner_plan_offset[corner] % len(lengths)] if len(lengths) > 0 else 0
+
+        left = x - length / 2.0
+        right = x + length / 2.0
+        is_left = abs(info.start_x - left) < abs(info.start_x - right)
+        if is_left:
+            diff = info.start_x - left
+        else:
+            diff = right - info.start_x
+        diff = round(diff, 6)
+        reduction = round(corner_length + diff, 6)
+
+        # see WallLayer.reduce_length
+        if reduction >= length:
+            return x, length
+        if is_left:
+            x += reduction / 2.0
+        else:
+            x -= reduction / 2.0
+        return x, round(length - reduction, 6)
+
+    def reduce_layer_length(self, corner: int, layer: int):
+        """
+        see Corn.reduce_layer_length
+        """
+        x, length = self.reduced_layer(corner, layer)
+        if x != self.state.layer_x[layer] or length != self.state.layer_length[layer]:
+            self.state.layer_x[layer], self.state.layer_length[layer] = x, length
+            self.state.dirty[self.layer_pairs[layer]] = True
+
+    def reduce_corner_layer_length(self, corner: int):
+        """
+        see Corn.reduce_corner_layer_length
+        """
+        for layer in self.corner_layers[corner]:
+            self.reduce_layer_length(corner, layer)
+
+    def set_wall_plan_offset(self, wall: int, offset: int):
+        """
+        see WallLayerGroup.set_plan_offset
+        """
+        assert not self.state.wall_touched[wall]
+        self.state.wall_plan_offset[wall] = offset
+        self.state.wall_touched[wall] = True
+        self.state.dirty[self.wall_pairs[wall]] = True
+
+    def set_corner_plan_offset(self, corner: int, offset: int):
+        """
+        see Corn.set_plan_offset
+        """
+        assert not self.state.corner_touched[corner]
+        self.state.corner_plan_offset[corner] = offset
+        self.state.corner_touched[corner] = True
+        self.state.dirty[self.corner_pairs[corner]] = True
+
+    def __holes(self, corner: int, layer: int) -> float:
+        """
+        see Solver.holes_between_corner_and_layer
+        :return: the holes the corner leaves in given layer with the current state
+        """
+        leftover_left, leftover_right = 0, 0
+        wall = self.layer_wall[layer]
+        for l in self.corner_layers[corner]:
+            if self.layer_wall[l] == wall:
+                x, length = self.reduced_layer(corner, l)
+                leftover_left, leftover_right, num_bricks = self.bond.leftover_of_layer(
+                    length, self.get_layer_plan_index(l), self.relative_x_offset(l, x, length),
+                    self.wall_reversed[wall])
+                if num_bricks == 0 or leftover_right + leftover_left == length:
+                    leftover_left = 0
+                    leftover_right = 0
+        return leftover_left if self.corner_layer[(corner, layer)].left else leftover_right
+
+    def holes_between_corner_and_layer(self, corner: int, layer: int) -> float:
+        """
+        see Solver.holes_between_corner_and_layer, only calculated again if the corner or layer changed
+        :return: the holes the corner leaves in given layer with the current state
+        """
+        i = self.pair_index[(corner, layer)]
+        if self.state.dirty[i]:
+            self.state.holes[i] = self.__holes(corner, layer)
+            self.state.dirty[i] = False
+        return self.state.holes[i]
+
+    def reduced_layers(self, corner: int, layer: int, corner_offsets: np.array) -> Tuple[np.array, np.array]:
+        """
+        reduced_layer for many plan offsets of the corner at once
+        :return: x coordinates of the center and lengths the layer has after the corner has been applied to it
+        """
+        x = np.full(len(corner_offsets), self.state.layer_x[layer])
+        length = np.full(len(corner_offsets), self.state.layer_length[layer])
+        info = self.corner_layer[(corner, layer)]
+
+        lengths = np.array(info.corner_lengths, dtype=float)
+        corner_length = lengths[corner_offsets % len(lengths)] if len(lengths) > 0 else np.zeros(len(corner_offsets))
+
+        left = x - length / 2.0
+        right = x + length / 2.0
+        is_left = np.abs(info.start_x - left) < np.abs(info.start_x - right)
+        diff = np.round(np.where(is_left, info.start_x - left, right - info.start_x), 6)
+        reduction = np.round(corner_length + diff, 6)
+
+        # see WallLayer.reduce_length
+        reduced = reduction < length
+        x = np.where(reduced, np.where(is_left, x + reduction / 2.0, x - reduction / 2.0), x)
+        return x, np.where(reduced, np.round(length - reduction, 6), length)
+
+    def __holes_with_offsets(self, corner: int, layer: int, wall_offsets: np.array,
+                             corner_offsets: np.array) -> np.array:
+        """
+        __holes for many plan offsets of the layers wall and of the corner at once
+        :return: the holes the corner would leave in given layer with each pair of offsets
+        """
+        leftover_left, leftover_right = np.zeros(len(wall_offsets)), np.zeros(len(wall_offsets))
+        wall = self.layer_wall[layer]
+        for l in self.corner_layers[corner]:
+            if self.layer_wall[l] == wall:
+                x, length = self.reduced_layers(corner, l, corner_offsets)
+                left, right = x - length / 2.0, x + length / 2.0
+                if self.wall_reversed[wall]:
+                    x_offsets = np.round(self.wall_highest_x[wall] - np.maximum(left, right), 6)
+                else:
+                    x_offsets = np.round(np.minimum(left, right) - self.wall_lowest_x[wall], 6)
+                leftover_left, leftover_right, num_bricks = self.bond.leftovers_of_layers(
+                    length, self.layer_index[l] + wall_offsets, x_offsets, bool(self.wall_reversed[wall]))
+                empty = (num_bricks == 0) | (leftover_right + leftover_left == length)
+                leftover_left = np.where(empty, 0, leftover_left)
+                leftover_right = np.where(empty, 0, leftover_right)
+        return leftover_left if self.corner_layer[(corner, layer)].left else leftover_right
+
+    def holes_with_wall_plan_offsets(self, corner: int, layer: int, offsets: List[int]) -> List[float]:
+        """
+        scores all candidate plan offsets of the layers wall at once, without changing the state
+        :return: the holes the corner would leave in given layer with each of the offsets
+        """
+        offsets = np.asarray(offsets, dtype=int)
+        corner_offsets = np.full(len(offsets), self.state.corner_plan_offset[corner])
+        return self.__holes_with_offsets(corner, layer, offsets, corner_offsets).tolist()
+
+    def holes_with_corner_plan_offsets(self, corner: int, layer: int, offsets: List[int]) -> List[float]:
+        """
+        scores all candidate plan offsets of the corner at once, without changing the state
+        :return: the holes the corner would leave in given layer with each of the offsets
+        """
+        offsets = np.asarray(offsets, dtype=int)
+        wall_offsets = np.full(len(offsets), self.state.wall_plan_offset[self.layer_wall[layer]])
+        return self.__holes_with_offsets(corner, layer, wall_offsets, offsets).tolist()
+
+    def holes_of_layer(self, layer: int, corners: List[int], wall_offset: int, corner_offsets: List[int]) -> float:
+        """
+        holes the given corners leave in the layer, if only they reduce the layer (starting from the initial state)
+        and the wall and the corners have the given plan offsets. Does not change the state
+        :param layer: the layer
+        :param corners: the corners of the layer
+        :param wall_offset: plan offset of the layers wall
+        :param corner_offsets: plan offset of each corner
+        :return: the holes of all the corners in this layer
+        """
+        wall = self.layer_wall[layer]
+        state = self.state
+        saved = (state.layer_x[layer], state.layer_length[layer], state.wall_plan_offset[wall],
+                 [state.corner_plan_offset[c] for c in corners])
+        try:
+            state.layer_x[layer] = self.initial.layer_x[layer]
+            state.layer_length[layer] = self.initial.layer_length[layer]
+            state.wall_plan_offset[wall] = wall_offset
+            for c, offset in zip(corners, corner_offsets):
+                state.corner_plan_offset[c] = offset
+            for c in corners:
+                state.layer_x[layer], state.layer_length[layer] = self.reduced_layer(c, layer)
+            return sum(self.__holes(c, layer) for c in corners)
+        finally:
+            state.layer_x[layer], state.layer_length[layer], state.wall_plan_offset[wall] = saved[:3]
+            for c, offset in zip(corners, saved[3]):
+                state.corner_plan_offset[c] = offset
+
+    def holes_of_corners(self, corners: List[int]) -> float:
+        """
+        :param corners: some corners
+        :return: the holes between given corners and their layers with the current state
+        """
+        val = 0
+        for c in corners:
+            for l in self.corner_layers[c]:
+                val += self.holes_between_corner_and_layer(c, l)
+        return val
+
+    def all_holes(self) -> float:
+        """
+        :return: the number of holes between all corners and their layers with the current state
+        """
+        val = 0
+        for c, l in self.pairs:
+            val += self.holes_between_corner_and_layer(c, l)
+        return val
+
+    def write_back(self):
+        """
+        applies the current state to the actual corners, layers and walls
+        """
+        for i, layer in enumerate(self.layers):
+            if self.state.layer_x[i] != self.initial.layer_x[i] or \
+                    self.state.layer_length[i] != self.initial.layer_length[i]:
+                layer.translation[0] = self.state.layer_x[i]
+                layer.length = self.state.layer_length[i]
+        for i, wall in enumerate(self.walls):
+            wall.plan_offset = int(self.state.wall_plan_offset[i])
+            wall.touched = bool(self.state.wall_touched[i])
+        for i, corner in enumerate(self.corners):
+            corner.plan_offset = int(self.state.corner_plan_offset[i])
+            corner.touched = bool(self.state.corner_touched[i])
@@ -4,6 +4,7 @@ import quaternion
 from typing import List, Tuple
 
 from die_mathe.line import Line
+from die_mathe.segment_set import SegmentSet
 
 
 class WallLayer:
@@ -12,6 +13,9 @@ class WallLayer:
     """
     def __init__(self, parent: 'WallLayerGroup', length: float, translation: np.array = np.array([0.0, 0.0, 0.0]), height: float = None):
         self.parent = parent
+        self.local_points = None  # left edge, center and right edge relative to the wall, see get_points
+        self.world_points = None  # same in world coordinates
+        self.world_transform = None  # (parent, parent.transform_version) the world points were calculated with
         self.translation = translation  # relative to walls translation
         self.height = parent.module.height if height is None else height
         self.length = length
@@ -20,6 +24,57 @@ class WallLayer:
         self.left_connections: List['WallLayer'] = []
         self.right_connections: List['WallLayer'] = []
 
+    @property
+    def translation(self) -> np.array:
+        return self._translation
+
+    @translation.setter
+    def translation(self, translation: np.array):
+        self._translation = translation
+        self.invalidate()
+
+    @property
+    def length(self) -> float:
+        return self._length
+
+    @length.setter
+    def length(self, length: float):
+        self._length = length
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Forgets the cached edges and center. Assigning translation or length does this automatically,
+        changing translation in place (like translation[0] += 1) needs to call this
+        """
+        self.local_points = None
+        self.world_points = None
+        self.world_transform = None
+
+    def get_points(self, relative: bool = False) -> np.array:
+        """
+        The points are calculated once and kept until the layer or the transformation of its wall changes
+        :param relative: whether we want the relative or world coordinates
+        :return: 3 x 3 array of the left edge, the center and the right edge of this layer (don't modify it)
+        """
+        if self.local_points is None:
+            left = self.translation.copy()
+            left[0] -= self.length / 2.0
+            right = self.translation.copy()
+            right[0] += self.length / 2.0
+            self.local_points = np.array([left, self.translation, right])
+        if relative:
+            return self.local_points
+
+        transform = (self.parent, self.parent.transform_version)
+        if self.world_points is None or self.world_transform[0] is not transform[0] or \
+                self.world_transform[1] != transform[1]:
+            # one point at a time, so the results are exactly the ones of quaternion.rotate_vectors
+            m = self.parent.get_rotation_matrix()
+            self.world_points = np.array([m @ p for p in self.local_points]) + self.parent.translation
+            self.world_transform = transform
+        return self.world_points
+
     def combine(self, other: 'WallLayer'):
         """
         Combines two wall layers to one. Only makes sense if the two layers have the same orientation,
@@ -73,10 +128,9 @@ class WallLayer:
         """
         :return: layer index that self has inside its assigned walllayergroup
         """
-        for i, l in enumerate(self.parent.get_sorted_layers()):
-            if self in l:
-                return i
-        assert False
+        index = self.parent.get_course_index(self)
+        assert index is not None
+        return index
 
     def get_layer_plan_index(self):
         """
@@ -96,13 +150,7 @@ class WallLayer:
         :param relative: whether we want the relative or world coordinates of the center
         :return: coordinates of the left edge of this layer
         """
-        ret = self.translation.copy()
-        ret[0] -= self.length/2.0
-
-        if not relative:
-            ret = quaternion.rotate_vectors(self.parent.get_rotation(), ret)
-            ret += self.parent.get_translation()
-        return ret
+        return self.get_points(relative)[0].copy()
 
     @property
     def right_edge(self):
@@ -116,13 +164,7 @@ class WallLayer:
         :param relative: whether we want the relative or world coordinates of the center
         :return: coordinates of the right edge of this layer
         """
-        ret = self.translation.copy()
-        ret[0] += self.length / 2.0
-
-        if not relative:
-            ret = quaternion.rotate_vectors(self.parent.get_rotation(), ret)
-            ret += self.parent.get_translation()
-        return ret
+        return self.get_points(relative)[2].copy()
 
     def relative_x_offset(self) -> float:
         """
@@ -150,12 +192,7 @@ class WallLayer:
         :param relative: whether we want the relative or world coordinates of the center
         :return: coordinates of the center of this wall_layer
         """
-        ret = self.translation.copy()
-
-        if not relative:
-            ret = quaternion.rotate_vectors(self.parent.get_rotation(), ret)
-            ret += self.parent.get_translation()
-        return ret
+        return self.get_points(relative)[1].copy()
 
     def is_touching_at_endpoints(self, other: 'WallLayer', tolerance: float = 1e-8) -> bool:
         """
@@ -164,12 +201,11 @@ class WallLayer:
         :param tolerance: how close the two edge points have to be
         :return:
         """
-        a = np.allclose(self.right_edge, other.left_edge, atol=tolerance)
-        b = np.allclose(self.right_edge, other.right_edge, atol=tolerance)
-        c = np.allclose(self.left_edge, other.left_edge, atol=tolerance)
-        d = np.allclose(self.left_edge, other.right_edge, atol=tolerance)
-
-        return a or b or c or d
+        # np.allclose(own edge, other edge, atol=tolerance) for all four pairs of edges at once
+        edges = self.get_points()[[0, 2]]
+        other_edges = other.get_points()[[0, 2]]
+        close = np.abs(edges[:, None] - other_edges[None]) <= tolerance + 1e-5 * np.abs(other_edges[None])
+        return bool(np.any(np.all(close, axis=2)))
 
     def is_overlapping(self, other: 'WallLayer'):
         """
@@ -178,14 +214,13 @@ class WallLayer:
         :param other: the other wall_layer
         :return: whether the lines are overlapping
         """
-        l1 = Line(self.left_edge, self.right_edge)
-        l2 = Line(other.left_edge, other.right_edge)
-        a = l1.on_line(other.left_edge, between=True)
-        b = l1.on_line(other.right_edge, between=True)
-
-        c = l2.on_line(self.left_edge, between=True)
-        d = l2.on_line(self.right_edge, between=True)
-        return (a or b) and (c or d)
+        points = self.get_points()
+        other_points = other.get_points()
+        segments = SegmentSet.from_points([points[0], other_points[0]], [points[2], other_points[2]])
+        # other edges on our line, our edges on the other line
+        a, b, c, d = segments.contains(np.array([other_points[0], other_points[2], points[0], points[2]]),
+                                       index=np.array([0, 0, 1, 1]))
+        return bool((a or b) and (c or d))
 
     def is_touching(self, other: 'WallLayer') -> bool:
         """
@@ -241,6 +276,7 @@ class WallLayer:
                 self.translation[0] += length / 2.0
             else:
                 self.translation[0] -= length / 2.0
+            self.invalidate()
         self.length -= length
         self.length = round(self.length, 6)
         return True
@@ -1,11 +1,12 @@
 import math
-from typing import List, Optional, Union
+from typing import List, Optional, Union, Tuple
 
 import numpy as np
 import quaternion
 
 from detailing.wall import Wall
 from detailing.wall_layer import WallLayer
+from die_mathe.segment_set import SegmentSet
 from masonry.brick import BrickInformation, Brick
 
 
@@ -18,6 +19,8 @@ class WallLayerGroup:
     def __init__(self, module: BrickInformation, wall: Wall):
         self.module = module
         self.layers: List[WallLayer] = []
+        self.transform_version = 0  # increased whenever rotation or translation change, see WallLayer.get_points
+        self.rotation_matrix = None
         self.rotation = np.quaternion(1, 0, 0, 0)
         self.translation = np.array([0, 0, 0])  # of wall mid
         self.id = WallLayerGroup.idd
@@ -29,10 +32,29 @@ class WallLayerGroup:
 
         # dynamic attributes
         self.touched = False  # MAYDO just for testing purposes
-        self.lowest_local_x = None  # MAYDO test maybe remove
-        self.highest_local_x = None  # MAYDO test maybe remove
         self.reversed = False
 
+        # caches, see invalidate
+        self.courses: Optional[List[List[WallLayer]]] = None  # layers grouped by height sorted by z
+        self.course_index: Optional[dict] = None  # id of a layer -> index of its course
+        self.x_range: Optional[Tuple[Optional[float], Optional[float]]] = None  # lowest and highest local x
+
+    def __getstate__(self):
+        # the course index is keyed by the ids of the layers, which change when copied
+        state = self.__dict__.copy()
+        state["courses"] = None
+        state["course_index"] = None
+        return state
+
+    def invalidate(self):
+        """
+        Forgets the courses and the x range of the layers.
+        Needs to be called whenever layers are added, split or combined
+        """
+        self.courses = None
+        self.course_index = None
+        self.x_range = None
+
     def set_plan_offset(self, offset: int):
         """
         sets the plan offset of the wall plan for applied bond to start with
@@ -81,8 +103,37 @@ class WallLayerGroup:
                     l.translation = local_mid
                     l.parent = self
                     self.layers.append(l)
+                self.invalidate()
+                other.invalidate()
         return to_combine and combined
 
+    @property
+    def rotation(self) -> quaternion:
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, rotation: quaternion):
+        self._rotation = rotation
+        self.rotation_matrix = None
+        self.transform_version += 1
+
+    @property
+    def translation(self) -> np.array:
+        return self._translation
+
+    @translation.setter
+    def translation(self, translation: np.array):
+        self._translation = translation
+        self.transform_version += 1
+
+    def get_rotation_matrix(self) -> np.array:
+        """
+        :return: the rotation of this wall as 3 x 3 matrix (the same one quaternion.rotate_vectors uses)
+        """
+        if self.rotation_matrix is None:
+            self.rotation_matrix = quaternion.as_rotation_matrix(np.asarray(self.rotation, dtype=np.quaternion))
+        return self.rotation_matrix
+
     def get_rotation(self) -> quaternion:
         """
         returns the rotation part of this walls transformation
@@ -95,80 +146,134 @@ class WallLayerGroup:
         """
         return self.translation.copy()
 
-    def get_lowest_local_x(self) -> Optional[float]:
+    def get_line_key(self) -> tuple:
+        """
+        Walls can only be combined (see combine) if they have the same module and lie on the same line
+        (same direction or opposite directions, parallel z axes and no offset perpendicular to the line).
+        :return: a key that is the same for all walls on the same line
         """
-        :return: the smallest local x coordinate of all of the layers
+        rotation = self.get_rotation()
+        x = quaternion.rotate_vectors(rotation, np.array([1.0, 0.0, 0.0]))
+        y = quaternion.rotate_vectors(rotation, np.array([0.0, 1.0, 0.0]))
+        z = quaternion.rotate_vectors(rotation, np.array([0.0, 0.0, 1.0]))
+
+        def canonical(v: np.array) -> Tuple[np.array, float]:
+            # v and -v describe the same line
+            v = np.round(v, 6) + 0.0
+            sign = 1.0 if v[np.nonzero(v)[0][0]] > 0 else -1.0
+            return v * sign, sign
+
+        x, sign = canonical(x)
+        z, _ = canonical(z)
+        offset = round(float(np.dot(self.get_translation(), y * sign)), 6) + 0.0
+        grid = None if self.module.grid is None else tuple(np.round(self.module.grid, 6).tolist())
+        module = (self.module.length, self.module.width, self.module.height, grid)
+        return module, tuple(x.tolist()), tuple(z.tolist()), offset
+
+    def get_line_interval(self) -> Optional[Tuple[float, float]]:
+        """
+        :return: smallest and biggest coordinate of the edges of all layers along the line of the wall
+        (in the direction of get_line_key), None if there are no layers
+        """
+        if len(self.layers) == 0:
+            return None
+        x = quaternion.rotate_vectors(self.get_rotation(), np.array([1.0, 0.0, 0.0]))
+        x = np.round(x, 6) + 0.0
+        x = x if x[np.nonzero(x)[0][0]] > 0 else -x
+        edges = np.array([edge for l in self.layers for edge in (l.left_edge, l.right_edge)])
+        coordinates = edges @ x
+        return float(np.min(coordinates)), float(np.max(coordinates))
+
+    def get_x_range(self) -> Tuple[Optional[float], Optional[float]]:
         """
-        if self.lowest_local_x is not None:
-            return self.lowest_local_x
+        The range is calculated once and then kept until layers are added, split or combined (see invalidate),
+        so reducing the length of the layers (like the corners do) does not change it
+        :return: the smallest and the biggest local x coordinate of all of the layers, None if there are no layers
+        """
+        if self.x_range is None:
+            if len(self.layers) > 0:
+                lefts = [l.get_left_edge(True)[0] for l in self.layers]
+                rights = [l.get_right_edge(True)[0] for l in self.layers]  # TODO maybe unnecessary
+                self.x_range = round(min(min(lefts), min(rights)), 6), round(max(max(lefts), max(rights)), 6)
+            else:
+                self.x_range = None, None
+        return self.x_range
 
-        if len(self.layers) > 0:
-            lefts = min([l.get_left_edge(True)[0] for l in self.layers])
-            rights = min([l.get_right_edge(True)[0] for l in self.layers])  # TODO maybe unnecessary
-            return round(min(lefts, rights), 6)
-        return None
+    def get_lowest_local_x(self) -> Optional[float]:
+        """
+        :return: the smallest local x coordinate of all of the layers (see get_x_range)
+        """
+        return self.get_x_range()[0]
 
     def get_highest_local_x(self) -> Optional[float]:
         """
-        :return: the biggest local x coordinate of all of the layers
+        :return: the biggest local x coordinate of all of the layers (see get_x_range)
         """
-        if self.highest_local_x is not None:
-            return self.highest_local_x
-
-        if len(self.layers) > 0:
-            lefts = max([l.get_left_edge(True)[0] for l in self.layers])  # TODO maybe unnecessary
-            rights = max([l.get_right_edge(True)[0] for l in self.layers])
-            return round(max(lefts, rights), 6)
-        return None
+        return self.get_x_range()[1]
 
     def set_x_offsets(self):
         """
         "freezes" the x offsets of all layers of this wall to current values
         """
-        if self.lowest_local_x is None:
-            self.lowest_local_x = self.get_lowest_local_x()
-
-        if self.highest_local_x is None:
-            self.highest_local_x = self.get_highest_local_x()
+        self.get_x_range()
 
-    def get_sorted_layers(self, grouped: bool = True) -> List[Union[WallLayer, List[WallLayer]]]:
+    def get_courses(self) -> List[List[WallLayer]]:
         """
-        :return: a list containing lists of layers that share the same z height sorted by z
+        The courses are calculated once and then kept until layers are added, split or combined (see invalidate)
+        :return: a list containing lists of layers that share the same z height sorted by z (don't modify it)
         """
+        if self.courses is not None:
+            return self.courses
+
         layers = self.layers.copy()
         layers.sort(key=lambda x: x.translation[2])
-        if not grouped:
-            return layers
 
-        ret = []
-        curr = []
-        last_height = round(self.layers[0].translation[2], 6)
+        courses = []
+        if len(layers) > 0:
+            curr = []
+            last_height = round(self.layers[0].translation[2], 6)
+
+            for layer in layers:
+                if last_height == round(layer.translation[2], 6):
+                    curr.append(layer)
+                else:
+                    courses.append(curr)
+                    curr = [layer]
+                    last_height = round(layer.translation[2], 6)
+            if len(curr) > 0:
+                courses.append(curr)
+
+        self.courses = courses
+        self.course_index = {id(layer): i for i, course in enumerate(courses) for layer in course}
+        return self.courses
+
+    def get_course_index(self, layer: WallLayer) -> Optional[int]:
+        """
+        :param layer: a layer
+        :return: the index of the course (see get_courses) given layer is in, None if it is not a layer of this wall
+        """
+        self.get_courses()
+        return self.course_index.get(id(layer))
 
-        for layer in layers:
-            if last_height == round(layer.translation[2], 6):
-                curr.append(layer)
-                if len(curr) > 1:
-                    pass
-            else:
-                ret.append(curr)
-                curr = [layer]
-                last_height = round(layer.translation[2], 6)
-        if len(curr) > 0:
-            ret.append(curr)
-        return ret
+    def get_sorted_layers(self, grouped: bool = True) -> List[Union[WallLayer, List[WallLayer]]]:
+        """
+        :return: a list containing lists of layers that share the same z height sorted by z
+        """
+        courses = self.get_courses()
+        if not grouped:
+            return [layer for course in courses for layer in course]
+        return [course.copy() for course in courses]
 
     def top_of_layer(self, layer: WallLayer) -> Optional[List[WallLayer]]:
         """
         :param layer: layer we need the top neighbours of
         :return: a list of all layers in this wall that are exactly 1 layer above given layer
         """
-        if layer not in self.layers:
+        i = self.get_course_index(layer)
+        if i is None:
             return None
-
-        sorted_layers = self.get_sorted_layers()
-        for i, layers in enumerate(sorted_layers):
-            if layer in layers and i < len(sorted_layers) - 1:
-                return sorted_layers[i + 1]
+        if i < len(self.courses) - 1:
+            return self.courses[i + 1].copy()
         return []
 
     def bottom_of_layer(self, layer: WallLayer) -> Optional[List[WallLayer]]:
@@ -176,13 +281,11 @@ class WallLayerGroup:
         :param layer: layer we need the top neighbours of
         :return: a list of all layers in this wall that are exactly 1 layer above given layer
         """
-        if layer not in self.layers:
+        i = self.get_course_index(layer)
+        if i is None:
             return None
-
-        sorted_layers = self.get_sorted_layers()
-        for i, layers in enumerate(sorted_layers):
-            if layer in layers and i > 0:
-                return sorted_layers[i - 1]
+        if i > 0:
+            return self.courses[i - 1].copy()
         return []
 
     def is_touching_at_endpoints(self, other: 'WallLayerGroup'):
@@ -205,12 +308,12 @@ class WallLayerGroup:
         :param other:
         :return:
         """
-        # TODO make faster ^^
-        for l1 in self.layers:
-            for l2 in other.layers:
-                if l1.is_touching(l2):
-                    return True
-        return False
+        if len(self.layers) == 0 or len(other.layers) == 0:
+            return False
+        segments = SegmentSet.from_points([l.left_edge for l in self.layers], [l.right_edge for l in self.layers])
+        others = SegmentSet.from_points([l.left_edge for l in other.layers], [l.right_edge for l in other.layers])
+        _, touching = segments.intersections(others)
+        return bool(np.any(touching))
 
     def apply_openings(self):
         """
@@ -222,6 +325,7 @@ class WallLayerGroup:
                 if len(split) > 0:
                     self.layers.remove(layer)
                     self.layers.extend(split)
+                    self.invalidate()
 
     def get_opening_lintels(self) -> List['Brick']:
         """
@@ -267,6 +371,7 @@ class WallLayerGroup:
             translation[2] = height * 0.5 - leftover * 0.5  # TODO: Check if this is correct
             wall_layer = WallLayer(ret, length, translation=translation, height=leftover)
             ret.layers.append(wall_layer)
+        ret.invalidate()
 
         ret.openings = wall.openings.copy()
         return ret
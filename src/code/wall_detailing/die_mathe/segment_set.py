@@ -0,0 +1,155 @@
+from typing import List, Tuple, Optional
+
+import numpy as np
+
+from die_mathe.line import Line
+
+
+class SegmentSet:
+    """
+    Many lines (segments between two points) at once, stored as an N x 2 x 3 array.
+    Does the same calculations as Line, but for many segments / pairs of segments in one go
+    """
+    def __init__(self, segments: np.array):
+        """
+        :param segments: N x 2 x 3 array, segments[i] are the two points p1, p2 of the i-th segment
+        """
+        self.segments = np.asarray(segments, dtype=float).reshape(-1, 2, 3)
+
+    @classmethod
+    def from_points(cls, p1: np.array, p2: np.array) -> 'SegmentSet':
+        """
+        :param p1: N x 3 first points
+        :param p2: N x 3 second points
+        :return: the segments from p1[i] to p2[i]
+        """
+        return cls(np.stack([np.asarray(p1, dtype=float).reshape(-1, 3),
+                             np.asarray(p2, dtype=float).reshape(-1, 3)], axis=1))
+
+    @classmethod
+    def from_lines(cls, lines: List[Line]) -> 'SegmentSet':
+        """
+        :param lines: some lines
+        :return: the segments of the lines
+        """
+        return cls.from_points([l.p1 for l in lines], [l.p2 for l in lines])
+
+    def __len__(self):
+        return len(self.segments)
+
+    @property
+    def p1(self) -> np.array:
+        return self.segments[:, 0]
+
+    @property
+    def p2(self) -> np.array:
+        return self.segments[:, 1]
+
+    def lengths(self) -> np.array:
+        """
+        :return: length of each segment
+        """
+        return np.linalg.norm(self.p1 - self.p2, axis=1)
+
+    def directions(self) -> np.array:
+        """
+        :return: normalized direction (from p2 to p1, like in Line.intersection) of each segment
+        """
+        diff = self.p1 - self.p2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return diff / np.linalg.norm(diff, axis=1)[:, None]
+
+    def all_pairs(self, other: 'SegmentSet') -> np.array:
+        """
+        :param other: other segments
+        :return: M x 2 indices of all pairs (segment of self, segment of other)
+        """
+        i, j = np.meshgrid(np.arange(len(self)), np.arange(len(other)), indexing="ij")
+        return np.column_stack([i.reshape(-1), j.reshape(-1)])
+
+    def intersections(self, other: 'SegmentSet', pairs: Optional[np.array] = None) -> Tuple[np.array, np.array]:
+        """
+        Calculates the intersections of the lines of pairs of segments (see Line.intersection).
+        Pairs of horizontal segments (like the layers of our walls) are solved in 2D, the rest as 3 x 3 systems
+        :param other: other segments
+        :param pairs: M x 2 indices (segment of self, segment of other), all pairs if None
+        :return: M x 3 intersection points and M bools whether there is an intersection (the point is nan if not)
+        """
+        pairs = self.all_pairs(other) if pairs is None else np.asarray(pairs, dtype=int).reshape(-1, 2)
+        p1 = self.p1[pairs[:, 0]]
+        p2 = other.p1[pairs[:, 1]]
+        direction1 = self.directions()[pairs[:, 0]]
+        direction2 = other.directions()[pairs[:, 1]]
+        b = p2 - p1
+
+        # p1 + t0 * direction1 + t2 * (1, 1, 1) = p2 + t1 * direction2
+        t = np.full((len(pairs), 3), np.nan)
+        planar = (direction1[:, 2] == 0) & (direction2[:, 2] == 0)
+        if np.any(planar):
+            # the z row only contains t2, which leaves a 2 x 2 system for t0, t1
+            d1, d2, bb = direction1[planar], direction2[planar], b[planar]
+            t2 = bb[:, 2]
+            rx, ry = bb[:, 0] - t2, bb[:, 1] - t2
+            det = d2[:, 0] * d1[:, 1] - d1[:, 0] * d2[:, 1]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t0 = (d2[:, 0] * ry - d2[:, 1] * rx) / det
+                t1 = (d1[:, 0] * ry - d1[:, 1] * rx) / det
+            t[planar] = np.where((det != 0)[:, None], np.column_stack([t0, t1, t2]), np.nan)
+
+        rest = ~planar
+        if np.any(rest):
+            a = np.stack([direction1[rest], -direction2[rest], np.ones((np.count_nonzero(rest), 3))], axis=2)
+            solvable = np.linalg.det(a) != 0  # np.linalg.solve would raise a LinAlgError
+            ts = np.full((len(a), 3), np.nan)
+            if np.any(solvable):
+                ts[solvable] = np.linalg.solve(a[solvable], b[rest][solvable][..., None])[..., 0]
+            t[rest] = ts
+
+        points1 = p1 + t[:, 0:1] * direction1
+        points2 = p2 + t[:, 1:2] * direction2
+        valid = np.all(np.isclose(points1, points2), axis=1)
+        points1[~valid] = np.nan
+        return points1, valid
+
+    def contains(self, points: np.array, index: Optional[np.array] = None, between: bool = True,
+                 tolerance: float = 1e-9) -> np.array:
+        """
+        Checks if the points lie on the segments (see Line.on_line)
+        :param points: M x 3 points
+        :param index: the segment to check for each point, the i-th segment for the i-th point if None
+        :param between: if the point should be between the two points of the segment
+        :param tolerance: see Line.on_line
+        :return: M bools
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        index = np.arange(len(points)) if index is None else np.asarray(index, dtype=int)
+        p1, p2 = self.p1[index], self.p2[index]
+        diff12 = p1 - p2
+        diff1p = p1 - points
+        diffp2 = points - p2
+
+        a = np.linalg.norm(diff12, axis=1) + tolerance
+        b = np.linalg.norm(diff1p, axis=1)
+        c = np.linalg.norm(diffp2, axis=1)
+        inside = (a ** 2 + b ** 2 >= c ** 2) & (a ** 2 + c ** 2 >= b ** 2) if between else np.ones(len(points), bool)
+
+        endpoint = np.all(np.abs(diffp2) <= 1e-8, axis=1) | np.all(np.abs(diff1p) <= 1e-8, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            d = np.linalg.norm(np.cross(diff12, diff1p), axis=1) / c
+        return endpoint | ((d < 1e-9) & inside)
+
+    def distances(self, points: np.array, index: Optional[np.array] = None) -> np.array:
+        """
+        distances of points to the (endless) lines of the segments (see Line.distance_to_line)
+        :param points: M x 3 points
+        :param index: the segment for each point, the i-th segment for the i-th point if None
+        :return: M distances
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        index = np.arange(len(points)) if index is None else np.asarray(index, dtype=int)
+        p1, p2 = self.p1[index], self.p2[index]
+        l = p2 - p1
+        p = points - p1
+        projection_distance = np.einsum("ij,ij->i", p, l) / np.einsum("ij,ij->i", l, l)
+        projected_points = p1 + projection_distance[:, None] * l
+        return np.linalg.norm(points - projected_points, axis=1)
@@ -1,33 +1,37 @@
-from typing import List
+from typing import List, Union, Dict
 import json
 
 import numpy as np
-import quaternion
 
-from wall_detailing.masonry.brick import Brick, Neighbor
+# same root as the wall detailer, which creates the BrickArrays
+from masonry.brick import Brick, Neighbor
+from masonry.brick_array import BrickArray
 
 
 class BrickExportInformation:
     """
     A class to collect relevant information about a brick for exporting it to json
     """
-    def __init__(self, brick: Brick):
-        self.shape = [brick.length, brick.width, brick.height]
-        self.position = np.round(brick.center(), decimals=6).tolist()
-        self.rotation = quaternion.as_float_array(brick.orientation).tolist()
-        self.neighbors = {}
+    def __init__(self, idd: int, shape: np.array, position: np.array, rotation: np.array,
+                 neighbors: Dict[Neighbor, List[int]]):
+        """
+        :param idd: id of the brick
+        :param shape: length, width and height of the brick
+        :param position: center of the brick
+        :param rotation: quaternion (w, x, y, z) of the brick
+        :param neighbors: ids of the neighbors of the brick
+        """
+        self.shape = np.asarray(shape).tolist()
+        self.position = np.round(position, decimals=6).tolist()
+        self.rotation = np.asarray(rotation).tolist()
+        self.neighbors = neighbors
         self.depends_on = []
 
-        self.id = brick.id
-
-        for key in brick.neighbors:
-            self.neighbors[key] = []
-            for b in brick.neighbors[key]:
-                self.neighbors[key].append(b.id)
+        self.id = idd
 
         # TODO this could now be replaced by the ontology (but for other projects it might be useful)
-        for b in brick.neighbors[Neighbor.BOTTOM]:
-            self.depends_on.append(b.id)
+        for b in neighbors[Neighbor.BOTTOM]:
+            self.depends_on.append(b)
 
 
 class BrickExporter:
@@ -35,22 +39,26 @@ class BrickExporter:
     A class to export bricks to a json file
     Assigns Ids to the bricks and creates a dictionary with the bricks and their information (BrickExportInformation)
     """
-    def __init__(self, bricks: List[Brick]):
+    def __init__(self, bricks: Union[List[Brick], BrickArray]):
+        if not isinstance(bricks, BrickArray):  # a list of Brick objects
+            bricks = BrickArray.from_bricks_with_neighbors(bricks)
+            for i, b in enumerate(bricks):
+                b.id = i + 1
         self.bricks = bricks
 
         # set ids
-        idd = 1
-        for b in bricks:
-            b.id = idd
-            idd += 1
+        self.ids = np.arange(1, len(bricks) + 1)
 
     def export_to_json(self, path: str):
         """
         Exports the bricks to a json file
         """
         ret = {}
-        for b in self.bricks:
-            ret[b.id] = BrickExportInformation(b)
+        neighbors = self.bricks.get_neighbor_lists()
+        for i, idd in enumerate(self.ids.tolist()):
+            ids = {key: [self.ids[j].item() for j in n] for key, n in neighbors[i].items()}
+            ret[idd] = BrickExportInformation(idd, self.bricks.dimensions[i], self.bricks.centers[i],
+                                              self.bricks.orientations[i], ids)
 
         with open(path, 'w') as outfile:
             json.dump(ret, outfile, default=lambda o: o.__dict__, sort_keys=True, indent=4)
@@ -1,8 +1,10 @@
 import random
-from typing import List
+from typing import List, Union
 from owlready2 import *
 
-from wall_detailing.masonry.brick import Brick, Neighbor
+# same root as the wall detailer, which creates the BrickArrays
+from masonry.brick import Brick, Neighbor
+from masonry.brick_array import BrickArray
 
 
 class RuleSet:
@@ -70,7 +72,7 @@ class Rule:
 
 
 class BrickToOntology:
-    def __init__(self, bricks: List[Brick], building_name: str = "building_1"):
+    def __init__(self, bricks: Union[List[Brick], BrickArray], building_name: str = "building_1"):
         self.original_file = "file:///home/rosrunner/Desktop/repos/masterarbeit/src/ontologies/brick_deduction.rdf"
         self.working_file = "/home/rosrunner/Desktop/repos/masterarbeit/src/ontologies/temporary_working_env.rdf"
         self.use_pellet = True
@@ -85,6 +87,8 @@ class BrickToOntology:
 
         self.building_name = building_name
         self.brick_to_ontology_dictionary = {}  # because I am too lazy to retrieve the bricks by id from the ontology
+        if not isinstance(bricks, BrickArray):  # a list of Brick objects
+            bricks = BrickArray.from_bricks_with_neighbors(bricks)
         self.bricks = bricks
 
         # setup data step by step
@@ -115,25 +119,24 @@ class BrickToOntology:
         building = self.onto.Building(self.building_name)
         self.empty = self.onto.PlacedBrick("empty_brick")
 
-        idd = 1
-
-        for b in self.bricks:
+        # the neighbors are looked up by index in the BrickArray, so no Brick objects are needed here
+        for i in range(len(self.bricks)):
+            idd = i + 1
             brick = self.onto.NamedBrick("brick_" + str(idd))
             brick.hasID = [idd]
-            b.id = idd
-            idd += 1
-            self.brick_to_ontology_dictionary[b.id] = (b, brick)
+            self.brick_to_ontology_dictionary[idd] = (i, brick)
 
+        neighbors = self.bricks.get_neighbor_lists()
         for b in self.onto.NamedBrick.instances():
             if b == self.empty:
                 continue
-            local_brick = self.brick_to_ontology_dictionary[b.hasID[0]][0]
-            b.hasBottomNeighbor = [self.brick_to_ontology_dictionary[obj.id][1] for obj in local_brick.neighbors[Neighbor.BOTTOM]]
-            b.hasTopNeighbor = [self.brick_to_ontology_dictionary[obj.id][1] for obj in local_brick.neighbors[Neighbor.TOP]]
-            b.hasLeftNeighbor = [self.brick_to_ontology_dictionary[obj.id][1] for obj in local_brick.neighbors[Neighbor.LEFT]]
-            b.hasRightNeighbor = [self.brick_to_ontology_dictionary[obj.id][1] for obj in local_brick.neighbors[Neighbor.RIGHT]]
-            b.hasFrontNeighbor = [self.brick_to_ontology_dictionary[obj.id][1] for obj in local_brick.neighbors[Neighbor.FRONT]]
-            b.hasBackNeighbor = [self.brick_to_ontology_dictionary[obj.id][1] for obj in local_brick.neighbors[Neighbor.BACK]]
+            n = neighbors[self.brick_to_ontology_dictionary[b.hasID[0]][0]]
+            b.hasBottomNeighbor = [self.brick_to_ontology_dictionary[j + 1][1] for j in n[Neighbor.BOTTOM]]
+            b.hasTopNeighbor = [self.brick_to_ontology_dictionary[j + 1][1] for j in n[Neighbor.TOP]]
+            b.hasLeftNeighbor = [self.brick_to_ontology_dictionary[j + 1][1] for j in n[Neighbor.LEFT]]
+            b.hasRightNeighbor = [self.brick_to_ontology_dictionary[j + 1][1] for j in n[Neighbor.RIGHT]]
+            b.hasFrontNeighbor = [self.brick_to_ontology_dictionary[j + 1][1] for j in n[Neighbor.FRONT]]
+            b.hasBackNeighbor = [self.brick_to_ontology_dictionary[j + 1][1] for j in n[Neighbor.BACK]]
             b.hasBeenSet = False
             b.dependsOn = [self.empty]
             building.hasBrick.append(b)
@@ -188,8 +191,12 @@ class BrickToOntology:
             # look up next brick in dictionary (lazy)
             idd = next_brick.hasID[0]
             if idd in self.brick_to_ontology_dictionary.keys():
-                self.brick_to_ontology_dictionary[idd][1].hasBeenSet = True
-                ret.append(self.brick_to_ontology_dictionary[idd][0])
+                i, individual = self.brick_to_ontology_dictionary[idd]
+                individual.hasBeenSet = True
+                # Brick objects are only created for the building plan
+                brick = self.bricks[i]
+                brick.id = idd
+                ret.append(brick)
             self.onto.save(file=self.working_file, format="rdfxml")
         return ret
 
@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 from enum import unique, Enum
 from typing import Tuple, List, Union, Any
 from masonry.brick import BrickInformation
+from masonry.bond.course_table import CourseTable, CourseFill, CourseBricks, CacheInfo, course_fill_cache
 
 import math
 import numpy as np
@@ -99,7 +100,20 @@ class Bond(ABC):
         self.l = module.length  # shortcut to length of brick
         self.w = module.width  # shortcut to width of brick
         self.h = module.height  # shortcut to height of brick
-        self.__reset()  # reset counters
+
+        # the plan and everything derived from it is built once and never changed afterwards
+        # -> a bond does not keep any state between calls and can be shared between threads
+        self.plan = self._get_plan()
+        self.repeat_layer = len(self.plan)
+
+        # each layer of the plan compiled into numpy tables
+        self.tables = [CourseTable(layer, self.module) for layer in self.plan]
+
+        # the corner plan only depends on the module, so build it once
+        # and precompute the corner lengths of each layer for rotations by multiples of 90 degrees
+        self.corner_plan = self._get_corner_plan()
+        self.corner_lengths = [[self.__corner_length(layer, quaternion.from_euler_angles(0, 0, k * math.pi / 2))
+                                for k in range(4)] for layer in self.corner_plan]
 
     def __init_subclass__(cls, **kwargs):
         """
@@ -110,49 +124,6 @@ class Bond(ABC):
         __import__(cls.__module__)
         Bond.BondTypes[cls.__name__] = cls
 
-    def __reset(self):
-        """
-        resets counters
-        :return:
-        """
-        self.layer = 0
-        self.step = -1
-        self.plan = self._get_plan()
-
-        self.repeat_layer = len(self.plan)
-        self.repeat_step = len(self.plan[self.layer % self.repeat_layer])
-
-    def __get(self, position: Tuple[int, int] = None) -> Transformation:
-        """
-        :param position: optional [layer, step in layer] else the internal position is being used
-        :return: the Transformation of the plan for this bond at [layer, step]
-        """
-        layer = max(0, self.layer)
-        step = max(0, self.step)
-        if position is not None:
-            layer, step = position
-        ret = self.plan[layer % self.repeat_layer][step % self.repeat_step].copy()
-        multiplier = math.floor(step / self.repeat_step)
-        ret.set_mask_multiplier(multiplier, multiplier, layer)
-        return ret
-
-    def __next(self) -> Transformation:
-        """
-        move a step further on current layer
-        :return:
-        """
-        self.step += 1
-        return self.__get()
-
-    def __up(self, n: int = 1):
-        """
-        move one layer up (resets the current step)
-        :return:
-        """
-        self.layer += n
-        self.repeat_step = len(self.plan[self.layer % self.repeat_layer])
-        self.step = -1
-
     @abstractmethod
     def _get_plan(self) -> List[List[Transformation]]:
         """
@@ -175,20 +146,20 @@ class Bond(ABC):
         """
         :return: the number of layers in the corner plan
         """
-        return len(self._get_corner_plan())
+        return len(self.corner_plan)
 
     def apply_corner(self, layer: int = 0) -> List[Transformation]:
         """
         :param layer: index for the layer of the corner plan we need
         :return: a list of Transformations for each brick
         """
-        plan = self._get_corner_plan()
+        plan = self.corner_plan
 
         ret = []
         if len(plan) == 0:
             return ret
 
-        for t in plan[layer % len(plan)].copy():
+        for t in plan[layer % len(plan)]:
             tf = t.copy()
             tf.set_mask_multiplier(0, 0, layer)
             tf.module = t.module if t.module is not None else self.module
@@ -202,21 +173,47 @@ class Bond(ABC):
         :param rotation: how should the corner plan be rotated
         :return: the maximal x coordinate of the corner plan
         """
-        plan = self._get_corner_plan()
-        ret = 0
+        plan = self.corner_plan
         if len(plan) == 0:
-            return ret
+            return 0
+
+        quadrant = self.__rotation_quadrant(rotation)
+        if quadrant is not None:
+            return self.corner_lengths[layer % len(plan)][quadrant]
+        return self.__corner_length(plan[layer % len(plan)], rotation)
 
-        for t in plan[layer % len(plan)].copy():
+    def __corner_length(self, transformations: List[Transformation], rotation: np.quaternion) -> float:
+        """
+        :param transformations: one layer of the corner plan
+        :param rotation: how should the corner plan be rotated
+        :return: the maximal x coordinate of the rotated layer
+        """
+        ret = 0
+        for t in transformations:
             module = t.module if t.module is not None else self.module
             l = module.get_rotated_dimensions(t.get_rotation())
             l = abs(quaternion.rotate_vectors(rotation, l)[0])
+            t = t.copy()
             t.set_mask_multiplier(0, 0, 1)
             pos = quaternion.rotate_vectors(rotation, t.get_position())
             l += abs(pos[0])
             ret = max(ret, l)
         return round(ret, 6)
 
+    @staticmethod
+    def __rotation_quadrant(rotation: np.quaternion) -> Union[int, None]:
+        """
+        :param rotation: some rotation
+        :return: k if rotation is a rotation by k * 90 degrees around the z axis, else None
+        """
+        if abs(rotation.x) > 1e-12 or abs(rotation.y) > 1e-12:
+            return None
+        angle = 2.0 * math.atan2(rotation.z, rotation.w)
+        k = round(angle / (math.pi / 2))
+        if abs(angle - k * math.pi / 2) > 1e-9:
+            return None
+        return k % 4
+
     def leftover_of_layer(self, length: float, layer: int = 0, x_offset: float = 0.0, reversed: bool = False):
         """
         :param length: length of the wall we want to be filled with this masonry bond
@@ -225,12 +222,38 @@ class Bond(ABC):
         :param reversed: if the bricks are supposed to be placed from right to left
         :return: leftover on both sides
         """
-        self.__reset()
-        self.__up(layer)
+        fill = self.fill(layer, length, x_offset, reversed)
+        return fill.leftover_left, fill.leftover_right, len(fill.indices)
 
-        bricks, leftover_left, leftover_right = self.bricks_in_layer(layer, length, x_offset, reversed)
+    def leftovers_of_layers(self, lengths: np.array, layers: np.array, x_offsets: np.array,
+                            reversed: bool = False) -> Tuple[np.array, np.array, np.array]:
+        """
+        leftover_of_layer for many layers at once. Layers that are not cached yet and use the same plan layer are
+        calculated together (see CourseTable.leftovers)
+        :param lengths: lengths of the layers
+        :param layers: the indices of the plan we want to use
+        :param x_offsets: if the layer's left edge is not at x = 0
+        :param reversed: if the bricks are supposed to be placed from right to left
+        :return: leftovers on the left, leftovers on the right and number of bricks of each layer
+        """
+        lengths, x_offsets = np.asarray(lengths, dtype=float), np.asarray(x_offsets, dtype=float)
+        tables = np.asarray(layers, dtype=int) % self.repeat_layer
+        keys = [("leftovers", type(self).__name__, self.l, self.w, self.h, self.tables[t].key, float(length),
+                 float(x_offset), bool(reversed)) for t, length, x_offset in zip(tables, lengths, x_offsets)]
+
+        def leftovers(missing: List[int]) -> List[Tuple[float, float, int]]:
+            missing = np.array(missing, dtype=int)
+            ret = [None] * len(missing)
+            for t in np.unique(tables[missing]):
+                which = np.nonzero(tables[missing] == t)[0]
+                left, right, num_bricks = self.tables[t].leftovers(lengths[missing[which]],
+                                                                   x_offsets[missing[which]], reversed)
+                for k, i in enumerate(which):
+                    ret[i] = (left[k], right[k], int(num_bricks[k]))
+            return ret
 
-        return leftover_left, leftover_right, len(bricks)
+        left, right, num_bricks = zip(*course_fill_cache.get_many(keys, leftovers))
+        return np.array(left), np.array(right), np.array(num_bricks, dtype=int)
 
     def apply_layer(self, length, width, fill_left: bool = False, fill_right: bool = False, layer: int = 0,
                     x_offset: float = 0.0, reversed: bool = False) -> List[Transformation]:
@@ -246,7 +269,15 @@ class Bond(ABC):
         :return: a list of Transformations for each brick
         """
         bricks, leftover_left, leftover_right = self.bricks_in_layer(layer, length, x_offset, reversed)
+        bricks.extend(self.__leftover_bricks(length, width, fill_left, fill_right, layer, leftover_left, leftover_right))
+        return bricks
 
+    def __leftover_bricks(self, length, width, fill_left: bool, fill_right: bool, layer: int,
+                          leftover_left: float, leftover_right: float) -> List[Transformation]:
+        """
+        :return: Transformations of the custom sized bricks that fill the leftovers of a layer (see apply_layer)
+        """
+        bricks = []
         if np.isclose(leftover_left + leftover_right, length):
             # if we only want to fill one side, but the layer only consists of leftovers
             # -> fill the whole layer from one side
@@ -275,38 +306,94 @@ class Bond(ABC):
             bricks.append(tf)
         return bricks
 
+    def apply_layers(self, lengths: np.array, widths: np.array, fill_left: np.array, fill_right: np.array,
+                     layers: np.array, x_offsets: np.array, reversed: np.array) -> CourseBricks:
+        """
+        apply_layer for many layers at once, all parameters hold one value per layer
+        :param lengths: lengths of the layers
+        :param widths: widths of the layers
+        :param fill_left: if we wish to fill holes on the left with custom brick sizes
+        :param fill_right: if we wish to fill holes on the right with custom brick sizes
+        :param layers: the indices of the plan we want to use
+        :param x_offsets: if the layer's left edge is not at x = 0
+        :param reversed: if the bricks are supposed to be placed from right to left
+        :return: all bricks of all layers as arrays, in the same order apply_layer would return them
+        """
+        owners, positions, rotations, module_ids = [], [], [], []
+        modules = [self.module]
+        for i in range(len(lengths)):
+            layer = int(layers[i])
+            fill = self.fill(layer, lengths[i], x_offsets[i], reversed[i])
+            table = self.tables[layer % self.repeat_layer]
+
+            # same as Transformation.get_position() of the bricks bricks_in_layer would return
+            multipliers = np.column_stack([fill.multipliers, np.full(len(fill.indices), layer)])
+            offsets = table.offsets[fill.indices].copy()
+            offsets[:, 0] = fill.x_offsets
+            positions.append(offsets + table.values[fill.indices] * (table.masks[fill.indices] * multipliers))
+            rotations.append(table.rotations[fill.indices])
+            module_ids.append(np.zeros(len(fill.indices), dtype=int))
+            owners.append(np.full(len(fill.indices), i, dtype=int))
+
+            leftovers = self.__leftover_bricks(lengths[i], widths[i], fill_left[i], fill_right[i], layer,
+                                               fill.leftover_left, fill.leftover_right)
+            if len(leftovers) > 0:
+                positions.append(np.array([tf.get_position() for tf in leftovers]).reshape(-1, 3))
+                rotations.append(np.array([tf.get_rotation(as_quaternion=False) for tf in leftovers]).reshape(-1, 3))
+                module_ids.append(np.arange(len(modules), len(modules) + len(leftovers)))
+                owners.append(np.full(len(leftovers), i, dtype=int))
+                modules.extend(tf.module for tf in leftovers)
+
+        if len(owners) == 0:
+            return CourseBricks(np.zeros(0, dtype=int), np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0, dtype=int),
+                                modules)
+        return CourseBricks(np.concatenate(owners), np.concatenate(positions), np.concatenate(rotations),
+                            np.concatenate(module_ids), modules)
+
     def num_bricks_in_length(self, layer: int, length: float):
         """
         :param layer: the plan layer we look at
         :param length: the length we want to apply the bond to
         :return: number of bricks in length, leftover on both sides
         """
-        # get plan and starting position
-        transformations = self.plan[layer % self.repeat_layer].copy()
-        tf = transformations[0].copy()
-        tf.set_mask_multiplier(0, 0, layer)
-        pos = tf.get_position()
+        return self.tables[layer % self.repeat_layer].count(length)
 
-        leftover_left = pos[0]  # leftover_left usually stays at this value
-        leftover_right = leftover_left  # leftover_right is the "x-coordinate" of the last bricks right edge
-        brick_length = self.module.get_rotated_dimensions(tf.get_rotation())[0]
-
-        counter = 0
-
-        # iterate over the layerplan while increasing the multiplier
-        # until we find a brick that reaches over the given length
-        while round(pos[0] + brick_length, 6) <= round(length, 6):  # wtf python returned 0.6 <= 0.6 as false
-            counter += 1
-            leftover_right = max(leftover_right, pos[0] + brick_length)
-            leftover_left = min(leftover_left, pos[0])
+    def transformations_of_fill(self, layer: int, fill: CourseFill) -> List[Transformation]:
+        """
+        :param layer: index of layer plan (0 is at floor)
+        :param fill: bricks of a filled course (see CourseTable.fill)
+        :return: a Transformation for each brick of the filled course
+        """
+        transformations = self.plan[layer % self.repeat_layer]
+        ret = []
+        for index, (mx, my), x in zip(fill.indices, fill.multipliers, fill.x_offsets):
+            tf = transformations[index].copy()
+            tf.set_mask_multiplier(mx, my, layer)
+            tf.translation.offset[0] = x
+            tf.module = self.module
+            ret.append(tf)
+        return ret
 
-            tf = transformations[counter % len(transformations)].copy()
-            multiplier = math.floor(counter / float(len(transformations)))
-            tf.set_mask_multiplier(multiplier, multiplier, layer)
-            pos = tf.get_position()
+    def fill(self, layer: int, length: float, x_offset: float = 0.0, reversed: bool = False) -> CourseFill:
+        """
+        :param layer: index of layer plan (0 is at floor)
+        :param length: length of the wall
+        :param x_offset: offset in x direction
+        :param reversed: if the bricks are supposed to be placed from right to left
+        :return: the (shared, read only) filled course, see CourseTable.fill
+        does not depend on any state of this bond, so it may be called concurrently
+        """
+        table = self.tables[layer % self.repeat_layer]
+        key = (type(self).__name__, self.l, self.w, self.h, table.key,
+               float(length), float(x_offset), bool(reversed))
+        return course_fill_cache.get(key, lambda: table.fill(length, x_offset, reversed))
 
-            brick_length = self.module.get_rotated_dimensions(tf.get_rotation())[0]
-        return counter, round(leftover_left, 6), round(leftover_right, 6)
+    @staticmethod
+    def course_cache_info() -> CacheInfo:
+        """
+        :return: hits, misses, maxsize and currsize of the cache of filled courses
+        """
+        return course_fill_cache.cache_info()
 
     def bricks_in_layer(self, layer: int, length: float, x_offset: float = 0.0, reversed: bool = False) -> Tuple[
         List[Transformation], float, float]:
@@ -317,63 +404,5 @@ class Bond(ABC):
         :param reversed: if the bricks are supposed to be placed from right to left
         :return: number of bricks that fit into given length of the wall by following layout plan for given layer
         """
-        # check how many bricks are in this layers length + it's x_offset
-        # aka we act like the layer is longer as it might be, to be able to cut out bricks correctly later
-        counter, leftover_left, leftover_right = self.num_bricks_in_length(layer, length + x_offset)
-        ret = []
-
-        # if there are no whole bricks at all
-        if counter == 0:
-            leftover_right = length - leftover_left
-        # if there are some whole bricks in the length + x_offset
-        else:
-            self.__reset()
-            self.__up(layer)
-
-            # now let's check if there are any bricks that have x positions greater than given x_offset
-            any_bricks = False
-            for i in range(counter):
-                tf = self.__next()
-                tf.module = self.module
-
-                if tf.get_position()[0] >= x_offset:
-                    diff = round(tf.get_position()[0] - x_offset, 6)
-                    if not any_bricks:
-                        any_bricks = True
-                        leftover_left = diff
-
-                        # if leftover_left is exactly one brick length
-                        ttf = self.__get((layer, self.step - 1))
-                        brick_length = self.module.get_rotated_dimensions(ttf.get_rotation())[0]
-                        if leftover_left == brick_length:
-                            ttf.translation.offset[0] -= x_offset
-                            ttf.module = self.module
-                            ret.append(ttf)
-                            leftover_left = 0
-
-                    leftover_left = min(leftover_left, diff)
-                    tf.translation.offset[0] -= x_offset
-                    ret.append(tf)
-            # in case there are any bricks
-            if any_bricks:
-                # rounding necessary because sometimes too small for the occ backend to handle
-                leftover_right = round(leftover_right - x_offset, 6)
-                leftover_right = length - leftover_right
-                leftover_left = round(leftover_left, 6)
-            # otherwise do a slightly different calculation
-            else:
-                leftover_left = length - leftover_left
-                leftover_right = length - leftover_left
-
-        # in case we want to build the layer from right to left
-        # reverse tfs to build from left to right
-        if reversed:
-            leftover_right, leftover_left = leftover_left, leftover_right
-
-            for tf in ret:
-                brick_length = self.module.get_rotated_dimensions(tf.get_rotation())[0]
-                tf.translation.offset[0] = length - tf.translation.offset[0] - brick_length
-                tf.mask_multiplier[0] *= -1
-        leftover_left = round(leftover_left, 6)
-        leftover_right = round(leftover_right, 6)
-        return ret, leftover_left, leftover_right
+        fill = self.fill(layer, length, x_offset, reversed)
+        return self.transformations_of_fill(layer, fill), fill.leftover_left, fill.leftover_right
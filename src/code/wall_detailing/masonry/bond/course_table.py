@@ -0,0 +1,352 @@
+from collections import OrderedDict
+from typing import List, Tuple, NamedTuple, Hashable, Callable, Any, TYPE_CHECKING
+
+import math
+import threading
+import numpy as np
+import quaternion
+
+from masonry.brick import BrickInformation
+
+if TYPE_CHECKING:
+    from masonry.bond.abstract_bond import Transformation
+
+
+class CourseFill(NamedTuple):
+    """
+    Result of filling one course (layer) of a given length with a bond plan.
+    Brick i uses the plan entry indices[i] with the mask multipliers multipliers[i] (x, y)
+    and its translation offset along x replaced by x_offsets[i].
+    """
+    indices: np.array
+    multipliers: np.array
+    x_offsets: np.array
+    leftover_left: float
+    leftover_right: float
+
+
+class CourseBricks(NamedTuple):
+    """
+    Bricks of many filled courses (see Bond.apply_layers) as arrays, brick i
+     belongs to the course owners[i],
+     lies at positions[i] (plan coordinates of the course, like Transformation.get_position()),
+     is rotated by the euler angles rotations[i] around its own center
+     and is made of modules[module_ids[i]]
+    """
+    owners: np.array
+    positions: np.array
+    rotations: np.array
+    module_ids: np.array
+    modules: List[BrickInformation]
+
+
+class CourseTable:
+    """
+    One layer of a bond plan compiled into numpy arrays:
+     offsets, values and masks of the translations of each brick in the plan layer,
+     the (constant) euler rotation of each brick and its rotated extent along the x axis.
+    A course of any length can then be filled by arithmetic over these tables instead of walking the plan brick by brick.
+    """
+
+    def __init__(self, transformations: List['Transformation'], module: BrickInformation):
+        self.n = len(transformations)
+        self.offsets = np.array([tf.translation.offset for tf in transformations], dtype=float).reshape(-1, 3)
+        self.values = np.array([tf.translation.value for tf in transformations], dtype=float).reshape(-1, 3)
+        self.masks = np.array([tf.translation.mask for tf in transformations]).reshape(-1, 3)
+        self.rotations = np.array([tf.rotation.offset for tf in transformations], dtype=float).reshape(-1, 3)
+
+        for tf in transformations:
+            if np.any(tf.rotation.value * tf.rotation.mask != 0.0):
+                raise ValueError("rotations that change along a course can not be compiled into a CourseTable")
+
+        # length of each brick along the x axis after its rotation has been applied
+        self.lengths = np.array([module.get_rotated_dimensions(quaternion.from_euler_angles(*r))[0]
+                                 for r in self.rotations], dtype=float)
+
+        # everything a filled course depends on, used to share filled courses between equal tables
+        self.key = (self.n, self.offsets.tobytes(), self.values.tobytes(), self.masks.tobytes(),
+                    self.lengths.tobytes())
+
+    def x_positions(self, indices: np.array, multipliers: np.array) -> np.array:
+        """
+        :param indices: plan entries
+        :param multipliers: mask multipliers along x
+        :return: x coordinates of the given bricks (same calculation as MaskedArray.val)
+        """
+        return self.offsets[indices, 0] + self.values[indices, 0] * (self.masks[indices, 0] * multipliers)
+
+    def count(self, length: float) -> Tuple[int, float, float]:
+        """
+        :param length: the length we want to apply the plan layer to
+        :return: number of whole bricks that fit into length, leftover on both sides
+        (the same values Bond.num_bricks_in_length used to get by stepping through the plan)
+        """
+        counters, leftover_left, leftover_right = self.counts(np.array([length], dtype=float))
+        return int(counters[0]), leftover_left[0], leftover_right[0]
+
+    def counts(self, lengths: np.array) -> Tuple[np.array, np.array, np.array]:
+        """
+        count for many lengths at once
+        :param lengths: the lengths we want to apply the plan layer to
+        :return: number of whole bricks that fit into each length, leftovers on both sides of each length
+        """
+        limit = np.round(lengths, 6)[:, None]
+        steps = self.values[:, 0] * self.masks[:, 0]
+        entries = np.arange(self.n)
+
+        def fits(m: np.array) -> np.array:
+            return np.round(self.x_positions(entries, m) + self.lengths, 6) <= limit
+
+        # first multiplier for each length and plan entry that does not fit into the length anymore
+        first_miss = np.zeros((len(lengths), self.n), dtype=int)
+        moving = np.broadcast_to(steps > 0, first_miss.shape)
+        if np.any(~moving & fits(first_miss)):
+            raise ValueError("bond plan does not advance along the course")
+        if np.any(moving):
+            estimate = np.floor((limit - self.offsets[:, 0] - self.lengths) / np.where(moving, steps, 1.0)) + 1
+            first_miss = np.where(moving, np.maximum(estimate, 0), 0).astype(int)
+
+            # correct floating point errors of the estimate
+            too_high = moving & (first_miss > 0) & ~fits(first_miss - 1)
+            while np.any(too_high):
+                first_miss[too_high] -= 1
+                too_high = moving & (first_miss > 0) & ~fits(first_miss - 1)
+            too_low = moving & fits(first_miss)
+            while np.any(too_low):
+                first_miss[too_low] += 1
+                too_low = moving & fits(first_miss)
+
+        counters = np.min(first_miss * self.n + entries, axis=1)
+
+        # bricks per plan entry that fit and where the first / last of them lies
+        x0 = self.offsets[0, 0] + self.values[0, 0] * (self.masks[0, 0] * 0)
+        per_entry = counters[:, None] // self.n + (entries < counters[:, None] % self.n)
+        used = per_entry > 0
+        firsts = np.where(used, self.x_positions(entries, np.zeros_like(per_entry)), np.inf)
+        ends = np.where(used, self.x_positions(entries, per_entry - 1) + self.lengths, -np.inf)
+        leftover_left = np.minimum(x0, np.min(firsts, axis=1))
+        leftover_right = np.maximum(x0, np.max(ends, axis=1))
+        return counters, np.round(leftover_left, 6), np.round(leftover_right, 6)
+
+    def fill(self, length: float, x_offset: float = 0.0, reversed: bool = False) -> CourseFill:
+        """
+        :param length: length of the wall
+        :param x_offset: offset in x direction
+        :param reversed: if the bricks are supposed to be placed from right to left
+        :return: all bricks of this plan layer that fit into the given length and the leftovers on both sides
+        """
+        # check how many bricks are in this layers length + it's x_offset
+        # aka we act like the layer is longer as it might be, to be able to cut out bricks correctly later
+        counter, leftover_left, leftover_right = self.count(length + x_offset)
+        indices = np.zeros(0, dtype=int)
+        multipliers = np.zeros(0, dtype=int)
+        x_offsets = np.zeros(0, dtype=float)
+
+        # if there are no whole bricks at all
+        if counter == 0:
+            leftover_right = length - leftover_left
+        # if there are some whole bricks in the length + x_offset
+        else:
+            steps = np.arange(counter)
+            all_indices = steps % self.n
+            all_multipliers = steps // self.n
+            positions = self.x_positions(all_indices, all_multipliers)
+
+            # now let's check if there are any bricks that have x positions greater than given x_offset
+            inside = positions >= x_offset
+            if np.any(inside):
+                first = int(np.argmax(inside))
+                diffs = np.round(positions[inside] - x_offset, 6)
+                leftover_left = diffs[0]
+
+                # if leftover_left is exactly one brick length the brick before the first one fits too
+                before = first - 1
+                before_index = before % self.n
+                if leftover_left == self.lengths[before_index]:
+                    indices = np.array([before_index])
+                    multipliers = np.array([math.floor(before / self.n)])
+                    x_offsets = np.array([self.offsets[before_index, 0] - x_offset])
+                    leftover_left = 0
+
+                leftover_left = min(leftover_left, np.min(diffs))
+                indices = np.concatenate([indices, all_indices[inside]])
+                multipliers = np.concatenate([multipliers, all_multipliers[inside]])
+                x_offsets = np.concatenate([x_offsets, self.offsets[all_indices[inside], 0] - x_offset])
+
+                # rounding necessary because sometimes too small for the occ backend to handle
+                leftover_right = round(leftover_right - x_offset, 6)
+                leftover_right = length - leftover_right
+                leftover_left = round(leftover_left, 6)
+            # otherwise do a slightly different calculation
+            else:
+                leftover_left = length - leftover_left
+                leftover_right = length - leftover_left
+
+        multipliers = np.stack([multipliers, multipliers], axis=1).astype(int).reshape(-1, 2)
+
+        # in case we want to build the layer from right to left
+        # mirror the bricks to build from left to right
+        if reversed:
+            leftover_right, leftover_left = leftover_left, leftover_right
+            x_offsets = length - x_offsets - self.lengths[indices]
+            multipliers[:, 0] *= -1
+
+        indices, x_offsets = indices.astype(int), x_offsets.astype(float)
+        # filled courses are shared via the CourseFillCache, so nobody should change them
+        for a in (indices, multipliers, x_offsets):
+            a.setflags(write=False)
+        return CourseFill(indices, multipliers, x_offsets, round(leftover_left, 6), round(leftover_right, 6))
+
+
+    def leftovers(self, lengths: np.array, x_offsets: np.array,
+                  reversed: bool = False) -> Tuple[np.array, np.array, np.array]:
+        """
+        the leftovers and the number of bricks of fill for many courses at once, without placing any bricks:
+        the bricks of each plan entry lie at regular steps, so the first one behind the x offset is calculated directly
+        :param lengths: length of each course
+        :param x_offsets: offset in x direction of each course
+        :param reversed: if the bricks are supposed to be placed from right to left
+        :return: leftover on the left, leftover on the right and number of bricks of each course (see fill)
+        """
+        lengths, x_offsets = np.asarray(lengths, dtype=float), np.asarray(x_offsets, dtype=float)
+        counters, leftover_left, leftover_right = self.counts(lengths + x_offsets)
+        entries = np.arange(self.n)
+        steps = self.values[:, 0] * self.masks[:, 0]
+        per_entry = counters[:, None] // self.n + (entries < counters[:, None] % self.n)
+        x = x_offsets[:, None]
+
+        # first multiplier of each plan entry whose brick lies behind the x offset
+        moving = np.broadcast_to(steps > 0, per_entry.shape)
+        estimate = np.ceil((x - self.offsets[:, 0]) / np.where(steps > 0, steps, 1.0))
+        first = np.where(moving, np.maximum(estimate, 0), 0).astype(int)
+        too_high = moving & (first > 0) & (self.x_positions(entries, first - 1) >= x)
+        while np.any(too_high):
+            first[too_high] -= 1
+            too_high = moving & (first > 0) & (self.x_positions(entries, first - 1) >= x)
+        too_low = moving & (self.x_positions(entries, first) < x)
+        while np.any(too_low):
+            first[too_low] += 1
+            too_low = moving & (self.x_positions(entries, first) < x)
+        inside = moving & (first < per_entry)
+        any_inside = np.any(inside, axis=1)
+
+        # the first brick behind the x offset in the order of the plan, the brick before it might fit as well
+        steps_inside = np.where(inside, first * self.n + entries, np.iinfo(int).max)
+        first_step = np.min(steps_inside, axis=1)
+        first_entry = np.where(any_inside, first_step % self.n, 0)
+        first_multiplier = np.where(any_inside, first_step // self.n, 0)
+        diffs = np.round(self.x_positions(entries, first) - x, 6)
+        first_diff = np.round(self.x_positions(first_entry, first_multiplier) - x_offsets, 6)
+        before = first_diff == self.lengths[(first_step - 1) % self.n]
+        num_bricks = np.sum(np.where(inside, per_entry - first, 0), axis=1) + (any_inside & before)
+        left = np.minimum(np.where(before, 0.0, first_diff), np.min(np.where(inside, diffs, np.inf), axis=1))
+        right = lengths - np.round(leftover_right - x_offsets, 6)
+
+        # no bricks behind the x offset or no whole bricks at all
+        left = np.where(any_inside, np.round(left, 6), lengths - leftover_left)
+        right = np.where(any_inside, right, lengths - left)
+        left = np.where(counters == 0, leftover_left, left)
+        right = np.where(counters == 0, lengths - leftover_left, right)
+        num_bricks = np.where(counters == 0, 0, num_bricks)
+
+        if reversed:
+            left, right = right, left
+        return np.round(left, 6), np.round(right, 6), num_bricks
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+
+class CourseFillCache:
+    """
+    Bounded LRU cache for filled courses.
+    Walls of a building repeat the same courses (same length, plan layer, x offset and direction) over and over
+    -> every storey, every identical bay, every course of a tall wall
+    """
+
+    def __init__(self, maxsize: int = 8192):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key: Hashable, fill: Callable[[], CourseFill]) -> CourseFill:
+        """
+        :param key: key of the course
+        :param fill: calculates the filled course if it is not cached yet
+        :return: the cached or newly filled course
+        """
+        with self.__lock:
+            ret = self.__entries.get(key)
+            if ret is not None:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return ret
+            self.misses += 1
+
+        ret = fill()
+        with self.__lock:
+            self.__entries[key] = ret
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+        return ret
+
+    def get_many(self, keys: List[Hashable], fill: Callable[[List[int]], List[Any]]) -> List[Any]:
+        """
+        get for many courses at once, all courses that are not cached yet are calculated together
+        :param keys: keys of the courses
+        :param fill: calculates the courses of the given indices of keys that are not cached yet
+        :return: the cached or newly calculated courses
+        """
+        ret = []
+        with self.__lock:
+            for key in keys:
+                value = self.__entries.get(key)
+                if value is not None:
+                    self.__entries.move_to_end(key)
+                ret.append(value)
+            missing = [i for i, value in enumerate(ret) if value is None]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if len(missing) == 0:
+            return ret
+
+        for i, value in zip(missing, fill(missing)):
+            ret[i] = value
+        with self.__lock:
+            for i in missing:
+                self.__entries[keys[i]] = ret[i]
+                self.__entries.move_to_end(keys[i])
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+        return ret
+
+    def cache_info(self) -> CacheInfo:
+        """
+        :return: hits, misses, maxsize and currsize of this cache
+        """
+        with self.__lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self.__entries))
+
+    def clear(self):
+        """
+        removes all entries and resets the statistics
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# shared by all bonds, the key contains the bond type, the module and the compiled plan layer
+course_fill_cache = CourseFillCache()
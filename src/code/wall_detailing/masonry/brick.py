@@ -1,16 +1,19 @@
 import json
 import math
 from enum import Enum, unique
-from typing import List
+from functools import lru_cache
+from typing import List, Dict, Tuple, Union, TYPE_CHECKING
 
 import numpy as np
 import quaternion
 
-from OCC.Core.BRepBndLib import brepbndlib
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_Transform
 from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox
 from OCC.Core.gp import gp_Pnt, gp_Quaternion, gp_Trsf, gp_Vec
-from OCC.Core.Bnd import Bnd_Box
+from OCC.Core.TopoDS import TopoDS_Shape
+
+if TYPE_CHECKING:
+    from masonry.brick_array import BrickArray
 
 
 @unique
@@ -35,6 +38,23 @@ class Neighbor(str, Enum):
         return tmp[neighbor]
 
 
+# quaternions are rounded to this many decimals to be used as key of the rotated dimensions cache
+ROTATION_KEY_DECIMALS = 12
+
+
+@lru_cache(maxsize=4096)
+def _rotated_dimensions(length: float, width: float, height: float, rotation: tuple) -> tuple:
+    """
+    axis aligned bounding box of a box with the given dimensions rotated around its center:
+    each extent is the sum of the absolute projections of the box's edges, aka |R| * dims
+    :param rotation: (w, x, y, z) of the rotation
+    :return: the rounded dimensions of the bounding box
+    """
+    r = quaternion.as_rotation_matrix(np.quaternion(*rotation).normalized())
+    dims = np.abs(r) @ np.array([length, width, height])
+    return tuple(round(float(d), 6) for d in dims)
+
+
 class BrickInformation:
     """
     This class stores simple information about a brick:
@@ -73,29 +93,19 @@ class BrickInformation:
         Example: you want the box to be rotated by 90 degrees around the z axis but then need to know the distance you
         make along the x axis with the placement of the rotated brick
         """
-        corner = gp_Pnt(-self.length / 2.0, -self.width / 2.0, -self.height / 2.0)
         if round(self.length, 6) == 0.0 or round(self.width, 6) == 0.0 or round(self.height, 6) == 0.0:
             return [self.length, self.width, self.height]
-        shape = BRepPrimAPI_MakeBox(corner, self.length, self.width, self.height).Shape()
-        # ...to rotate around local rotation....
-        transformation = gp_Trsf()
-        rotation = rotation
-        rotation = gp_Quaternion(rotation.x, rotation.y, rotation.z, rotation.w)
-        transformation.SetRotation(rotation)
-        shape = BRepBuilderAPI_Transform(shape, transformation).Shape()
-
-        # create a boundingbox around the shape
-        bounding_box = Bnd_Box()
-        brepbndlib.Add(shape, bounding_box)
-
-        # Get the minimum and maximum coordinates of the bounding box
-        xmin, ymin, zmin, xmax, ymax, zmax = bounding_box.Get()
-
-        # Calculate the dimensions of the rotated box
-        length = round(xmax - xmin, 6)
-        width = round(ymax - ymin, 6)
-        height = round(zmax - zmin, 6)
-        return [length, width, height]
+        # q and -q are the same rotation
+        q = rotation if rotation.w >= 0 else -rotation
+        key = tuple(round(float(v), ROTATION_KEY_DECIMALS) for v in (q.w, q.x, q.y, q.z))
+        return list(_rotated_dimensions(float(self.length), float(self.width), float(self.height), key))
+
+    @staticmethod
+    def rotated_dimensions_cache_info():
+        """
+        :return: hits, misses, maxsize and currsize of the cache behind get_rotated_dimensions
+        """
+        return _rotated_dimensions.cache_info()
 
     def is_inside(self, point: np.array) -> bool:
         """
@@ -122,6 +132,8 @@ class Brick:
     local rotation is the rotation around the bricks own center
     position is the translation of the brick
     global rotation is the rotation around the origin after translation happened
+    The pose is kept as a position (bottom left corner) and a quaternion, the occ shape is only built when it is
+    actually needed (e.g. for the stl export)
     """
 
     def __init__(self, brick_information: BrickInformation):
@@ -141,10 +153,10 @@ class Brick:
                           Neighbor.TOP: set(),
                           Neighbor.BOTTOM: set()}
 
-        self.shape = BRepPrimAPI_MakeBox(gp_Pnt(self.offset, self.offset, self.offset),
-                                         self.length - self.offset * 2,
-                                         self.width - self.offset * 2,
-                                         self.height - self.offset * 2).Shape()
+        # the pose is stored numerically (bottom left corner + orientation), the occ shape is only built on demand
+        self._position = np.array([0.0, 0.0, 0.0])
+        self._orientation = np.quaternion(1, 0, 0, 0)
+        self._shape = None
 
     def get_dimensions(self):
         """
@@ -158,6 +170,12 @@ class Brick:
         """
         return self.__brick_information.grid
 
+    def get_brick_information(self) -> BrickInformation:
+        """
+        :return: the brick information (module) this brick has been created from
+        """
+        return self.__brick_information
+
     @property
     def all_neighbors(self):
         """
@@ -170,33 +188,54 @@ class Brick:
                 self.neighbors[Neighbor.TOP] |
                 self.neighbors[Neighbor.BOTTOM])
 
+    @property
+    def shape(self) -> TopoDS_Shape:
+        """
+        :return: the occ shape of the brick, built from the current pose the first time it is needed
+        """
+        if self._shape is None:
+            shape = BRepPrimAPI_MakeBox(gp_Pnt(self.offset, self.offset, self.offset),
+                                        self.length - self.offset * 2,
+                                        self.width - self.offset * 2,
+                                        self.height - self.offset * 2).Shape()
+
+            transformation = gp_Trsf()
+            o = self._orientation
+            transformation.SetRotation(gp_Quaternion(o.x, o.y, o.z, o.w))
+            transformation.SetTranslationPart(gp_Vec(*self._position))
+            self._shape = BRepBuilderAPI_Transform(shape, transformation).Shape()
+        return self._shape
+
     @property
     def position(self) -> np.array:
         """
         :return: position of the brick in global coordinates
         """
-        return np.array([self.shape.Location().Transformation().TranslationPart().X(),
-                         self.shape.Location().Transformation().TranslationPart().Y(),
-                         self.shape.Location().Transformation().TranslationPart().Z()])
+        return self._position.copy()
 
     @property
     def orientation(self) -> np.quaternion:
         """
         :return: orientation of the brick in global coordinates
         """
-        return np.quaternion(self.shape.Location().Transformation().GetRotation().W(),
-                             self.shape.Location().Transformation().GetRotation().X(),
-                             self.shape.Location().Transformation().GetRotation().Y(),
-                             self.shape.Location().Transformation().GetRotation().Z())
+        return self._orientation.copy()
+
+    def _set_pose(self, position: np.array, orientation: np.quaternion):
+        """
+        :param position: new position of the bricks bottom left corner
+        :param orientation: new orientation of the brick
+        :return: None
+        """
+        self._position = position
+        self._orientation = orientation
+        self._shape = None  # needs to be rebuilt with the new pose
 
     def translate(self, translation: np.array):
         """
         :param translation: translation to apply
         :return: self
         """
-        transformation = gp_Trsf()
-        transformation.SetTranslation(gp_Vec(*translation))
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
+        self._set_pose(self._position + translation, self._orientation)
         return self
 
     def center(self):
@@ -220,38 +259,20 @@ class Brick:
         """
         rotates around center of brick
         """
-        pos = self.shape.Location().Transformation().TranslationPart()
+        pos = self._position
 
         # get current dimensions of the axis aligned bounding box of the brick to center the brick
         mid = self._bottom_left_corner_offset()
 
-        # ...translate to 0 0 0...
-        transformation = gp_Trsf()
-        transformation.SetTranslation(gp_Vec(pos.Reversed()))
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
-
-        transformation = gp_Trsf()
-        transformation.SetTranslation(gp_Vec(*-mid))
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
-
-        # ...rotate....
-        transformation = gp_Trsf()
-        rotation_ = gp_Quaternion(rotation.x, rotation.y, rotation.z, rotation.w)
-        transformation.SetRotation(rotation_)
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
+        # ...translate to 0 0 0 and rotate....
+        self._set_pose(quaternion.rotate_vectors(rotation, -mid), rotation * self._orientation)
 
         # now get the new dimensions of the axis aligned bounding box of the brick to move the bricks center to the
         # original location
         mid = self._bottom_left_corner_offset()
 
-        transformation = gp_Trsf()
-        transformation.SetTranslation(gp_Vec(*mid))
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
-
         # ...translate back to original position...
-        transformation = gp_Trsf()
-        transformation.SetTranslation(gp_Vec(pos))
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
+        self._set_pose(self._position + mid + pos, self._orientation)
         return self
 
     def rotate_around(self, rotation: np.quaternion, pivot_point: np.array = np.array([0.0, 0.0, 0.0])):
@@ -260,21 +281,9 @@ class Brick:
         :param pivot_point:
         :return:
         """
-        # ...translate...
-        transformation = gp_Trsf()
-        transformation.SetTranslation(gp_Vec(*-pivot_point))
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
-
-        # ...rotate....
-        transformation = gp_Trsf()
-        rotation = gp_Quaternion(rotation.x, rotation.y, rotation.z, rotation.w)
-        transformation.SetRotation(rotation)
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
-
-        # ...then translate back...
-        transformation = gp_Trsf()
-        transformation.SetTranslation(gp_Vec(*pivot_point))
-        self.shape = BRepBuilderAPI_Transform(self.shape, transformation).Shape()
+        # translate, rotate, then translate back
+        position = quaternion.rotate_vectors(rotation, self._position - pivot_point) + pivot_point
+        self._set_pose(position, rotation * self._orientation)
         return self
 
     """
@@ -360,42 +369,157 @@ class Brick:
         return self.__brick_information.is_inside(relative_point)
 
 
-def calculate_neighborhood(bricks: List[Brick]):
+def _local_neighbour_positions(dimensions: np.array, grid: np.array) -> Tuple[np.array, List[Neighbor]]:
     """
-    :param bricks: list of bricks to calculate the neighborhood for
+    the same positions as Brick.get_neighbour_positions, but relative to the bottom left corner of an unrotated brick
+    :param dimensions: length, width and height of the brick
+    :param grid: grid size
+    :return: K x 3 positions and which neighbor each of them is
+    """
+    length, width, height = dimensions
+    length_steps = np.arange(math.floor(length / grid[0])) * grid[0]
+    width_steps = np.arange(math.floor(width / grid[1])) * grid[1]
+    height_steps = np.arange(math.floor(height / grid[2])) * grid[2]
+
+    faces = [(Neighbor.FRONT, length_steps, [width], height_steps),
+             (Neighbor.BACK, length_steps, [-grid[1]], height_steps),
+             (Neighbor.BOTTOM, length_steps, width_steps, [-grid[2]]),
+             (Neighbor.TOP, length_steps, width_steps, [height]),
+             (Neighbor.LEFT, [-grid[0]], width_steps, height_steps),
+             (Neighbor.RIGHT, [length], width_steps, height_steps)]
+    positions = []
+    neighbors = []
+    for neighbor, xs, ys, zs in faces:
+        x, y, z = np.meshgrid(xs, ys, zs, indexing="ij")
+        positions.append(np.column_stack([x.reshape(-1), y.reshape(-1), z.reshape(-1)]))
+        neighbors.extend([neighbor] * x.size)
+    # every position lies in the middle of a grid cell
+    return np.concatenate(positions) + np.asarray(grid) / 2.0, neighbors
+
+
+def neighborhood_pairs(positions: np.array, rotations: np.array, dimensions: np.array,
+                       grids: np.array) -> Dict[Neighbor, np.array]:
+    """
+    Calculates the neighborhood of many bricks at once (see calculate_neighborhood)
+    :param positions: N x 3 bottom left corners of the bricks
+    :param rotations: N x 3 x 3 rotation matrices of the bricks
+    :param dimensions: N x 3 length, width and height of the bricks
+    :param grids: N x 3 grid size of each brick
+    :return: for each Neighbor M x 2 indices (brick, neighbor brick)
+    """
+    empty = {key: np.zeros((0, 2), dtype=int) for key in Neighbor}
+    n = len(positions)
+    if n == 0:
+        return empty
+
+    # all neighbor positions of all bricks, bricks of the same size share their local positions
+    keys = np.round(np.column_stack([dimensions, grids]), 6)
+    _, groups = np.unique(keys, axis=0, return_inverse=True)
+    groups = groups.reshape(-1)
+    kinds = list(Neighbor)
+    points, owners, owner_kinds = [], [], []
+    for group in range(groups.max() + 1):
+        members = np.nonzero(groups == group)[0]
+        local, neighbors = _local_neighbour_positions(dimensions[members[0]], grids[members[0]])
+        world = positions[members, None, :] + np.einsum("nij,kj->nki", rotations[members], local)
+        points.append(world.reshape(-1, 3))
+        owners.append(np.repeat(members, len(local)))
+        owner_kinds.append(np.tile([kinds.index(k) for k in neighbors], len(members)))
+    points = np.round(np.concatenate(points), decimals=6)
+    owners = np.concatenate(owners)
+    owner_kinds = np.concatenate(owner_kinds)
+
+    # many bricks share the same neighbor positions
+    points, point_of_owner = np.unique(points, axis=0, return_inverse=True)
+    point_of_owner = point_of_owner.reshape(-1)
+
+    # points are sorted into cells at least as big as the biggest bounding box of a brick,
+    # so each brick only has to look at the 2 x 2 x 2 cells around the lower corner of its bounding box
+    tolerance = 1e-6
+    lows = positions + np.einsum("nij,nj->ni", np.minimum(rotations, 0.0), dimensions) - tolerance
+    highs = positions + np.einsum("nij,nj->ni", np.maximum(rotations, 0.0), dimensions) + tolerance
+    cell = np.max(highs - lows)
+    origin = np.minimum(lows.min(axis=0), points.min(axis=0))
+    point_cells = np.floor((points - origin) / cell).astype(np.int64)
+    brick_cells = np.floor((lows - origin) / cell).astype(np.int64)
+    shape = np.maximum(point_cells.max(axis=0), brick_cells.max(axis=0)) + 2
+
+    def cell_key(c):
+        return (c[..., 0] * shape[1] + c[..., 1]) * shape[2] + c[..., 2]
+
+    order = np.argsort(cell_key(point_cells), kind="stable")
+    sorted_keys = cell_key(point_cells)[order]
+    corners = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)])
+    candidate_keys = cell_key(brick_cells[:, None, :] + corners[None])  # N x 8
+    starts = np.searchsorted(sorted_keys, candidate_keys, side="left").reshape(-1)
+    counts = np.searchsorted(sorted_keys, candidate_keys, side="right").reshape(-1) - starts
+    candidate_bricks = np.repeat(np.repeat(np.arange(n), len(corners)), counts)
+    candidate_points = order[_expand_ranges(starts, counts)]
+
+    # convert the points into the local coordinate system of the brick and check if they are inside its dimensions
+    relative = np.einsum("nji,nj->ni", rotations[candidate_bricks],
+                         points[candidate_points] - positions[candidate_bricks])
+    inside = np.all((relative >= 0.0) & (relative <= dimensions[candidate_bricks]), axis=1)
+    containing_bricks = candidate_bricks[inside]
+    contained_points = candidate_points[inside]
+
+    # every brick that owns a point that lies inside of another brick has that brick as neighbor
+    owner_order = np.argsort(point_of_owner, kind="stable")
+    sorted_points = point_of_owner[owner_order]
+    starts = np.searchsorted(sorted_points, contained_points, side="left")
+    counts = np.searchsorted(sorted_points, contained_points, side="right") - starts
+    entries = owner_order[_expand_ranges(starts, counts)]
+    pairs = np.column_stack([owners[entries], np.repeat(containing_bricks, counts)])
+    entry_kinds = owner_kinds[entries]
+
+    ret = empty
+    for k, key in enumerate(kinds):
+        ret[key] = np.unique(pairs[entry_kinds == k], axis=0).reshape(-1, 2)
+    return ret
+
+
+def _expand_ranges(starts: np.array, counts: np.array) -> np.array:
+    """
+    :param starts: start of each range
+    :param counts: length of each range
+    :return: all indices of all ranges, e.g. starts [2, 7], counts [3, 1] -> [2, 3, 4, 7]
+    """
+    offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def calculate_neighborhood(bricks: Union[List[Brick], 'BrickArray']):
+    """
+    :param bricks: list of bricks (or a BrickArray) to calculate the neighborhood for
     calculates all neighbours of each brick using the given grid as step size
     waaaay faster than the old method (calculate_neighborhood_bruteforce) because we're looking at all bricks at once
+    for a BrickArray the neighbors are stored as index pairs in the array (see BrickArray.set_neighbors),
+    for a list they are added to the bricks neighbors
 
     btw: if a brick is a neighbor of itself, probably the given grid size is too big
     """
-    # first retrieve all possible neighbor positions for each brick
-    # while simultaneously remembering which brick has which position
-    # key is the point as tuple, value is a list of tuples (brick_index, neighbor)
-    dic = {}
-    for i, brick in enumerate(bricks):
-        neighbors = brick.get_neighbour_positions(brick.get_grid())
-        for key in neighbors.keys():
-            for pos in neighbors[key]:
-                if tuple(pos) in dic.keys():
-                    dic[tuple(pos)].append((i, key))
-                else:
-                    dic[tuple(pos)] = [(i, key)]
-
-    # now iterate over each brick and check what neighbor position are inside of it (all at once)
-    points = np.array([np.array([d[0], d[1], d[2]]) for d in dic.keys()])
-    for brick in bricks:
-        # convert points into local coordinate system of the current brick
-        relative_points = points - brick.position
-        relative_points = quaternion.rotate_vectors(brick.orientation.inverse(), relative_points)
-
-        # since its position is at [0.0, 0.0, 0.0] we just have to check if a points is inside the bricks dimensions
-        inside_mask = np.all((relative_points >= 0.0) & (relative_points <= brick.get_dimensions()), axis=1)
-        for index in np.where(inside_mask)[0]:
-            for brick_index, neighborhood in dic[tuple(points[index])]:
-                # this is not always true (it depends on the rotation of the neighbor)
-                # opp = Neighbor.opposite(neighborhood)
-                # brick.neighbors[opp].add(bricks[brick_index])
-                bricks[brick_index].neighbors[neighborhood].add(brick)
+    from masonry.brick_array import BrickArray  # brick_array imports this module
+
+    if isinstance(bricks, BrickArray):  # no need to create any Brick objects
+        grids = np.array([m.grid for m in bricks.modules], dtype=float).reshape(-1, 3)[bricks.module_ids]
+        bricks.set_neighbors(neighborhood_pairs(bricks.positions, bricks.rotation_matrices(),
+                                                bricks.dimensions, grids))
+        return
+
+    bricks = list(bricks)
+    if len(bricks) == 0:
+        return
+
+    positions = np.array([brick.position for brick in bricks])
+    rotations = quaternion.as_rotation_matrix(np.array([brick.orientation for brick in bricks])).reshape(-1, 3, 3)
+    dimensions = np.array([brick.get_dimensions() for brick in bricks], dtype=float)
+    grids = np.array([brick.get_grid() for brick in bricks], dtype=float)
+    for key, pairs in neighborhood_pairs(positions, rotations, dimensions, grids).items():
+        for i, j in pairs:
+            # this is not always true (it depends on the rotation of the neighbor)
+            # opp = Neighbor.opposite(key)
+            # bricks[j].neighbors[opp].add(bricks[i])
+            bricks[i].neighbors[key].add(bricks[j])
 
 
 def calculate_neighborhood_bruteforce(bricks: List[Brick]):
@@ -0,0 +1,196 @@
+from typing import List, Optional, Iterator, Union, Dict
+
+import numpy as np
+import quaternion
+
+from masonry.brick import BrickInformation, Brick, Neighbor
+
+
+class BrickArray:
+    """
+    Stores many bricks column wise (structure of arrays) instead of one Brick object per brick:
+     centers: N x 3 centers of the bricks in world coordinates
+     orientations: N x 4 quaternions (w, x, y, z) of the bricks in world coordinates
+     dimensions: N x 3 length, width and height of each brick
+     module_ids: index of each bricks BrickInformation in self.modules
+     wall_ids: id of the WallLayerGroup each brick belongs to (-1 if none)
+     courses: index of the course (layer) each brick lies in (-1 if none)
+     neighbors: for each Neighbor M x 2 indices (brick, neighbor brick), None until calculate_neighborhood is called
+    Brick objects are only created when someone asks for them (see bricks()), afterwards the same objects are returned
+    """
+
+    def __init__(self, centers: np.array = None, orientations: np.array = None, dimensions: np.array = None,
+                 module_ids: np.array = None, wall_ids: np.array = None, courses: np.array = None,
+                 modules: List[BrickInformation] = None):
+        self.centers = np.zeros((0, 3)) if centers is None else np.asarray(centers, dtype=float).reshape(-1, 3)
+        n = len(self.centers)
+        self.orientations = (np.tile([1.0, 0.0, 0.0, 0.0], (n, 1)) if orientations is None
+                             else np.asarray(orientations, dtype=float).reshape(-1, 4))
+        self.dimensions = np.zeros((n, 3)) if dimensions is None else np.asarray(dimensions, dtype=float).reshape(-1, 3)
+        self.module_ids = np.zeros(n, dtype=int) if module_ids is None else np.asarray(module_ids, dtype=int)
+        self.wall_ids = np.full(n, -1, dtype=int) if wall_ids is None else np.asarray(wall_ids, dtype=int)
+        self.courses = np.full(n, -1, dtype=int) if courses is None else np.asarray(courses, dtype=int)
+        self.modules: List[BrickInformation] = [] if modules is None else modules
+        self.neighbors: Optional[Dict[Neighbor, np.array]] = None
+
+        self._bricks: Optional[List[Brick]] = None
+
+    @staticmethod
+    def _module_key(module: BrickInformation) -> tuple:
+        """
+        :param module: a brick information
+        :return: hashable key of the module (BrickInformation itself is not hashable)
+        """
+        grid = None if module.grid is None else tuple(np.asarray(module.grid, dtype=float).tolist())
+        return module.length, module.width, module.height, grid
+
+    @classmethod
+    def from_bricks(cls, bricks: List[Brick], wall_id: int = -1, course: Union[int, List[int]] = -1) -> 'BrickArray':
+        """
+        :param bricks: list of bricks to be stored
+        :param wall_id: the id of the WallLayerGroup the bricks belong to
+        :param course: the course index of all bricks or a list with one course index per brick
+        :return: a BrickArray holding the poses of the given bricks
+        """
+        n = len(bricks)
+        modules = []
+        keys = {}
+        module_ids = np.zeros(n, dtype=int)
+        for i, b in enumerate(bricks):
+            module = b.get_brick_information()
+            key = cls._module_key(module)
+            if key not in keys:
+                keys[key] = len(modules)
+                modules.append(module)
+            module_ids[i] = keys[key]
+
+        ret = cls(centers=[b.center() for b in bricks],
+                  orientations=[quaternion.as_float_array(b.orientation) for b in bricks],
+                  dimensions=[b.get_dimensions() for b in bricks],
+                  module_ids=module_ids,
+                  wall_ids=np.full(n, wall_id, dtype=int),
+                  courses=np.broadcast_to(np.asarray(course, dtype=int), (n,)).copy(),
+                  modules=modules)
+        ret._bricks = list(bricks)
+        return ret
+
+    @classmethod
+    def from_bricks_with_neighbors(cls, bricks: List[Brick]) -> 'BrickArray':
+        """
+        :param bricks: list of bricks whose neighbors are already calculated (see calculate_neighborhood)
+        :return: a BrickArray holding the poses and the neighbors of the given bricks
+        """
+        bricks = list(bricks)
+        index = {id(b): i for i, b in enumerate(bricks)}
+        ret = cls.from_bricks(bricks)
+        ret.neighbors = {key: np.array([[i, index[id(n)]] for i, b in enumerate(bricks) for n in b.neighbors[key]
+                                        if id(n) in index], dtype=int).reshape(-1, 2) for key in Neighbor}
+        return ret
+
+    @classmethod
+    def concatenate(cls, arrays: List['BrickArray']) -> 'BrickArray':
+        """
+        :param arrays: the BrickArrays to join
+        :return: one BrickArray containing all bricks of the given arrays (in the same order)
+        """
+        modules = []
+        keys = {}
+        module_ids = []
+        for a in arrays:
+            lookup = np.zeros(len(a.modules), dtype=int)
+            for i, module in enumerate(a.modules):
+                key = cls._module_key(module)
+                if key not in keys:
+                    keys[key] = len(modules)
+                    modules.append(module)
+                lookup[i] = keys[key]
+            module_ids.append(lookup[a.module_ids] if len(a) > 0 else np.zeros(0, dtype=int))
+
+        if len(arrays) == 0:
+            return cls()
+
+        ret = cls(centers=np.concatenate([a.centers for a in arrays]),
+                  orientations=np.concatenate([a.orientations for a in arrays]),
+                  dimensions=np.concatenate([a.dimensions for a in arrays]),
+                  module_ids=np.concatenate(module_ids),
+                  wall_ids=np.concatenate([a.wall_ids for a in arrays]),
+                  courses=np.concatenate([a.courses for a in arrays]),
+                  modules=modules)
+
+        # keep already created brick objects
+        if all(a._bricks is not None or len(a) == 0 for a in arrays):
+            ret._bricks = [b for a in arrays if len(a) > 0 for b in a._bricks]
+        return ret
+
+    def __len__(self):
+        return len(self.centers)
+
+    def rotation_matrices(self) -> np.array:
+        """
+        :return: N x 3 x 3 rotation matrices of all bricks
+        """
+        return quaternion.as_rotation_matrix(quaternion.as_quat_array(self.orientations)).reshape(-1, 3, 3)
+
+    @property
+    def positions(self) -> np.array:
+        """
+        :return: N x 3 positions (bottom left corners) of all bricks like Brick.position
+        """
+        half = np.einsum('nij,nj->ni', self.rotation_matrices(), self.dimensions / 2.0)
+        return self.centers - half
+
+    def volumes(self) -> np.array:
+        """
+        :return: volume of each brick
+        """
+        return np.prod(self.dimensions, axis=1)
+
+    def set_neighbors(self, neighbors: Dict[Neighbor, np.array]):
+        """
+        :param neighbors: for each Neighbor M x 2 indices (brick, neighbor brick), see calculate_neighborhood
+        """
+        self.neighbors = neighbors
+        if self._bricks is not None:
+            self._apply_neighbors(self._bricks)
+
+    def get_neighbor_lists(self) -> List[Dict[Neighbor, List[int]]]:
+        """
+        :return: for each brick and each Neighbor the indices of its neighbors (empty if there are no neighbors yet)
+        """
+        ret = [{key: [] for key in Neighbor} for _ in range(len(self))]
+        if self.neighbors is not None:
+            for key, pairs in self.neighbors.items():
+                for i, j in pairs.tolist():
+                    ret[i][key].append(j)
+        return ret
+
+    def _apply_neighbors(self, bricks: List[Brick]):
+        """
+        adds the neighbors (see set_neighbors) to the neighbors of the Brick objects
+        """
+        for key, pairs in self.neighbors.items():
+            for i, j in pairs.tolist():
+                bricks[i].neighbors[key].add(bricks[j])
+
+    def bricks(self) -> List[Brick]:
+        """
+        compatibility view for everything that still works on Brick objects
+        :return: one Brick object per entry, created the first time they are needed
+        """
+        if self._bricks is None:
+            positions = self.positions
+            orientations = quaternion.as_quat_array(self.orientations).reshape(-1)
+            self._bricks = []
+            for i in range(len(self)):
+                b = Brick(self.modules[self.module_ids[i]])
+                b._set_pose(positions[i], orientations[i])
+                self._bricks.append(b)
+            if self.neighbors is not None:
+                self._apply_neighbors(self._bricks)
+        return self._bricks
+
+    def __iter__(self) -> Iterator[Brick]:
+        return iter(self.bricks())
+
+    def __getitem__(self, item):
+        return self.bricks()[item]
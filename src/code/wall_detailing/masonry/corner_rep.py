@@ -1,5 +1,6 @@
 import itertools
 import math
+from collections import deque
 import numpy as np
 import quaternion
 
@@ -8,6 +9,7 @@ from detailing.wall_layer_group import WallLayerGroup
 from typing import List, Dict, Tuple, Optional
 from masonry.bond.abstract_bond import Bond
 from die_mathe.line import Line
+from die_mathe.segment_set import SegmentSet
 
 
 class Corn:
@@ -156,13 +158,17 @@ class Corn:
         ids = [l.parent.id for l in self.layers]
         main_layer = self.get_main_layer()
         ids.remove(main_layer.parent.id)
-        layers = main_layer.parent.get_sorted_layers()
 
+        # lowest course of the main wall that contains one of our layers
+        indices = [main_layer.parent.get_course_index(l) for l in self.layers]
+        indices = [i for i in indices if i is not None]
+        if len(indices) > 0:
+            return min(indices)
+
+        layers = main_layer.parent.get_sorted_layers()
         vals = []
         for i, layers_in_height in enumerate(layers):
             for layer in layers_in_height:
-                if layer in self.layers:
-                    return i
                 for l in layer.left_connections:
                     if l.parent.id in ids:
                         vals.append(i)
@@ -196,23 +202,92 @@ class Corns:
     form the corner. (T- Joints or Crossings can be made possible this way)
     """
 
+    # smallest size of the cells corner points are hashed into, grows with the coordinates (see fit_cell_size)
+    cell_size = 0.01
+
     def __init__(self):
         self.corners = []
+        self.cell_size = Corns.cell_size
+        self.points: Dict[Tuple[int, int, int], List[Corn]] = {}  # corners by the cell their point lies in
+        self.layer_corners: Dict[WallLayer, List[Corn]] = {}  # corners each layer belongs to
+        self.index: Dict[int, int] = {}  # position of each corner (by id) in self.corners
+        self.course_adjacency: Optional[List[List[int]]] = None  # see get_course_adjacency
+        self.courses: Optional[List[List[int]]] = None  # see get_courses
+
+    def __getstate__(self):
+        # ids of the corners change when copied
+        state = self.__dict__.copy()
+        del state["index"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.index = {id(c): i for i, c in enumerate(self.corners)}
+
+    def get_cell(self, point: np.array) -> Tuple[int, int, int]:
+        """
+        :param point: a point
+        :return: the cell of self.points the point lies in
+        """
+        return tuple(np.floor(np.asarray(point, dtype=float) / self.cell_size).astype(int).tolist())
+
+    def fit_cell_size(self, point: np.array):
+        """
+        Corn.__eq__ (np.allclose) allows |a - b| <= 1e-8 + 1e-5 * |b| in every coordinate, so far away from the origin
+        the same corner may lie further apart than a cell. the cells have to be at least as big as that tolerance for
+        the largest coordinate, so the same corners always lie in the same or in neighbouring cells
+        :param point: point of a corner that is added
+        """
+        tolerance = 1e-8 + 1e-5 * float(np.max(np.abs(point)))
+        if tolerance <= self.cell_size:
+            return
+        # grow a bit more than needed, so we don't have to put everything into new cells for every corner
+        self.cell_size = 2.0 * tolerance
+        self.points = {}
+        for c in self.corners:
+            self.points.setdefault(self.get_cell(c.point), []).append(c)
+
+    def add_layers(self, corner: Corn, layers):
+        """
+        adds the layers to the corner and to the index of layers
+        :param corner: a corner of this list
+        :param layers: layers that form the corner
+        """
+        for layer in layers:
+            if layer not in corner.layers or all(c is not corner for c in self.layer_corners.get(layer, [])):
+                corner.layers.add(layer)
+                self.layer_corners.setdefault(layer, []).append(corner)
 
     def add_corner(self, corner: Corn):
         """
         Creates a new corner or append to an existing corner if there already is a corner at the same location
         :param corner: a corner to add to the list of corners
         """
-        for c in self.corners:
-            if c == corner:
-                c.layers.update(corner.layers)
-                if len(c.layers) == 3:
-                    print("TJoint")
-                if len(c.layers) == 4:
-                    print("Crossing!")
-                return
+        # the first corner of the list at the same location, which lies in this or a neighbouring cell
+        self.fit_cell_size(corner.point)
+        cell = self.get_cell(corner.point)
+        found = None
+        for offset in itertools.product([-1, 0, 1], repeat=3):
+            for c in self.points.get((cell[0] + offset[0], cell[1] + offset[1], cell[2] + offset[2]), []):
+                if c == corner and (found is None or self.index[id(c)] < self.index[id(found)]):
+                    found = c
+
+        if found is not None:
+            self.course_adjacency = None
+            self.courses = None
+            self.add_layers(found, corner.layers)
+            if len(found.layers) == 3:
+                print("TJoint")
+            if len(found.layers) == 4:
+                print("Crossing!")
+            return
+
+        self.course_adjacency = None
+        self.courses = None
+        self.index[id(corner)] = len(self.corners)
         self.corners.append(corner)
+        self.points.setdefault(cell, []).append(corner)
+        self.add_layers(corner, list(corner.layers))
 
     def grouped_by_walls(self) -> Dict[Tuple[int], List[Corn]]:
         dic = {}
@@ -227,19 +302,15 @@ class Corns:
     def get_corner(self, layers: List[WallLayer]) -> Optional[Corn]:
         """
         :param layers: a list of layers
-        :return: the corner that is formed by the given layers
+        :return: the (first) corner that is formed by the given layers
         """
         if len(layers) == 0:
             return None
-        for corn in self.corners:
-            found = True
-            for l in layers:
-                if l not in corn.layers:
-                    found = False
-                    break
-            if found:
-                return corn
-        return None
+        ret = None
+        for corn in self.layer_corners.get(layers[0], []):
+            if all(l in corn.layers for l in layers) and (ret is None or self.index[id(corn)] < self.index[id(ret)]):
+                ret = corn
+        return ret
 
     def get_bottom_corner(self, corner: Corn):
         """
@@ -252,7 +323,7 @@ class Corns:
             if bottoms is not None and len(bottoms) > 0:
                 l.append(bottoms)
 
-        for entry in list(itertools.product(*l)):
+        for entry in itertools.product(*l):
             c = self.get_corner(entry)
             if c is not None:
                 return c
@@ -269,12 +340,63 @@ class Corns:
             if tops is not None and len(tops) > 0:
                 l.append(tops)
 
-        for entry in list(itertools.product(*l)):
+        for entry in itertools.product(*l):
             c = self.get_corner(entry)
             if c is not None:
                 return c
         return None
 
+    def get_course_adjacency(self) -> List[List[int]]:
+        """
+        Built the first time it is needed, so all corners and connections of the layers have to be there already
+        :return: for each corner (index in self.corners) the indices of the corners its layers are connected to
+        """
+        if self.course_adjacency is None:
+            self.course_adjacency = []
+            for corner in self.corners:
+                neighbours = []
+                for layer1 in corner.layers:
+                    for layer2 in layer1.left_connections + layer1.right_connections:
+                        c = self.get_corner([layer1, layer2])
+                        if c is not None:
+                            neighbours.append(self.index[id(c)])
+                self.course_adjacency.append(neighbours)
+        return self.course_adjacency
+
+    def get_course(self, corner: int) -> List[int]:
+        """
+        :param corner: index of a corner in self.corners
+        :return: indices of all corners connected to given corner by layers on the same height in the building,
+        in the order of a breadth first search starting at the corner
+        """
+        adjacency = self.get_course_adjacency()
+        ret = []
+        done = set()
+        todo = deque([corner])
+        while len(todo) > 0:
+            curr = todo.popleft()
+            if curr not in done:
+                done.add(curr)
+                ret.append(curr)
+                todo.extend(adjacency[curr])
+        return ret
+
+    def get_courses(self) -> List[List[int]]:
+        """
+        :return: indices of all corners grouped by the height in the building they are in (see get_course),
+        sorted by the z coordinate of their lowest corner
+        """
+        if self.courses is None:
+            self.courses = []
+            done = set()
+            for corner in self.get_corners_sorted_by_z():
+                c = self.index[id(corner)]
+                if c not in done:
+                    course = self.get_course(c)
+                    done.update(course)
+                    self.courses.append(course)
+        return self.courses
+
     def get_corners_sorted_by_z(self):
         """
         :return: a list of corners sorted by their z coordinate
@@ -282,17 +404,64 @@ class Corns:
         return sorted(self.corners, key=lambda x: x.get_unrotated_world_coordinates()[2])
 
 
+def layer_pairs_touching_at_endpoints(wall_layer_groups: List[WallLayerGroup]) -> List[Tuple[int, int, int, int]]:
+    """
+    Finds all pairs of layers of different walls that may touch at their endpoints
+    (see WallLayer.is_touching_at_endpoints with the width of a wall as tolerance).
+    The endpoints of all layers are put into a grid with cells as big as the tolerance (and at least a module high),
+    so only layers with endpoints in neighbouring cells have to be compared.
+    :param wall_layer_groups: a list of wall_layer_groups
+    :return: (i, j, k1, k2) for every pair: layer k1 of wall_layer_groups[i] and layer k2 of wall_layer_groups[j],
+    i < j, in the same order as looping over all pairs of walls and then over their layers
+    """
+    layers = [(i, k) for i, w in enumerate(wall_layer_groups) for k in range(len(w.layers))]
+    if len(layers) == 0:
+        return []
+    points = np.array([edge for i, k in layers for edge in (wall_layer_groups[i].layers[k].left_edge,
+                                                          wall_layer_groups[i].layers[k].right_edge)], dtype=float)
+
+    # np.allclose(a, b, atol=width) allows |a - b| <= width + 1e-5 * |b| in every coordinate
+    tolerance = max(w.wall.width for w in wall_layer_groups) + 1e-5 * np.max(np.abs(points)) + 1e-9
+    height = max(w.module.height for w in wall_layer_groups)
+    cell = np.array([tolerance, tolerance, max(tolerance, height)])
+
+    grid: Dict[Tuple[int, int, int], List[int]] = {}
+    for p, key in enumerate(np.floor(points / cell).astype(int).tolist()):
+        cell_layers = grid.setdefault(tuple(key), [])
+        if len(cell_layers) == 0 or cell_layers[-1] != p // 2:
+            cell_layers.append(p // 2)
+
+    pairs = set()
+    neighbours = list(itertools.product([-1, 0, 1], repeat=3))
+    for key, cell_layers in grid.items():
+        for offset in neighbours:
+            others = grid.get((key[0] + offset[0], key[1] + offset[1], key[2] + offset[2]))
+            if others is None:
+                continue
+            for a in cell_layers:
+                for b in others:
+                    # layers are ordered by wall, so a < b means the wall of a comes first
+                    if a < b and layers[a][0] != layers[b][0]:
+                        pairs.add((a, b))
+
+    return sorted((layers[a][0], layers[b][0], layers[a][1], layers[b][1]) for a, b in pairs)
+
+
 def check_for_corners(wall_layer_groups: List[WallLayerGroup]) -> Corns:
     """
-    TODO needs to be faster (look at neighborhood calculation of bricks, maybe sth like that works here too)
+    Only layers that touch at their endpoints can form a corner, so we only look at those
+    (see layer_pairs_touching_at_endpoints) and intersect all of them at once (see SegmentSet.intersections)
     :param wall_layer_groups: a list of wall_layer_groups
     :return: a list of corners
     """
     corners = Corns()
+    wall_pairs: Dict[Tuple[int, int], bool] = {}
+    candidates: List[Tuple[WallLayerGroup, WallLayer, WallLayer]] = []
 
-    for i, w1 in enumerate(wall_layer_groups):
-        for j in range(i + 1, len(wall_layer_groups)):
-            w2 = wall_layer_groups[j]
+    for i, j, k1, k2 in layer_pairs_touching_at_endpoints(wall_layer_groups):
+        w1 = wall_layer_groups[i]
+        w2 = wall_layer_groups[j]
+        if (i, j) not in wall_pairs:
             r1 = w1.get_rotation()
             r2 = w2.get_rotation()
             diff = r2 * r1.inverse()
@@ -303,62 +472,45 @@ def check_for_corners(wall_layer_groups: List[WallLayerGroup]) -> Corns:
             z_part2 = quaternion.rotate_vectors(r2, np.array([0.0, 0.0, 1.0]))
             z_parallel = np.isclose(abs(np.dot(z_part1, z_part2)), 1.0)
 
-            x_part1 = quaternion.rotate_vectors(r1, np.array([1.0, 0.0, 0.0]))
-            x_part2 = quaternion.rotate_vectors(r2, np.array([1.0, 0.0, 0.0]))
-            x_parallel = np.isclose(abs(np.dot(x_part1, x_part2)), 1.0)
-
             degree90 = (angle == round(math.pi / 2, 6) or angle == round(math.pi * 1.5, 6))
-            # touching = w1.is_touching(w2)
             same_wall_type = w1.module == w2.module
-            # if not (z_parallel and degree90 and touching and same_wall_type):
-            #    continue
-
-            for l1 in w1.layers:
-                for l2 in w2.layers:
-                    if l1.is_touching(l2):
-                        line1 = Line(l1.left_edge, l1.right_edge)
-                        line2 = Line(l2.left_edge, l2.right_edge)
-
-                        intersection = line1.intersection(line2)
-
-                        if intersection is None:
-                            continue
-
-                        width = w1.wall.width
-                        if l1.is_touching_at_endpoints(l2,
-                                                       tolerance=width) and z_parallel and degree90 and same_wall_type:
-                            c = Corn(intersection)
-                            c.layers.update([l1, l2])
-                            corners.add_corner(c)
-
-                            if np.linalg.norm(intersection - l1.left_edge) < width:
-                                l1.left_connections.append(l2)
-                            elif np.linalg.norm(intersection - l1.right_edge) < width:
-                                l1.right_connections.append(l2)
-
-                            assert len(set(l1.right_connections) & set(l1.left_connections)) == 0
-
-                            if np.linalg.norm(intersection - l2.left_edge) < width:
-                                l2.left_connections.append(l1)
-                            elif np.linalg.norm(intersection - l2.right_edge) < width:
-                                l2.right_connections.append(l1)
-
-                            assert len(set(l2.right_connections) & set(l2.left_connections)) == 0
-
-                        elif not x_parallel:
-                            # check if the intersection is on both lines and in between their endpoints
-                            a = line1.on_line(intersection, between=True, tolerance=width)
-                            b = line2.on_line(intersection, between=True, tolerance=width)
-
-                            if a and b:
-                                t_joint = (np.linalg.norm(intersection - l1.left_edge) < width
-                                           or np.linalg.norm(intersection - l1.right_edge) < width
-                                           or np.linalg.norm(intersection - l2.left_edge) < width
-                                           or np.linalg.norm(intersection - l2.right_edge) < width)
-                                # c = Corn(intersection)
-                                # c.layers.update([l1, l2, t_joint])
-                                # corners.add_corner(c)
-                                # print("T-Joint" if t_joint else "Crossing", [round(i, 6) for i in intersection], x_parallel)
+            wall_pairs[(i, j)] = z_parallel and degree90 and same_wall_type
+
+        # t-joints and crossings (not x parallel) are not handled yet, so everything else can't be a corner
+        l1 = w1.layers[k1]
+        l2 = w2.layers[k2]
+        if wall_pairs[(i, j)] and l1.is_touching_at_endpoints(l2, tolerance=w1.wall.width):
+            candidates.append((w1, l1, l2))
+
+    # intersections of all candidates at once
+    segments = SegmentSet.from_points([l.left_edge for _, l, _ in candidates], [l.right_edge for _, l, _ in candidates])
+    others = SegmentSet.from_points([l.left_edge for _, _, l in candidates], [l.right_edge for _, _, l in candidates])
+    indices = np.arange(len(candidates))
+    intersections, valid = segments.intersections(others, np.column_stack([indices, indices]))
+
+    for (w1, l1, l2), intersection, is_valid in zip(candidates, intersections, valid):
+        if not is_valid:
+            continue
+
+        width = w1.wall.width
+        c = Corn(intersection)
+        c.layers.update([l1, l2])
+        corners.add_corner(c)
+
+        if np.linalg.norm(intersection - l1.left_edge) < width:
+            l1.left_connections.append(l2)
+        elif np.linalg.norm(intersection - l1.right_edge) < width:
+            l1.right_connections.append(l2)
+
+        assert len(set(l1.right_connections) & set(l1.left_connections)) == 0
+
+        if np.linalg.norm(intersection - l2.left_edge) < width:
+            l2.left_connections.append(l1)
+        elif np.linalg.norm(intersection - l2.right_edge) < width:
+            l2.right_connections.append(l1)
+
+        assert len(set(l2.right_connections) & set(l2.left_connections)) == 0
+
     # TODO
     # for now just remove TJoints and Crossings
     # print(len(corners.corners))
@@ -0,0 +1,120 @@
+import math
+import unittest
+
+import numpy as np
+import quaternion
+
+from masonry.brick import BrickInformation, Brick, Neighbor, calculate_neighborhood
+from masonry.brick_array import BrickArray
+
+
+class TestBrick(unittest.TestCase):
+    def setUp(self):
+        self.module = BrickInformation(2.0, 1.0, 0.5, grid=np.array([0.5, 0.5, 0.5]))
+
+    def test_translate(self):
+        b = Brick(self.module)
+        b.translate(np.array([1.0, 2.0, 3.0]))
+        b.translate(np.array([1.0, 0.0, 0.0]))
+        self.assertTrue(np.allclose(b.position, [2.0, 2.0, 3.0]))
+        self.assertTrue(np.allclose(b.center(), [3.0, 2.5, 3.25]))
+
+    def test_rotate(self):
+        # rotating keeps the bottom left corner of the axis aligned bounding box in place
+        b = Brick(self.module)
+        b.rotate(quaternion.from_euler_angles(0, 0, math.pi / 2))
+        self.assertTrue(np.allclose(b.position, [1.0, 0.0, 0.0]))
+        self.assertTrue(np.allclose(b.center(), [0.5, 1.0, 0.25]))
+        self.assertTrue(b.is_inside(np.array([0.9, 1.9, 0.4])))
+        self.assertFalse(b.is_inside(np.array([1.1, 1.0, 0.25])))
+
+    def test_rotate_around(self):
+        b = Brick(self.module)
+        b.translate(np.array([1.0, 0.0, 0.0]))
+        b.rotate_around(quaternion.from_euler_angles(0, 0, math.pi), np.array([1.0, 0.0, 0.0]))
+        self.assertTrue(np.allclose(b.position, [1.0, 0.0, 0.0]))
+        self.assertTrue(np.allclose(b.center(), [0.0, -0.5, 0.25]))
+        self.assertTrue(np.isclose(abs(b.orientation.z), 1.0))
+
+    def test_rotated_dimensions(self):
+        self.assertEqual([2.0, 1.0, 0.5], self.module.get_rotated_dimensions(quaternion.one))
+        self.assertEqual([1.0, 2.0, 0.5], self.module.get_rotated_dimensions(
+            quaternion.from_euler_angles(0, 0, math.pi / 2)))
+        self.assertEqual([1.0, 0.5, 2.0], self.module.get_rotated_dimensions(
+            quaternion.from_euler_angles(math.pi / 2, math.pi / 2, 0)))
+        diagonal = self.module.get_rotated_dimensions(quaternion.from_euler_angles(0, 0, math.pi / 4))
+        self.assertEqual([round(3.0 / math.sqrt(2), 6)] * 2 + [0.5], diagonal)
+
+        # same rotation (also -q) again is served from the cache
+        hits = BrickInformation.rotated_dimensions_cache_info().hits
+        self.module.get_rotated_dimensions(-quaternion.from_euler_angles(0, 0, math.pi / 2))
+        self.assertEqual(hits + 1, BrickInformation.rotated_dimensions_cache_info().hits)
+
+
+class TestBrickArray(unittest.TestCase):
+    def setUp(self):
+        self.module = BrickInformation(2.0, 1.0, 0.5, grid=np.array([0.5, 0.5, 0.5]))
+        self.bricks = []
+        for i in range(4):
+            b = Brick(self.module)
+            b.rotate(quaternion.from_euler_angles(0, 0, i * math.pi / 2))
+            b.translate(np.array([i * 2.0, 0.0, 0.5]))
+            self.bricks.append(b)
+
+    def test_from_bricks(self):
+        array = BrickArray.from_bricks(self.bricks, wall_id=3, course=[0, 0, 1, 1])
+        self.assertEqual(4, len(array))
+        self.assertEqual(1, len(array.modules))
+        self.assertTrue(np.array_equal(array.courses, [0, 0, 1, 1]))
+        self.assertTrue(np.array_equal(array.wall_ids, [3, 3, 3, 3]))
+        self.assertTrue(np.allclose(array.positions, [b.position for b in self.bricks]))
+        self.assertTrue(np.allclose(array.centers, [b.center() for b in self.bricks]))
+
+    def test_brick_view(self):
+        array = BrickArray.from_bricks(self.bricks)
+        copy = BrickArray(array.centers, array.orientations, array.dimensions, array.module_ids,
+                          modules=array.modules)
+        for a, b in zip(copy, self.bricks):
+            self.assertTrue(np.allclose(a.position, b.position))
+            self.assertTrue(np.allclose(a.center(), b.center()))
+        self.assertIs(copy[0], copy.bricks()[0])
+
+    def test_concatenate(self):
+        a = BrickArray.from_bricks(self.bricks[:2], wall_id=0)
+        b = BrickArray.from_bricks([Brick(BrickInformation(1.0, 1.0, 0.5, self.module.grid))], wall_id=1)
+        c = BrickArray.concatenate([a, b, BrickArray()])
+        self.assertEqual(3, len(c))
+        self.assertEqual(2, len(c.modules))
+        self.assertTrue(np.array_equal(c.module_ids, [0, 0, 1]))
+        self.assertTrue(np.array_equal(c.wall_ids, [0, 0, 1]))
+
+    def test_neighborhood(self):
+        # a row of three bricks and one on top of the first two
+        bricks = []
+        for position in ([0.0, 0.0, 0.0], [2.0, 0.0, 0.0], [4.0, 0.0, 0.0], [1.0, 0.0, 0.5]):
+            bricks.append(Brick(self.module).translate(np.array(position)))
+        array = BrickArray(BrickArray.from_bricks(bricks).centers, dimensions=[b.get_dimensions() for b in bricks],
+                           modules=[self.module])
+        calculate_neighborhood(array)
+        self.assertIsNone(array._bricks)  # no Brick objects needed
+        neighbors = array.get_neighbor_lists()
+        self.assertEqual([1], neighbors[0][Neighbor.RIGHT])
+        self.assertEqual([0, 2], neighbors[1][Neighbor.LEFT] + neighbors[1][Neighbor.RIGHT])
+        self.assertEqual([3], neighbors[1][Neighbor.TOP])
+        self.assertEqual([0, 1], neighbors[3][Neighbor.BOTTOM])
+
+        # same neighbors for a list of bricks
+        calculate_neighborhood(bricks)
+        for i, b in enumerate(bricks):
+            for key in Neighbor:
+                self.assertEqual(neighbors[i][key], sorted(bricks.index(n) for n in b.neighbors[key]))
+        self.assertEqual({array[0]}, array[3].neighbors[Neighbor.BOTTOM] - {array[1]})
+
+        # and back to index pairs, e.g. for the exporters
+        converted = BrickArray.from_bricks_with_neighbors(bricks)
+        self.assertIs(bricks[0], converted[0])
+        self.assertEqual(neighbors, [{key: sorted(n[key]) for key in Neighbor} for n in converted.get_neighbor_lists()])
+
+
+if __name__ == '__main__':
+    unittest.main()
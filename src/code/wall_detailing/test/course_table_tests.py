@@ -0,0 +1,221 @@
+import itertools
+import math
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+import quaternion
+
+from masonry.bond.abstract_bond import Bond, Transformation
+from masonry.bond.block_bond import BlockBond
+from masonry.bond.course_table import course_fill_cache
+from masonry.bond.cross_bond import CrossBond
+from masonry.bond.gothic_bond import GothicBond
+from masonry.bond.head_bond import HeadBond
+from masonry.bond.stretched_bond import StretchedBond
+from masonry.brick import BrickInformation
+
+
+def walk_plan(bond: Bond, layer: int, length: float, x_offset: float = 0.0,
+              reversed: bool = False) -> Tuple[List[Transformation], float, float]:
+    """
+    how Bond.bricks_in_layer used to fill a course, by stepping through the plan until a brick does not fit anymore
+    """
+    transformations = bond.plan[layer % bond.repeat_layer]
+
+    def get(step: int) -> Transformation:
+        tf = transformations[step % len(transformations)].copy()
+        multiplier = math.floor(step / len(transformations))
+        tf.set_mask_multiplier(multiplier, multiplier, layer)
+        return tf
+
+    def brick_length(tf: Transformation) -> float:
+        return bond.module.get_rotated_dimensions(tf.get_rotation())[0]
+
+    # number of bricks in length + x_offset
+    tf = get(0)
+    pos = tf.get_position()
+    leftover_left = leftover_right = pos[0]
+    counter = 0
+    while round(pos[0] + brick_length(tf), 6) <= round(length + x_offset, 6):
+        leftover_right = max(leftover_right, pos[0] + brick_length(tf))
+        leftover_left = min(leftover_left, pos[0])
+        counter += 1
+        tf = get(counter)
+        pos = tf.get_position()
+    leftover_left, leftover_right = round(leftover_left, 6), round(leftover_right, 6)
+
+    ret = []
+    if counter == 0:
+        leftover_right = length - leftover_left
+    else:
+        any_bricks = False
+        for step in range(counter):
+            tf = get(step)
+            if tf.get_position()[0] >= x_offset:
+                diff = round(tf.get_position()[0] - x_offset, 6)
+                if not any_bricks:
+                    any_bricks = True
+                    leftover_left = diff
+                    before = get(step - 1)
+                    if leftover_left == brick_length(before):
+                        before.translation.offset[0] -= x_offset
+                        ret.append(before)
+                        leftover_left = 0
+                leftover_left = min(leftover_left, diff)
+                tf.translation.offset[0] -= x_offset
+                ret.append(tf)
+        if any_bricks:
+            leftover_right = length - round(leftover_right - x_offset, 6)
+            leftover_left = round(leftover_left, 6)
+        else:
+            leftover_left = length - leftover_left
+            leftover_right = length - leftover_left
+
+    if reversed:
+        leftover_right, leftover_left = leftover_left, leftover_right
+        for tf in ret:
+            tf.translation.offset[0] = length - tf.translation.offset[0] - brick_length(tf)
+            tf.mask_multiplier[0] *= -1
+    return ret, round(leftover_left, 6), round(leftover_right, 6)
+
+
+class GappedBond(HeadBond):
+    """
+    head bond with gaps between the bricks, so the brick before the x offset of a course may fit as well
+    """
+    def _get_plan(self) -> List[List[Transformation]]:
+        plan = super(GappedBond, self)._get_plan()
+        for tfs in plan:
+            for tf in tfs:
+                tf.translation.value[0] = self.w * 1.5
+        return plan
+
+class TestCourseTable(unittest.TestCase):
+    def setUp(self):
+        self.module = BrickInformation(2.0, 1.0, 0.5, grid=np.array([0.5, 0.5, 0.5]))
+        self.bond = StretchedBond(self.module)
+
+    def test_count(self):
+        table = self.bond.tables[0]
+        self.assertEqual((4, 0.0, 8.0), table.count(9.0))
+        self.assertEqual((5, 0.0, 10.0), table.count(10.0))
+        self.assertEqual(0, table.count(1.5)[0])
+
+        # the second layer starts half a brick further
+        table = self.bond.tables[1]
+        self.assertEqual((4, 1.0, 9.0), table.count(10.0))
+
+    def positions(self, table, fill):
+        return fill.x_offsets + table.values[fill.indices, 0] * table.masks[fill.indices, 0] * fill.multipliers[:, 0]
+
+    def test_fill(self):
+        table = self.bond.tables[0]
+        fill = table.fill(9.0, x_offset=1.0)
+        self.assertEqual(4, len(fill.indices))
+        self.assertTrue(np.allclose(self.positions(table, fill), [1.0, 3.0, 5.0, 7.0]))
+        self.assertEqual(1.0, fill.leftover_left)
+        self.assertEqual(0.0, fill.leftover_right)
+
+        fill = table.fill(9.0, x_offset=1.0, reversed=True)
+        self.assertTrue(np.allclose(self.positions(table, fill), [6.0, 4.0, 2.0, 0.0]))
+        self.assertEqual(0.0, fill.leftover_left)
+        self.assertEqual(1.0, fill.leftover_right)
+
+    def test_leftovers(self):
+        # many courses at once, some without any or without whole bricks, some with the brick before the offset
+        lengths = np.repeat(np.arange(0.0, 12.0, 0.25), 5)
+        x_offsets = np.tile([0.0, 0.25, 1.0, 2.0, 3.5], len(lengths) // 5)
+        for table in self.bond.tables + GappedBond(self.module).tables:
+            for reversed in (False, True):
+                left, right, num_bricks = table.leftovers(lengths, x_offsets, reversed)
+                for k in range(len(lengths)):
+                    fill = table.fill(lengths[k], x_offsets[k], reversed)
+                    self.assertEqual((fill.leftover_left, fill.leftover_right, len(fill.indices)),
+                                     (left[k], right[k], num_bricks[k]))
+
+        course_fill_cache.clear()
+        layers = np.arange(len(lengths)) % 4
+        left, right, num_bricks = self.bond.leftovers_of_layers(lengths, layers, x_offsets, True)
+        self.assertEqual([self.bond.leftover_of_layer(lengths[k], layers[k], x_offsets[k], True)
+                          for k in range(len(lengths))], list(zip(left, right, num_bricks)))
+        # the second time everything comes from the cache
+        hits = Bond.course_cache_info().hits
+        self.bond.leftovers_of_layers(lengths, layers, x_offsets, True)
+        self.assertEqual(hits + len(lengths), Bond.course_cache_info().hits)
+
+    def test_same_as_transformations(self):
+        # the same bricks and leftovers as the bond used to find by walking the plan brick by brick
+        bonds = [self.bond, StretchedBond(self.module, 0.25, True), CrossBond(self.module), GothicBond(self.module),
+                 HeadBond(self.module), BlockBond(self.module), GappedBond(self.module)]
+        for bond, layer, length, x_offset, reversed in itertools.product(bonds, range(4), np.arange(0.0, 10.0, 0.5),
+                                                                         [0.0, 0.5, 1.0, 2.0, 3.5], [False, True]):
+            tfs, left, right = bond.bricks_in_layer(layer, length, x_offset, reversed)
+            expected, expected_left, expected_right = walk_plan(bond, layer, length, x_offset, reversed)
+            self.assertEqual((expected_left, expected_right), (left, right))
+            self.assertEqual(len(expected), len(tfs))
+            for a, b in zip(expected, tfs):
+                self.assertTrue(np.allclose(a.get_position(), b.get_position()))
+                self.assertTrue(np.allclose(a.get_rotation(False), b.get_rotation(False)))
+
+    def test_fill_cache(self):
+        other = StretchedBond(self.module)
+        self.bond.leftover_of_layer(11.0, 2, x_offset=0.25)
+        hits = Bond.course_cache_info().hits
+        # same course on another storey and with another bond instance
+        left, right, n = other.leftover_of_layer(11.0, 4, x_offset=0.25)
+        self.assertEqual(hits + 1, Bond.course_cache_info().hits)
+        self.assertEqual((1.75, 1.25, 4), (left, right, n))
+
+        fill = other.fill(4, 11.0, x_offset=0.25)
+        with self.assertRaises(ValueError):
+            fill.x_offsets[0] = 1.0
+
+        # a different offset of the stretched bond is a different plan
+        misses = Bond.course_cache_info().misses
+        StretchedBond(self.module, offset=0.25).leftover_of_layer(11.0, 3, x_offset=0.25)
+        self.assertEqual(misses + 1, Bond.course_cache_info().misses)
+
+    def test_corner_lengths(self):
+        # maximal x coordinate of both corner layers, rotated by k * 45 degrees
+        expected = {
+            StretchedBond(self.module): [[1.0, 0.707107, 2.0, 2.12132, 1.0, 0.707107, 2.0, 2.12132],
+                                         [2.0, 0.707107, 1.0, 2.12132, 2.0, 0.707107, 1.0, 2.12132]],
+            CrossBond(self.module): [[2.0, 1.06066, 1.5, 2.474874, 2.0, 1.06066, 1.5, 2.474874],
+                                     [1.5, 1.06066, 2.0, 2.474874, 1.5, 1.06066, 2.0, 2.474874]],
+        }
+        for bond, lengths in expected.items():
+            self.assertEqual(len(lengths), bond.get_corner_plan_repeat_step())
+            for layer, k, eps in itertools.product(range(len(lengths)), range(8), [0.0, 1e-12, -1e-12]):
+                rotation = quaternion.from_euler_angles(0, 0, k * math.pi / 4 + eps)
+                self.assertAlmostEqual(lengths[layer][k], bond.get_corner_length(layer, rotation), places=6)
+                # the plan repeats for the storeys above
+                self.assertAlmostEqual(lengths[layer][k], bond.get_corner_length(layer + len(lengths), rotation),
+                                       places=6)
+
+    def test_concurrent_fill(self):
+        course_fill_cache.clear()
+        args = [(layer, 4.0 + 0.5 * i, 0.25 * (i % 3), i % 2 == 0) for layer in range(4) for i in range(20)]
+        expected = [self.bond.leftover_of_layer(length, layer, x, r) for layer, length, x, r in args]
+        course_fill_cache.clear()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            result = list(executor.map(lambda a: self.bond.leftover_of_layer(a[1], a[0], a[2], a[3]), args))
+        self.assertEqual(expected, result)
+
+    def test_apply_layers(self):
+        args = [(7.0, 1.0, True, False, 0, 0.0, False), (7.5, 1.0, True, True, 1, 0.25, True),
+                (0.5, 1.0, False, True, 3, 0.0, False), (9.0, 1.0, False, False, 2, 1.0, True)]
+        course = self.bond.apply_layers(*[[a[i] for a in args] for i in range(7)])
+        for i, (length, width, fill_left, fill_right, layer, x_offset, reversed) in enumerate(args):
+            tfs = self.bond.apply_layer(length, width, fill_left, fill_right, layer, x_offset, reversed)
+            mine = course.owners == i
+            self.assertEqual(len(tfs), np.count_nonzero(mine))
+            self.assertTrue(np.allclose([tf.get_position() for tf in tfs], course.positions[mine]))
+            self.assertTrue(np.allclose([tf.get_rotation(as_quaternion=False) for tf in tfs], course.rotations[mine]))
+            for tf, module_id in zip(tfs, course.module_ids[mine]):
+                self.assertEqual(tf.module, course.modules[module_id])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+from die_mathe.line import Line
+from die_mathe.segment_set import SegmentSet
+
+
+class TestSegmentSet(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # horizontal segments on a grid (like the layers of walls) and some in 3d
+        self.lines = []
+        for _ in range(60):
+            p = np.append(rng.integers(-5, 5, 2) * 0.5, rng.integers(0, 3) * 0.5)
+            direction = np.append(rng.choice([[1, 0], [0, 1], [1, 1], [-1, 0]]), 0) * rng.integers(1, 4)
+            self.lines.append(Line(p, p + direction))
+        for _ in range(20):
+            self.lines.append(Line(rng.normal(size=3), rng.normal(size=3)))
+        self.segments = SegmentSet.from_lines(self.lines)
+
+    def test_intersections(self):
+        pairs = self.segments.all_pairs(self.segments)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        points, valid = self.segments.intersections(self.segments, pairs)
+        self.assertGreater(np.count_nonzero(valid), 0)
+        for (i, j), point, is_valid in zip(pairs, points, valid):
+            expected = self.lines[i].intersection(self.lines[j])
+            self.assertEqual(expected is not None, is_valid)
+            if expected is not None:
+                self.assertTrue(np.allclose(expected, point))
+
+    def test_contains_and_distances(self):
+        rng = np.random.default_rng(1)
+        points = np.column_stack([rng.integers(-5, 5, (len(self.lines), 2)) * 0.5, self.segments.p1[:, 2]])
+        # endpoints and mid points lie on their segments
+        points[::3] = self.segments.p1[::3]
+        points[1::3] = (self.segments.p1[1::3] + self.segments.p2[1::3]) / 2.0
+
+        contains = self.segments.contains(points)
+        distances = self.segments.distances(points)
+        for line, point, c, d in zip(self.lines, points, contains, distances):
+            self.assertEqual(line.on_line(point), c)
+            self.assertAlmostEqual(line.distance_to_line(point), d)
+        self.assertGreater(np.count_nonzero(contains), len(self.lines) / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,262 @@
+import itertools
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from copy import deepcopy
+
+import numpy as np
+
+from detailing.layered_solver import LayeredSolver
+from detailing.solution_cache import SolutionCache
+from detailing.solver_model import SolverModel
+from masonry.bond.stretched_bond import StretchedBond
+from masonry.brick import BrickInformation
+from masonry.corner_rep import check_for_corners
+from test.wall_fixtures import walls_around_square
+
+
+class TestSolverModel(unittest.TestCase):
+    def setUp(self):
+        self.module = BrickInformation(2.0, 1.0, 0.5, grid=np.array([1.0, 1.0, 0.5]))
+        self.bond = StretchedBond(self.module)
+
+        # four walls forming a closed square, two layers high
+        self.groups = walls_around_square(self.module, [8, 8, 8, 8], 1.0)
+        self.corners = check_for_corners(self.groups)
+        LayeredSolver(self.corners, self.bond).freeze(self.corners)
+
+    def test_topology(self):
+        model = SolverModel(self.corners, self.bond)
+        self.assertEqual(8, len(model.corners))
+        self.assertEqual(8, len(model.layers))
+        self.assertEqual(4, len(model.walls))
+        for c, corner in enumerate(model.corners):
+            bottom = model.corner_bottom[c]
+            self.assertEqual(self.corners.get_bottom_corner(corner), None if bottom < 0 else model.corners[bottom])
+
+    def test_reduce_like_corners(self):
+        model = SolverModel(self.corners, self.bond)
+        for c, corner in enumerate(model.corners):
+            for offset in range(self.bond.get_corner_plan_repeat_step()):
+                model.state.corner_plan_offset[c] = offset
+                for l in model.corner_layers[c]:
+                    # the same reduction on a copy of the actual objects
+                    corner_copy, layer_copy = deepcopy((corner, model.layers[l]))
+                    corner_copy.plan_offset = offset
+                    corner_copy.reduce_layer_length(layer_copy, self.bond)
+                    x, length = model.reduced_layer(c, l)
+                    self.assertEqual(layer_copy.translation[0], x)
+                    self.assertEqual(layer_copy.length, length)
+
+    def test_restore_and_write_back(self):
+        model = SolverModel(self.corners, self.bond)
+        model.set_corner_plan_offset(0, 1)
+        model.reduce_corner_layer_length(0)
+        state = model.snapshot()
+        self.assertFalse(np.array_equal(state.layer_length, model.initial.layer_length))
+
+        model.restore()
+        self.assertTrue(np.array_equal(model.state.layer_length, model.initial.layer_length))
+        self.assertFalse(model.state.corner_touched[0])
+
+        model.restore(state)
+        model.write_back()
+        self.assertTrue(model.corners[0].touched)
+        written = SolverModel(self.corners, self.bond)
+        self.assertTrue(np.array_equal(written.initial.layer_x, state.layer_x))
+        self.assertTrue(np.array_equal(written.initial.layer_length, state.layer_length))
+        self.assertEqual(model.all_holes(), written.all_holes())
+
+    def test_incremental_holes(self):
+        model = SolverModel(self.corners, self.bond)
+        solver = LayeredSolver(self.corners, self.bond)
+        self.assertTrue(np.all(model.state.dirty))
+        for layer in solver.get_complete_layers(model):
+            solver.solve_layer(model, layer)
+            holes = [model.holes_between_corner_and_layer(c, l) for c, l in model.pairs]
+            self.assertFalse(np.any(model.state.dirty))
+
+            # the same as calculating everything again
+            model.state.dirty[:] = True
+            self.assertEqual(holes, [model.holes_between_corner_and_layer(c, l) for c, l in model.pairs])
+
+        # scoring candidates does not change the state
+        c, l = model.pairs[0]
+        offsets = list(range(self.bond.get_corner_plan_repeat_step()))
+        state = model.snapshot()
+        candidates = model.holes_with_corner_plan_offsets(c, l, offsets)
+        self.assertEqual(state.corner_plan_offset.tolist(), model.state.corner_plan_offset.tolist())
+        self.assertEqual(model.holes_between_corner_and_layer(c, l), candidates[state.corner_plan_offset[c] % len(offsets)])
+
+        # all candidates at once are the same as setting each of them
+        wall_offsets = list(range(self.bond.repeat_layer))
+        for c, l in model.pairs:
+            wall = model.layer_wall[l]
+            corner_candidates = model.holes_with_corner_plan_offsets(c, l, offsets)
+            wall_candidates = model.holes_with_wall_plan_offsets(c, l, wall_offsets)
+            for offset in offsets:
+                model.restore(state)
+                model.state.corner_plan_offset[c] = offset
+                model.state.dirty[:] = True
+                self.assertEqual(model.holes_between_corner_and_layer(c, l), corner_candidates[offset])
+            for offset in wall_offsets:
+                model.restore(state)
+                model.state.wall_plan_offset[wall] = offset
+                model.state.dirty[:] = True
+                self.assertEqual(model.holes_between_corner_and_layer(c, l), wall_candidates[offset])
+            model.restore(state)
+
+    def test_solve(self):
+        solver = LayeredSolver(self.corners, self.bond)
+        solver.solve()
+        self.assertTrue(all(g.touched for g in self.groups))
+        self.assertEqual(0, solver.all_holes(self.corners))
+
+    def open_walls(self, x: float = 0.0):
+        # open wall that leaves holes with every starter corner
+        return walls_around_square(self.module, [8, 7.5, 8], 1.5, np.array([x, 0.0]))
+
+    def test_search_like_all_combinations(self):
+        corners = check_for_corners(self.open_walls())
+        solver = LayeredSolver(corners, self.bond)
+        solver.freeze(corners)
+        model = SolverModel(corners, self.bond)
+        layers = solver.get_complete_layers(model)
+        starter_layers = [solver.solve_layer(model, layer) for layer in layers]
+        starters = [list(range(len(l))) for l, s in zip(layers, starter_layers) if s]
+        score = model.all_holes()
+        self.assertGreater(score, 0)
+
+        # what the solver used to do
+        expected_config, expected_score = tuple(s[0] for s in starters), score
+        for config in reversed(list(itertools.product(*starters))):
+            model.restore()
+            solver.apply_config(model, layers, config)
+            tmp = model.all_holes()
+            if tmp <= expected_score:
+                expected_config, expected_score = config, tmp
+                if expected_score == 0:
+                    break
+
+        initial = tuple(s[0] for s in starters)
+        model.restore()
+        self.assertEqual((expected_config, expected_score), solver.search(model, layers, starter_layers, initial, score))
+
+        # splitting the configurations between workers does not change the result
+        for executor in [ThreadPoolExecutor(max_workers=4), ProcessPoolExecutor(max_workers=2)]:
+            with executor:
+                model.restore()
+                self.assertEqual((expected_config, expected_score),
+                                 solver.search(model, layers, starter_layers, initial, score, executor))
+
+    def test_components(self):
+        model = SolverModel(self.corners, self.bond)
+        self.assertEqual([list(range(8))], model.components())
+
+        # the same walls twice, far away from each other
+        def solved(executor):
+            groups = self.open_walls() + self.open_walls(x=20.0)
+            corners = check_for_corners(groups)
+            solver = LayeredSolver(corners, self.bond, executor)
+            solver.freeze(corners)
+            self.assertEqual(2, len(SolverModel(corners, self.bond).components()))
+            self.assertEqual(2, len(solver.get_components(SolverModel(corners, self.bond))))
+            solver.solve()
+            return [(g.plan_offset, [(l.translation[0], l.length) for l in g.layers]) for g in groups], \
+                solver.all_holes(corners)
+
+        result, holes = solved(None)
+        self.assertGreater(holes, 0)
+        self.assertEqual(result[:3], result[3:])
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual((result, holes), solved(executor))
+
+        # a component without holes next to one with holes is searched again, on the executor as well
+        def mixed(executor):
+            groups = self.open_walls() + walls_around_square(self.module, [8, 8, 8, 8], 1.5, np.array([20.0, 0.0]))
+            corners = check_for_corners(groups)
+            solver = LayeredSolver(corners, self.bond, executor)
+            solver.solve()
+            return [(g.plan_offset, [(l.translation[0], l.length) for l in g.layers]) for g in groups], \
+                [c.plan_offset for c in corners.corners], solver.all_holes(corners)
+
+        expected = mixed(None)
+        self.assertGreater(expected[2], 0)
+        for executor in [ThreadPoolExecutor(max_workers=2), ProcessPoolExecutor(max_workers=2)]:
+            with executor:
+                self.assertEqual(expected, mixed(executor))
+
+    def test_budget(self):
+        calls = []
+        solver = LayeredSolver(check_for_corners(self.open_walls()), self.bond)
+        result = solver.solve(max_trials=1, progress=lambda *args: calls.append(args))
+        self.assertEqual(1, result.trials)
+        self.assertFalse(result.optimal)
+        self.assertEqual([(1, result.holes)], [c[:2] for c in calls])
+        self.assertEqual(result.holes, solver.all_holes(solver.corners))
+
+        solver = LayeredSolver(check_for_corners(self.open_walls()), self.bond)
+        complete = solver.solve(time_budget=60)
+        self.assertTrue(complete.optimal)
+        self.assertLessEqual(complete.holes, result.holes)
+        self.assertEqual(0, LayeredSolver(check_for_corners(self.open_walls()), self.bond).solve(time_budget=0).trials)
+
+    def test_replicas(self):
+        corners = check_for_corners(walls_around_square(self.module, [8, 8, 8, 8], 4.0))
+        solver = LayeredSolver(corners, self.bond)
+        solver.freeze(corners)
+
+        def solved(replicas: bool):
+            model = SolverModel(corners, self.bond)
+            courses = solver.get_complete_layers(model)
+            if replicas:
+                model.find_replicas(courses)
+                self.assertEqual(len(courses) - model.period, len(model.replicas))
+            for course in courses:
+                solver.solve_layer(model, course)
+            return model.snapshot(), model.all_holes()
+
+        state, holes = solved(True)
+        expected, expected_holes = solved(False)
+        self.assertEqual(expected_holes, holes)
+        for name in ["layer_x", "layer_length", "corner_plan_offset", "corner_touched", "wall_plan_offset"]:
+            self.assertTrue(np.array_equal(getattr(expected, name), getattr(state, name)), name)
+
+    def test_solution_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "solutions.jsonl")
+
+            def solved(cache: SolutionCache, x: float = 0.0):
+                groups = self.open_walls(x)
+                corners = check_for_corners(groups)
+                result = LayeredSolver(corners, self.bond, cache=cache).solve()
+                points = [tuple(np.round(c.point - np.array([x, 0.0, 0.0]), 6)) for c in corners.corners]
+                return result, [(g.plan_offset, [(l.translation[0], l.length) for l in g.layers]) for g in groups], \
+                    sorted((p, c.plan_offset) for p, c in zip(points, corners.corners))
+
+            expected, walls, corners = solved(SolutionCache(path))
+            self.assertGreater(expected.trials, 0)
+            self.assertEqual(1, len(SolutionCache(path).solutions))
+
+            # the walls are created again (other ids, other order of everything) and still found
+            result, cached_walls, cached_corners = solved(SolutionCache(path))
+            self.assertEqual(0, result.trials)
+            self.assertEqual(expected.holes, result.holes)
+            self.assertEqual(walls, cached_walls)
+            self.assertEqual(corners, cached_corners)
+
+            # so are the same walls somewhere else
+            result, cached_walls, cached_corners = solved(SolutionCache(path), x=20.0)
+            self.assertEqual(0, result.trials)
+            self.assertEqual(walls, cached_walls)
+            self.assertEqual(corners, cached_corners)
+
+            # a different model is not
+            groups = walls_around_square(self.module, [8, 8, 7.5], 1.5)
+            self.assertGreater(LayeredSolver(check_for_corners(groups), self.bond,
+                                             cache=SolutionCache(path)).solve().trials, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
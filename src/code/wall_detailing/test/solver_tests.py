@@ -1,11 +1,17 @@
+import itertools
 import unittest
 
-from detailing.solver import Solver, GraphSolver
-from masonry.corner import Corns, check_for_corners
-from masonry.bond import Bond, StrechedBond
+from detailing.graph_solver import GraphSolver, Factor
+from detailing.layered_solver import LayeredSolver
+from detailing.local_search_solver import LocalSearchSolver
+from detailing.solver_model import SolverModel
+from masonry.corner_rep import Corn, Corns, check_for_corners, layer_pairs_touching_at_endpoints
+from masonry.bond.stretched_bond import StretchedBond
+from masonry.bond.cross_bond import CrossBond
 from detailing.wall import Wall
 from detailing.wall_layer_group import WallLayerGroup
 from masonry.brick import BrickInformation
+from test.wall_fixtures import walls_around_square
 from copy import deepcopy
 
 import numpy as np
@@ -19,7 +25,8 @@ class TestSolver(unittest.TestCase):
         self.brick_height = 0.5
         self.height = self.brick_height * self.num_layers
 
-        self.brick_information = {"test": [BrickInformation(2, 1, self.brick_height)]}
+        self.brick_information = {"test": [BrickInformation(2, 1, self.brick_height,
+                                                            grid=np.array([1.0, 1.0, self.brick_height]))]}
         self.length = 10
         self.rotated_w0 = True
 
@@ -39,7 +46,7 @@ class TestSolver(unittest.TestCase):
             layer_group = WallLayerGroup.from_wall(w, self.module)
             self.wall_layer_groups.append(layer_group)
 
-        self.bond = StrechedBond(self.module)
+        self.bond = StretchedBond(self.module)
         self.corns = check_for_corners(self.wall_layer_groups)
         self.solver = GraphSolver(self.corns, self.bond)
 
@@ -67,6 +74,149 @@ class TestSolver(unittest.TestCase):
                 #print(a)
                 print("")
 
+    def test_bottom_corners(self):
+        for wall in self.wall_layer_groups:
+            bottom = self.solver.get_all_corners_of_wall(wall.id, True)
+            self.assertEqual(1, len(bottom))
+            self.assertEqual(self.num_layers, len(self.solver.get_all_corners_of_wall(wall.id)))
+
+    def test_layer_pairs(self):
+        # the grid finds the same pairs as comparing every layer with every other one
+        groups = walls_around_square(self.module, [8, 8, 8, 8], 1.5) + \
+            walls_around_square(self.module, [7.5, 8, 8], 1.5)
+        expected = []
+        for i, w1 in enumerate(groups):
+            for j in range(i + 1, len(groups)):
+                for k1, l1 in enumerate(w1.layers):
+                    for k2, l2 in enumerate(groups[j].layers):
+                        if l1.is_touching_at_endpoints(l2, tolerance=w1.wall.width):
+                            expected.append((i, j, k1, k2))
+        pairs = layer_pairs_touching_at_endpoints(groups)
+        self.assertGreater(len(expected), 0)
+        self.assertTrue(set(expected).issubset(pairs))
+        self.assertEqual(sorted(pairs), pairs)
+
+    def test_corner_index(self):
+        corners = check_for_corners(walls_around_square(self.module, [8, 8, 8, 8], 1.5))
+        for cs in [corners, deepcopy(corners)]:
+            for corner in cs.corners:
+                self.assertIs(corner, cs.get_corner(list(corner.layers)))
+                bottom = cs.get_bottom_corner(corner)
+                self.assertTrue(bottom is None or cs.get_top_corner(bottom) is corner)
+
+        # every corner lies in exactly one course, the square has one course for each layer
+        LayeredSolver(corners, self.bond).freeze(corners)
+        courses = corners.get_courses()
+        self.assertEqual(list(range(len(corners.corners))), sorted(c for course in courses for c in course))
+        self.assertEqual(3, len(courses))
+        for course in courses:
+            self.assertEqual(sorted(course), sorted(corners.get_course(course[-1])))
+
+        # a corner at the same point only adds its layers
+        corner = corners.corners[0]
+        other = Corn(corner.point + 1e-9)
+        layer = next(l for c in corners.corners[1:] for l in c.layers if l not in corner.layers)
+        other.layers.add(layer)
+        count = len(corners.corners)
+        corners.add_corner(other)
+        self.assertEqual(count, len(corners.corners))
+        self.assertIs(corner, corners.get_corner([layer] + [l for l in corner.layers if l is not layer]))
+
+    def test_far_away_corners(self):
+        # the same square far away from the origin, where np.allclose allows corners to be much further apart
+        offset = np.array([1e5, 1e5])
+        near = check_for_corners(walls_around_square(self.module, [8, 8, 8, 8], 1.5))
+        corners = check_for_corners(walls_around_square(self.module, [8, 8, 8, 8], 1.5, offset))
+        self.assertEqual(len(near.corners), len(corners.corners))
+        for a, b in zip(near.corners, corners.corners):
+            self.assertTrue(np.allclose(a.point + np.append(offset, 0.0), b.point))
+            self.assertEqual(len(a.layers), len(b.layers))
+
+        # a corner that is equal to the first one, but a lot of the smallest cells away, only adds its layers
+        corner = corners.corners[0]
+        other = Corn(corner.point + np.array([0.5, 0.5, 0.0]))
+        self.assertTrue(other == corner)
+        layer = next(l for c in corners.corners[1:] for l in c.layers if l not in corner.layers)
+        other.layers.add(layer)
+        corners.add_corner(other)
+        self.assertEqual(len(near.corners), len(corners.corners))
+        self.assertIs(corner, corners.get_corner([layer] + [l for l in corner.layers if l is not layer]))
+
+        # so does a corner at the origin after the cells have grown
+        origin = Corn(np.zeros(3))
+        far = Corn(np.array([offset[0], offset[1], 0.0]))
+        for c in [origin, far, Corn(np.full(3, 1e-9)), Corn(far.point - np.array([0.5, 0.5, 0.0]))]:
+            near.add_corner(c)
+        self.assertIs(origin, near.corners[-2])
+        self.assertIs(far, near.corners[-1])
+        self.assertEqual(len(corners.corners) + 2, len(near.corners))
+
+    def test_like_layered_solver(self):
+        # a chain that leaves holes, a closed cycle without holes and the two walls of setUp
+        for bond in [self.bond, CrossBond(self.module)]:
+            for groups in [walls_around_square(self.module, [8, 7.5, 8], 1.5),
+                           walls_around_square(self.module, [8, 8, 8, 8], 1.5), deepcopy(self.wall_layer_groups)]:
+                corners = check_for_corners(groups)
+                copy = deepcopy(corners)
+                LayeredSolver(corners, bond).solve()
+                solver = GraphSolver(copy, bond)
+                solver.solve()
+                # the graph solver finds the best solution, the layered solver not always
+                self.assertLessEqual(solver.all_holes(copy), solver.all_holes(corners))
+                self.assertTrue(all(c.touched for c in copy.corners))
+
+    def test_graph_solver_optimal(self):
+        # the same as trying out all plan offsets of all walls and stacks of corners
+        for bond in [self.bond, CrossBond(self.module)]:
+            corners = check_for_corners(walls_around_square(self.module, [8, 7.5, 8], 1.0))
+            copy = deepcopy(corners)
+            solver = GraphSolver(copy, bond)
+            solver.solve()
+
+            solver.freeze(corners)
+            model = SolverModel(corners, bond)
+            root, depth = model.stacks()
+            walls = sorted(set(int(model.layer_wall[l]) for l, cs in enumerate(model.corners_of_layer) if len(cs) > 0))
+            stacks = sorted(set(root))
+            best = None
+            for wall_offsets in itertools.product(range(bond.repeat_layer), repeat=len(walls)):
+                for stack_offsets in itertools.product(range(bond.get_corner_plan_repeat_step()), repeat=len(stacks)):
+                    model.restore()
+                    for w, offset in zip(walls, wall_offsets):
+                        model.set_wall_plan_offset(w, offset)
+                    stack_offset = dict(zip(stacks, stack_offsets))
+                    for c in range(len(model.corners)):
+                        model.set_corner_plan_offset(c, stack_offset[root[c]] + depth[c])
+                    for c in range(len(model.corners)):
+                        model.reduce_corner_layer_length(c)
+                    holes = model.all_holes()
+                    best = holes if best is None else min(best, holes)
+            self.assertGreater(best, 0)
+            self.assertEqual(best, solver.all_holes(copy))
+
+    def test_local_search(self):
+        def solved(seed):
+            groups = walls_around_square(self.module, [8, 7.5, 8, 7.5], 1.5)
+            corners = check_for_corners(groups)
+            result = LocalSearchSolver(corners, self.bond, seed=seed).solve()
+            return result.holes, [g.plan_offset for g in groups], [c.plan_offset for c in corners.corners]
+
+        greedy = walls_around_square(self.module, [8, 7.5, 8, 7.5], 1.5)
+        corners = check_for_corners(greedy)
+        result = LayeredSolver(corners, self.bond).solve(time_budget=0)
+
+        # the same seed leads to the same solution, which is at least as good as the greedy one
+        self.assertEqual(solved(1), solved(1))
+        self.assertLessEqual(solved(1)[0], result.holes)
+
+    def test_eliminate(self):
+        # a cycle of three variables, the best choice is (1, 0, 1)
+        domains = {0: 2, 1: 2, 2: 2}
+        factors = [Factor((0, 1), np.array([[3.0, 3.0], [0.0, 3.0]])),
+                   Factor((1, 2), np.array([[1.0, 0.0], [0.0, 1.0]])),
+                   Factor((2, 0), np.array([[2.0, 2.0], [2.0, 0.0]]))]
+        self.assertEqual({0: 1, 1: 0, 2: 1}, self.solver.eliminate(domains, factors))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
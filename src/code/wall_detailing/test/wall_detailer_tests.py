@@ -0,0 +1,210 @@
+import math
+import random
+import unittest
+from typing import List, Dict, Tuple
+
+import numpy as np
+import quaternion
+
+from detailing.layered_solver import LayeredSolver
+from detailing.wall import Wall
+from detailing.wall_layer_group import WallLayerGroup
+from masonry.bond.abstract_bond import Bond
+from masonry.bond.block_bond import BlockBond
+from masonry.bond.cross_bond import CrossBond
+from masonry.bond.gothic_bond import GothicBond
+from masonry.bond.head_bond import HeadBond
+from masonry.bond.stretched_bond import StretchedBond
+from masonry.brick import BrickInformation, Brick
+from masonry.brick_array import BrickArray
+from masonry.corner_rep import check_for_corners, Corn
+from test.wall_fixtures import walls_around_square
+from wall_detailer import WallDetailer
+
+
+def combine_greedy(wall_layer_groups: List[WallLayerGroup]) -> List[WallLayerGroup]:
+    """
+    how WallDetailer.combine_layer_groups used to combine the walls, every wall with every other one
+    """
+    groups = wall_layer_groups.copy()
+    ret = []
+
+    combined = False
+    while len(groups) > 0:
+        if not combined:
+            curr = groups.pop(0)
+            ret.append(curr)
+
+        combined = False
+        for g in groups:
+            combined = curr.combine(g)
+            if combined:
+                groups.remove(g)
+                break
+    return ret
+
+
+def detail_wall_per_brick(wall: WallLayerGroup, bond: Bond) -> List[Brick]:
+    """
+    how WallDetailer.detail_wall used to place the bricks, one Brick object after the other
+    """
+    brick_ret = []
+    original_rotation = wall.get_rotation()
+    module = wall.module
+
+    original_translation = wall.get_translation()
+    for layer in wall.get_sorted_layers(grouped=False):
+        dimensions = np.array([layer.length, wall.wall.width, module.height])
+        transformations = bond.apply_layer(length=layer.length,
+                                           width=wall.wall.width,
+                                           fill_left=len(layer.left_connections) == 0,
+                                           fill_right=len(layer.right_connections) == 0,
+                                           layer=layer.get_layer_plan_index(),
+                                           x_offset=layer.relative_x_offset(),
+                                           reversed=layer.parent.reversed)
+
+        for tf in transformations:
+            local_position = tf.get_position()
+            b = Brick(tf.module)
+            b.rotate(tf.get_rotation())
+            center = layer.translation.copy() - dimensions / 2.0
+            local_position += center
+            local_position[2] = center[2]
+            b.translate(local_position)
+            b.rotate_around(original_rotation)
+            b.translate(original_translation)
+            brick_ret.append(b)
+    return brick_ret
+
+
+class TestWallDetailer(unittest.TestCase):
+    def setUp(self):
+        self.module = BrickInformation(2.0, 1.0, 0.5, grid=np.array([1.0, 1.0, 0.5]))
+
+    def wall(self, x: float, y: float, z: float, length: float, height: float, angle: float,
+             name: str = "w") -> WallLayerGroup:
+        w = Wall.make_wall(length, 1, height, np.array([x, y, z + height / 2.0]),
+                           quaternion.from_euler_angles(0, 0, angle), ifc_wall_type="test", name=name)
+        return WallLayerGroup.from_wall(w, self.module)
+
+    def split_walls(self, seed: int) -> List[WallLayerGroup]:
+        rng = random.Random(seed)
+        walls = []
+        # a facade split into many touching segments, some of them the other way round
+        x = 0.0
+        for i in range(30):
+            length = rng.choice([2.0, 4.0, 6.0])
+            walls.append(self.wall(x + length / 2.0, 0.0, 0.0, length, 1.0, rng.choice([0.0, math.pi])))
+            x += length
+        # a second storey on top of part of it, an overlapping piece and a gap on another line
+        walls.append(self.wall(10.0, 0.0, 1.0, 8.0, 1.0, 0.0))
+        walls.append(self.wall(12.0, 0.0, 1.0, 8.0, 1.0, math.pi))
+        walls.append(self.wall(0.0, 8.0, 0.0, 4.0, 1.0, 0.0))
+        walls.append(self.wall(5.0, 8.0, 0.0, 4.0, 1.0, 0.0))
+        # two touching walls across the others
+        walls.append(self.wall(0.0, 2.0, 0.0, 4.0, 1.0, math.pi / 2))
+        walls.append(self.wall(0.0, 6.0, 0.0, 4.0, 1.0, -math.pi / 2))
+        rng.shuffle(walls)
+        return walls
+
+    @staticmethod
+    def describe(groups: List[WallLayerGroup]) -> List[tuple]:
+        # the walls that are kept and the stretches of their line each of their courses covers
+        ret = []
+        for g in groups:
+            direction = np.array(g.get_line_key()[1])
+            courses = {}
+            for l in g.layers:
+                a, b = sorted((round(float(l.left_edge @ direction), 6), round(float(l.right_edge @ direction), 6)))
+                courses.setdefault(round(float(l.center[2]), 6), []).append([a, b])
+            for z, intervals in courses.items():
+                merged = []
+                for a, b in sorted(intervals):
+                    if len(merged) > 0 and a <= merged[-1][1]:
+                        merged[-1][1] = max(merged[-1][1], b)
+                    else:
+                        merged.append([a, b])
+                courses[z] = merged
+            ret.append((g.wall.name, sorted(courses.items())))
+        return ret
+
+    def test_combine_layer_groups(self):
+        for seed in range(5):
+            expected = self.split_walls(seed)
+            walls = self.split_walls(seed)
+            for i, (a, b) in enumerate(zip(expected, walls)):
+                a.wall.name = b.wall.name = "w" + str(i)
+
+            greedy = combine_greedy(expected)
+            combined = WallDetailer([]).combine_layer_groups(walls)
+            self.assertLess(len(combined), len(walls))
+            self.assertEqual(self.describe(greedy), self.describe(combined))
+            # touching layers of one course end up in one layer, the greedy sometimes left them apart
+            self.assertLessEqual(sum(len(g.layers) for g in combined), sum(len(g.layers) for g in greedy))
+
+    def test_detail_walls(self):
+        walls = [self.wall(0.0, 0.0, 0.0, 9.0, 1.5, 0.0), self.wall(3.0, 4.0, 0.0, 7.5, 1.0, math.pi / 2),
+                 self.wall(-2.0, 1.0, 0.5, 4.0, 1.5, math.pi), self.wall(5.0, -3.0, 0.0, 6.5, 1.0, 0.3)]
+        # another plan offset, a reversed wall and layers with connections (no filling at their ends)
+        walls[1].set_plan_offset(2)
+        walls[2].reversed = True
+        walls[3].layers[0].left_connections.append(walls[0].layers[0])
+        walls[0].layers[1].right_connections.append(walls[3].layers[1])
+        for i, w in enumerate(walls):
+            w.id = i
+
+        for bond in [StretchedBond(self.module), CrossBond(self.module), HeadBond(self.module),
+                     GothicBond(self.module), BlockBond(self.module)]:
+            array = WallDetailer([]).detail_walls(walls, bond)
+            expected = [(i, b) for i, w in enumerate(walls) for b in detail_wall_per_brick(w, bond)]
+            self.assertEqual(len(expected), len(array), type(bond).__name__)
+            self.assertTrue(np.array_equal([i for i, _ in expected], array.wall_ids))
+            self.assertTrue(np.allclose([b.position for _, b in expected], array.positions))
+            self.assertTrue(np.allclose([b.center() for _, b in expected], array.centers))
+            self.assertTrue(np.allclose([b.get_dimensions() for _, b in expected], array.dimensions))
+            self.assertTrue(np.allclose(quaternion.as_rotation_matrix(np.array([b.orientation for _, b in expected])),
+                                        array.rotation_matrices()))
+
+    def assertSameBricks(self, expected: BrickArray, array: BrickArray):
+        self.assertEqual(len(expected), len(array))
+        self.assertTrue(np.allclose(expected.centers, array.centers))
+        self.assertTrue(np.allclose(expected.rotation_matrices(), array.rotation_matrices()))
+        self.assertTrue(np.allclose(expected.dimensions, array.dimensions))
+        self.assertTrue(np.array_equal(expected.wall_ids, array.wall_ids))
+        self.assertTrue(np.array_equal(expected.courses, array.courses))
+
+    def test_shift_corner(self):
+        detailer = WallDetailer([])
+        for bond in [StretchedBond(self.module), CrossBond(self.module)]:
+            # four courses of the same four corners
+            corners = check_for_corners(walls_around_square(self.module, [8, 8, 8, 8], 2.0))
+            LayeredSolver(corners, bond).solve()
+            repeat = bond.get_corner_plan_repeat_step()
+
+            below: Dict[tuple, Tuple[Corn, BrickArray]] = {}
+            reused = []
+            for corner in sorted(corners.corners, key=lambda c: c.point[2]):
+                fresh = detailer.detail_corner(corner, bond)
+                key = WallDetailer.corner_key(corner, bond)
+                if key not in below:
+                    below[key] = (corner, fresh)
+                    continue
+                first, cached = below[key]
+                dz = corner.point[2] - first.point[2]
+                self.assertSameBricks(fresh, WallDetailer.shift_corner(cached, corner, dz))
+                reused.append(corner.plan_offset - first.plan_offset)
+            self.assertEqual(2 * 4, len(reused))
+            # the corners a course apart are detailed, the ones a full repeat of the corner plan apart are reused
+            self.assertEqual(len(reused) * [repeat], reused)
+            self.assertEqual(2 * 4, len(below))
+
+            # shifting the corner a course below would give other bricks
+            lowest = min(corners.corners, key=lambda c: c.point[2])
+            upper = [c for c in corners.corners if np.allclose(c.point[:2], lowest.point[:2])
+                     and np.isclose(c.point[2] - lowest.point[2], self.module.height)][0]
+            shifted = WallDetailer.shift_corner(detailer.detail_corner(lowest, bond), upper, self.module.height)
+            self.assertFalse(np.allclose(detailer.detail_corner(upper, bond).centers, shifted.centers))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import math
+from typing import List
+
+import numpy as np
+import quaternion
+
+from detailing.wall import Wall
+from detailing.wall_layer_group import WallLayerGroup
+from masonry.brick import BrickInformation
+
+
+def walls_around_square(module: BrickInformation, lengths: List[float], height: float,
+                        offset: np.array = np.array([0.0, 0.0])) -> List[WallLayerGroup]:
+    """
+    walls around a 7 x 7 square standing on z = 0, one after another (counterclockwise, starting at the bottom)
+    :param module: the module the walls are cut into layers with
+    :param lengths: the length of each wall (up to four walls)
+    :param height: height of all walls
+    :param offset: x and y offset of all walls
+    :return: the walls as WallLayerGroups
+    """
+    walls = []
+    for i, position in enumerate([[0.0, -3.5], [3.5, 0.0], [0.0, 3.5], [-3.5, 0.0]][:len(lengths)]):
+        walls.append(Wall.make_wall(lengths[i], 1, height,
+                                    np.array([position[0] + offset[0], position[1] + offset[1], height / 2.0]),
+                                    quaternion.from_euler_angles(0, 0, i * math.pi / 2),
+                                    ifc_wall_type="test", name="w" + str(i)))
+    return [WallLayerGroup.from_wall(w, module) for w in walls]
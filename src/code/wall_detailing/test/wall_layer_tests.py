@@ -16,7 +16,8 @@ class TestWallLayer(unittest.TestCase):
         self.brick_height = 0.5
         self.height = self.brick_height * self.num_layers
 
-        self.brick_information = {"test": [BrickInformation(2, 1, self.brick_height)]}
+        self.brick_information = {"test": [BrickInformation(2, 1, self.brick_height,
+                                                            grid=np.array([1.0, 1.0, self.brick_height]))]}
         self.length = 10
         self.rotated_w0 = True
 
@@ -127,6 +128,72 @@ class TestWallLayer(unittest.TestCase):
         n = p - [0.0, 2.0, 0.0]
         self.assertTrue(np.allclose(n, l.left_edge))
 
+    def test_line_key(self):
+        def wall(x, y, length, angle):
+            w = Wall.make_wall(length, 1, 1.0, np.array([x, y, 0.5]), quaternion.from_euler_angles(0, 0, angle),
+                               ifc_wall_type="test", name="w")
+            return WallLayerGroup.from_wall(w, self.module)
+
+        a, b = wall(0.0, 0.0, 4, 0.0), wall(4.0, 0.0, 4, math.pi)
+        self.assertEqual(a.get_line_key(), b.get_line_key())
+        self.assertNotEqual(a.get_line_key(), wall(0.0, 1.0, 4, 0.0).get_line_key())
+        self.assertNotEqual(a.get_line_key(), wall(0.0, 0.0, 4, math.pi / 2).get_line_key())
+        self.assertEqual((-2.0, 2.0), a.get_line_interval())
+        self.assertEqual((2.0, 6.0), b.get_line_interval())
+
+    def test_courses(self):
+        def wall(x, length):
+            w = Wall.make_wall(length, 1, 1.5, np.array([x, 0.0, 0.75]), quaternion.from_euler_angles(0, 0, 0),
+                               ifc_wall_type="test", name="w")
+            return WallLayerGroup.from_wall(w, self.module)
+
+        a = wall(0.0, 4)
+        bottom, mid, top = a.layers
+        self.assertEqual([[bottom], [mid], [top]], a.get_sorted_layers())
+        self.assertEqual([0, 1, 2], [l.get_layer_index() for l in a.layers])
+        self.assertEqual([mid], bottom.tops)
+        self.assertEqual([], bottom.bottoms)
+        self.assertEqual([], top.tops)
+        self.assertIsNone(a.top_of_layer(wall(0.0, 4).layers[0]))
+
+        # the x range is kept when layers get shorter...
+        self.assertEqual((-2.0, 2.0), a.get_x_range())
+        for l in a.layers:
+            l.reduce_length(1, from_left=True)
+        self.assertEqual(-2.0, a.get_lowest_local_x())
+        self.assertEqual(1.0, deepcopy(bottom).relative_x_offset())
+
+        # ...but not when layers are combined
+        self.assertTrue(a.combine(wall(4.0, 4)))
+        self.assertEqual((-1.0, 6.0), a.get_x_range())
+        self.assertEqual([[bottom], [mid], [top]], a.get_sorted_layers())
+        copy = deepcopy(top)
+        self.assertEqual(2, copy.get_layer_index())
+        self.assertEqual([copy.parent.layers[1]], copy.bottoms)
+
+    def test_cached_edges(self):
+        def world(group, point):
+            return quaternion.rotate_vectors(group.get_rotation(), point) + group.get_translation()
+
+        group = self.wall_layer_groups[0]
+        layer = group.layers[0]
+        self.assertTrue(np.array_equal(world(group, layer.get_left_edge(True)), layer.left_edge))
+        self.assertTrue(np.array_equal(world(group, layer.get_right_edge(True)), layer.right_edge))
+
+        # the cache follows changes of the layer and of its wall
+        right = layer.right_edge
+        layer.move_edge(layer.left_edge, 1)
+        self.assertEqual(self.length - 1, layer.length)
+        self.assertTrue(np.array_equal(right, layer.right_edge))
+        group.translation = group.get_translation() + np.array([1.0, 0.0, 0.0])
+        self.assertTrue(np.allclose(right + np.array([1.0, 0.0, 0.0]), layer.right_edge))
+        group.rotation = quaternion.from_euler_angles(0, 0, 0)
+        self.assertTrue(np.array_equal(world(group, layer.get_center(True)), layer.center))
+
+        self.assertTrue(layer.is_touching_at_endpoints(deepcopy(layer)))
+        self.assertTrue(layer.is_overlapping(deepcopy(layer)))
+        self.assertFalse(layer.is_overlapping(group.layers[1]))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,6 @@
 import os
-from typing import List, Dict
+from concurrent.futures import Executor
+from typing import List, Dict, Callable, Tuple
 import numpy as np
 import quaternion
 from OCC.Core import BRepAlgoAPI, TopTools
@@ -8,6 +9,7 @@ from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
 from OCC.Core.StlAPI import StlAPI_Writer
 
 from detailing.layered_solver import LayeredSolver
+from detailing.solution_cache import SolutionCache
 from detailing.wall_layer_group import WallLayerGroup
 from detailing.wall_type_group import WallTypeGroup
 from masonry.bond.abstract_bond import Bond
@@ -22,16 +24,16 @@ from masonry.bond.block_bond import BlockBond
 # --------------------------------------------- #
 
 from masonry.brick import BrickInformation, Brick
+from masonry.brick_array import BrickArray
 from detailing.wall import Wall
 from masonry.corner_rep import Corn, Corns
 from scenarios.scenarios import SimpleCorners, FancyCorners, SimpleCorners2, Window1, DoppelEck1, DoppelEck2_Closed, \
     SimpleOffset, DoppelEck3_Closed, SmallWall, TJoint1, Bug1, DoppelEck2_Closed_TJoint, ThickWall, ThickWallAllCorners, \
     OverlappingWalls, LucaScenario, EmptyScenario, LucaWaende_duenn, LucaWaende_dick
-from masonry import corner_rep
+from masonry import corner_rep, brick
 from wall_detailing.exporter.BrickExporter import BrickExporter
 from wall_detailing.exporter.BrickToOntologie import BrickToOntology
 from wall_detailing.importer.ifc_importer import IfcImporter
-from wall_detailing.masonry import brick
 from scenarios.scenarios_for_text.CombinationExample import CombinationExampleForText
 from scenarios.scenarios_for_text.SimpleWallEndings import Single_Wall_Slim, Single_Wall_Thick
 from wall_detailing.scenarios.scenarios_for_text.DifferentBonds import BasicsStretchedBond, BasicsCrossBond, \
@@ -46,14 +48,30 @@ from wall_detailing.scenarios.ifc_scenario import IFCScenario
 
 
 class WallDetailer:
-    def __init__(self, walls: List[Wall]):
+    def __init__(self, walls: List[Wall], executor: Executor = None, time_budget: float = None,
+                 max_trials: int = None, progress: Callable[[int, float, float], None] = None,
+                 cache: SolutionCache = None):
+        """
+        :param walls: the walls to detail
+        :param executor: if given, the solver tries out its starter configurations in parallel on this executor
+        :param time_budget: seconds the solver may spend on each wall type, see Solver.solve
+        :param max_trials: number of configurations the solver may try out for each wall type, see Solver.solve
+        :param progress: see Solver.solve
+        :param cache: if given, solutions of unchanged wall type groups are taken from there, see SolutionCache
+        """
         self.walls = walls
+        self.executor = executor
+        self.time_budget = time_budget
+        self.max_trials = max_trials
+        self.progress = progress
+        self.cache = cache
 
-    def detail(self):
+    def detail(self) -> BrickArray:
         """
         Actual detailing routine described in the latex files. This is the main entry point for the detailing process.
+        :return: all bricks of all walls as one BrickArray
         """
-        bricks = []
+        bricks: List[BrickArray] = []
         wall_type_groups: Dict[str, WallTypeGroup] = {}
 
         # convert walls to layergroups
@@ -85,97 +103,171 @@ class WallDetailer:
 
             print("created corners, now solving them")
             bond = group.bond
-            solver = LayeredSolver(cs, bond)
-            solver.solve()
+            solver = LayeredSolver(cs, bond, self.executor, self.cache)
+            result = solver.solve(self.time_budget, self.max_trials, self.progress)
+            if not result.optimal:
+                print("solver gave up after", result.trials, "tries, using the best solution found so far")
 
             print("now starting to calculate bricks")
+            # corners on top of each other with the same plan only differ in their height
+            corner_bricks: Dict[tuple, Tuple[BrickArray, float]] = {}
             for corner in cs.corners:
-                layers = list(corner.layers)
-                if len(layers) == 2:
-                    bricks.extend(self.detail_corner(corner, bond))
+                if len(corner.layers) == 2:
+                    key = self.corner_key(corner, bond)
+                    if key in corner_bricks:
+                        cached, z = corner_bricks[key]
+                        bricks.append(self.shift_corner(cached, corner, corner.point[2] - z))
+                    else:
+                        corner_array = self.detail_corner(corner, bond)
+                        corner_bricks[key] = (corner_array, corner.point[2])
+                        bricks.append(corner_array)
                 else:
                     # t-joint MAYDO combine t-joints
                     # crossing MAYDO combine two walls
                     pass
 
+            # all courses of all walls of this group at once
+            bricks.append(self.detail_walls(wall_layer_groups, bond))
             for wall in wall_layer_groups:
-                # wall.apply_openings()
-                bricks.extend(self.detail_wall(wall, bond))
-                bricks.extend(wall.get_opening_lintels())
-        return bricks
+                bricks.append(BrickArray.from_bricks(wall.get_opening_lintels(), wall_id=wall.id))
+        return BrickArray.concatenate(bricks)
 
     def combine_layer_groups(self, wall_layer_groups: List[WallLayerGroup]) -> List[WallLayerGroup]:
         """
         Combines all WallLayerGroups that touch, have the same z orientation and are at 0 / 180 degrees to each other
         or are exactly above / beyond each other
+        Only walls on the same line can be combined, so the walls are grouped by their line (see
+        WallLayerGroup.get_line_key) and each line is swept once along it (see combine_along_line)
         :param wall_layer_groups: List of WallLayerGroups we want to check for combination possibilities
         :return: a new possibly smaller list of WallLayerGroups. Input WallLayerGroup Object will be altered.
         """
-        groups = wall_layer_groups.copy()
+        lines: Dict[tuple, List[int]] = {}
+        for i, group in enumerate(wall_layer_groups):
+            lines.setdefault(group.get_line_key(), []).append(i)
+
+        # np.allclose (see WallLayer.is_touching_at_endpoints) allows a small relative error
+        points = [np.max(np.abs(edge)) for g in wall_layer_groups for l in g.layers
+                  for edge in (l.left_edge, l.right_edge)]
+        tolerance = 2.0 * (1e-8 + 1e-5 * max(points, default=0.0)) + 1e-9
+
         ret = []
+        for indices in lines.values():
+            ret.extend(self.combine_along_line(wall_layer_groups, indices, tolerance))
+        return [wall_layer_groups[i] for i in sorted(ret)]
 
-        combined = False
-        while len(groups) > 0:
-            if not combined:
-                curr = groups.pop(0)
-                ret.append(curr)
-
-            combined = False
-            for g in groups:
-                combined = curr.combine(g)
-                if combined:
-                    groups.remove(g)
-                    break
-        return ret
-
-    def detail_wall(self, wall: WallLayerGroup, bond: Bond) -> List[Brick]:
+    @staticmethod
+    def combine_along_line(wall_layer_groups: List[WallLayerGroup], indices: List[int],
+                           tolerance: float) -> List[int]:
+        """
+        Combines the WallLayerGroups of one line in a single sweep along it.
+        The walls are sorted by the start of their interval along the line (see WallLayerGroup.get_line_interval) and
+        each wall is only tried out with the walls before it that reach up to its start. Those are the only ones it
+        can touch, overlap or be above / below of, so they are usually just one or two.
+        Like combining every wall with every other one, the wall with the lowest index is the one that is kept.
+        :param wall_layer_groups: all WallLayerGroups
+        :param indices: indices of the WallLayerGroups on this line
+        :param tolerance: how far apart two intervals may be and still touch
+        :return: the indices of the WallLayerGroups that are left, the others have been combined into them
+        """
+        intervals = [(wall_layer_groups[i].get_line_interval(), i) for i in indices]
+        ret = [i for interval, i in intervals if interval is None]
+
+        # walls that may still be combined with the next ones, as (end of interval, index)
+        active: List[Tuple[float, int]] = []
+        for (start, end), i in sorted([(interval, i) for interval, i in intervals if interval is not None]):
+            ret.extend(a[1] for a in active if a[0] < start - tolerance)
+            active = [a for a in active if a[0] >= start - tolerance]
+            current = (end, i)
+            for other in sorted(active, key=lambda a: a[1]):
+                first, second = (other, current) if other[1] < current[1] else (current, other)
+                if wall_layer_groups[first[1]].combine(wall_layer_groups[second[1]]):
+                    active.remove(other)
+                    current = (max(first[0], second[0]), first[1])
+            active.append(current)
+        return ret + [a[1] for a in active]
+
+    def detail_wall(self, wall: WallLayerGroup, bond: Bond) -> BrickArray:
         """
         Fills a WallLayerGroup with bricks using the set bond
         :param wall: WallLayerGroup we wan to be filled
         :param bond: Bond we want to use
-        :return: List of brick objects
+        :return: BrickArray of all bricks in this wall
         """
-        brick_ret = []
-        original_rotation = wall.get_rotation()
-        module = wall.module
-
-        original_translation = wall.get_translation()
-        for layer in wall.get_sorted_layers(grouped=False):
-            dimensions = np.array([layer.length, wall.wall.width, module.height])
-
-            fill_left = len(layer.left_connections) == 0 or force_fill_holes
-            fill_right = len(layer.right_connections) == 0 or force_fill_holes
-
-            transformations = bond.apply_layer(length=layer.length,
-                                               width=wall.wall.width,
-                                               fill_left=fill_left,
-                                               fill_right=fill_right,
-                                               layer=layer.get_layer_plan_index(),
-                                               x_offset=layer.relative_x_offset(),
-                                               reversed=layer.parent.reversed)
-
-            for tf in transformations:
-                local_position = tf.get_position()  # position in wall itself (reference point is bottom left corner)
-                local_rotation = tf.get_rotation()  # rotation of the brick around itself
-
-                b = Brick(tf.module)
-                b.rotate(local_rotation)
-                # need to substract half of dimensions since its position coordinates are at its center
-                center = layer.translation.copy() - dimensions / 2.0
-                local_position += center
-                local_position[2] = center[2]# - module.height / 2.0
-                b.translate(local_position)
-                b.rotate_around(original_rotation)  # rotate to fit wall rotation
-                b.translate(original_translation)  # translate to wall
-                brick_ret.append(b)
-        return brick_ret
-
-    def detail_corner(self, corner: Corn, bond: Bond) -> List[Brick]:
+        return self.detail_walls([wall], bond)
+
+    def detail_walls(self, walls: List[WallLayerGroup], bond: Bond) -> BrickArray:
+        """
+        Fills many WallLayerGroups (using the same bond) with bricks at once.
+        The bond fills all layers in one go and the bricks are moved into wall and world space as array operations
+        :param walls: WallLayerGroups we want to be filled
+        :param bond: Bond we want to use
+        :return: BrickArray of all bricks in these walls
+        """
+        layers = [(i, layer) for i, wall in enumerate(walls) for layer in wall.get_sorted_layers(grouped=False)]
+        if len(layers) == 0:
+            return BrickArray()
+
+        wall_index = np.array([i for i, _ in layers], dtype=int)
+        lengths = np.array([layer.length for _, layer in layers])
+        widths = np.array([walls[i].wall.width for i, _ in layers])
+        heights = np.array([walls[i].module.height for i, _ in layers])
+        fill_left = [len(layer.left_connections) == 0 or force_fill_holes for _, layer in layers]
+        fill_right = [len(layer.right_connections) == 0 or force_fill_holes for _, layer in layers]
+
+        course = bond.apply_layers(lengths=lengths,
+                                   widths=widths,
+                                   fill_left=fill_left,
+                                   fill_right=fill_right,
+                                   layers=[layer.get_layer_plan_index() for _, layer in layers],
+                                   x_offsets=[layer.relative_x_offset() for _, layer in layers],
+                                   reversed=[layer.parent.reversed for _, layer in layers])
+        owners = course.owners
+        n = len(owners)
+        if n == 0:
+            return BrickArray()
+
+        # bottom left corner of each layer in wall coordinates
+        # need to substract half of dimensions since its position coordinates are at its center
+        corners = (np.array([layer.translation for _, layer in layers])
+                   - np.column_stack([lengths, widths, heights]) / 2.0)
+        local_positions = course.positions + corners[owners]
+        local_positions[:, 2] = corners[owners, 2]
+
+        # rotate each brick around its own center (see Brick.rotate)
+        dimensions = np.array([[m.length, m.width, m.height] for m in course.modules])[course.module_ids]
+        local_rotations = quaternion.from_euler_angles(course.rotations).reshape(-1)
+        before, after = np.zeros((n, 3)), np.zeros((n, 3))
+        pairs, inverse = np.unique(np.column_stack([course.module_ids, course.rotations]), axis=0, return_inverse=True)
+        for k, pair in enumerate(pairs):
+            module = course.modules[int(pair[0])]
+            before[inverse.reshape(-1) == k] = module.get_rotated_dimensions(np.quaternion(1, 0, 0, 0))
+            after[inverse.reshape(-1) == k] = module.get_rotated_dimensions(quaternion.from_euler_angles(*pair[1:]))
+        local_matrices = quaternion.as_rotation_matrix(local_rotations).reshape(-1, 3, 3)
+        local_positions += np.einsum('nij,nj->ni', local_matrices, -before / 2.0) + after / 2.0
+
+        # rotate to fit wall rotation and translate to wall
+        wall_rotations = np.array([w.get_rotation() for w in walls], dtype=np.quaternion)[wall_index[owners]]
+        wall_matrices = quaternion.as_rotation_matrix(wall_rotations).reshape(-1, 3, 3)
+        wall_translations = np.array([w.get_translation() for w in walls]).reshape(-1, 3)[wall_index[owners]]
+        positions = np.einsum('nij,nj->ni', wall_matrices, local_positions) + wall_translations
+        orientations = wall_rotations * local_rotations
+
+        matrices = quaternion.as_rotation_matrix(orientations).reshape(-1, 3, 3)
+        centers = positions + np.einsum('nij,nj->ni', matrices, dimensions / 2.0)
+        return BrickArray(centers=centers,
+                          orientations=quaternion.as_float_array(orientations).reshape(-1, 4),
+                          dimensions=dimensions,
+                          module_ids=course.module_ids,
+                          wall_ids=np.array([w.id for w in walls], dtype=int)[wall_index[owners]],
+                          courses=np.array([layer.get_layer_index() for _, layer in layers], dtype=int)[owners],
+                          modules=course.modules)
+
+    def detail_corner(self, corner: Corn, bond: Bond) -> BrickArray:
         """
         Fills a Corner with bricks using the given bond
         :param corner: Corner we want to be filled
         :param bond: Bond we want to use
-        :return: List of brick objects
+        :return: BrickArray of all bricks in this corner
         """
         brick_ret = []
 
@@ -206,13 +298,43 @@ class WallDetailer:
             b.rotate_around(original_rotation)
             brick_ret.append(b)
 
-        return brick_ret
+        return BrickArray.from_bricks(brick_ret, wall_id=main_layer.parent.id, course=corner.get_corner_index())
+
+    @staticmethod
+    def corner_key(corner: Corn, bond: Bond) -> tuple:
+        """
+        :param corner: Corner between two walls
+        :param bond: Bond the corner is filled with
+        :return: the same key for all corners whose bricks only differ in their height (see shift_corner)
+        """
+        main_layer = corner.get_main_layer()
+        return (main_layer.parent.id, tuple(sorted(layer.parent.id for layer in corner.layers)),
+                tuple(np.round(corner.point[:2], 6)),
+                tuple(np.round(quaternion.as_float_array(corner.get_rotation()), 6)),
+                corner.plan_offset % bond.get_corner_plan_repeat_step())
+
+    @staticmethod
+    def shift_corner(bricks: BrickArray, corner: Corn, dz: float) -> BrickArray:
+        """
+        Moves the bricks of a corner up to another corner with the same walls, position and corner plan
+        :param bricks: BrickArray of the corner below (see detail_corner)
+        :param corner: the corner the bricks are for
+        :param dz: height difference between both corners
+        :return: BrickArray of all bricks in given corner
+        """
+        return BrickArray(centers=bricks.centers + np.array([0.0, 0.0, dz]),
+                          orientations=bricks.orientations,
+                          dimensions=bricks.dimensions,
+                          module_ids=bricks.module_ids,
+                          wall_ids=bricks.wall_ids,
+                          courses=np.full(len(bricks), corner.get_corner_index(), dtype=int),
+                          modules=bricks.modules)
 
     @staticmethod
     def convert_to_stl(bricks: [Brick], path: str, detail: float = 0.1, additional_shapes: List = []):
         import os
         file_path = os.path.abspath(path)
-        bricks_copy = bricks.copy()
+        bricks_copy = list(bricks)  # works for lists of bricks and BrickArrays
 
         if len(bricks_copy) + len(additional_shapes) > 0:
             args = TopTools.TopTools_ListOfShape()  # whatever
@@ -268,6 +390,7 @@ export_base_stl = True  # tip: to look at stl files either use blender or the wi
 export_openings_stl = True
 export_solution_json = True
 export_solution_stl = True
+solution_cache = None  # e.g. output_dir + "solutions.jsonl" to reuse solutions of unchanged models
 
 output_dir = "output/"
 #############################################
@@ -317,7 +440,8 @@ if __name__ == "__main__":
     if export_openings_stl:
         WallDetailer.convert_to_stl([], path=output_dir + "openings.stl", additional_shapes=[o.get_shape() for w in scenario.walls for o in w.openings])
 
-    wall_detailer = WallDetailer(scenario.walls)
+    wall_detailer = WallDetailer(scenario.walls,
+                                 cache=SolutionCache(solution_cache) if solution_cache is not None else None)
     bb = wall_detailer.detail()
 
     if export_solution_stl: